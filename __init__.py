@@ -8,8 +8,14 @@ bl_info = {
     "category": "Animation",
 }
 
+import time
+import_start = time.perf_counter()
+
 import bpy
-from . import operators, panels, utils, keymaps, handlers, exporter
+from . import operators, panels, utils, keymaps, handlers
+
+# Time the add-on took to import and register, in seconds
+enable_seconds = 0.0
 
 class BizarreAnimUtils(bpy.types.AddonPreferences):
     bl_idname = __package__
@@ -37,19 +43,92 @@ class BizarreAnimUtils(bpy.types.AddonPreferences):
         default='1ST_PERSON'
     )
 
+    export_clips: bpy.props.EnumProperty(
+        name="Export Clips",
+        description="How the timeline of the exported action is split into files",
+        items=[
+            ('SINGLE', "Whole Action", "Export the whole action as one file"),
+            ('MARKERS', "Marker Groups", "Bake the action once and export every 'Group: Start'/'Group: Stop' marker range as its own file")
+        ],
+        default='SINGLE'
+    )
+
+    export_key_rate: bpy.props.FloatProperty(
+        name="Export Key Rate",
+        description="Keys per second the baked animation is resampled to before decimation. 0 keeps one key per frame",
+        default=0.0,
+        min=0.0
+    )
+
+    export_time_scale: bpy.props.FloatProperty(
+        name="Export Time Scale",
+        description="Stretch (above 1) or compress (below 1) the exported animation in time",
+        default=1.0,
+        min=0.01
+    )
+
+    beast_targets: bpy.props.StringProperty(
+        name="Beast Skeletons",
+        description="Comma-separated beast skeletons Transfer to Beasts retargets to, as 'Prefix' or 'Prefix=Label'. Prefix names the '<Prefix> Armature', '<Prefix> Retarget Driver Armature' and '<Prefix> Default Stance' in the reference file, Label goes into the baked action's name",
+        default="Khajiit=Beast"
+    )
+
+    bake_workers: bpy.props.IntProperty(
+        name="Background Bake Workers",
+        description="Number of background Blender processes a long bake is split across. 0 or 1 bakes inside this Blender",
+        default=0,
+        min=0,
+        max=64
+    )
+
+    sample_library_folder: bpy.props.StringProperty(
+        name="Sample Library Folder",
+        description="Folder where baked animation samples are stored and reused across files and sessions. Leave empty to always bake",
+        default="",
+        subtype='DIR_PATH'
+    )
+
+    autopose_solver: bpy.props.EnumProperty(
+        name="Autopose Solver",
+        description="How autoposing bones follow the IK controllers during a drag",
+        items=[
+            ('CONSTRAINTS', "Reference Constraints", "Copy the reference armature's constraints onto the rig while dragging"),
+            ('WEIGHTS', "Precomputed Weights", "Compute autopose rotations directly from weights measured once from the reference armature")
+        ],
+        default='CONSTRAINTS'
+    )
+
     def draw(self, context):
         layout = self.layout
         layout.prop(self, "export_folder")
         layout.prop(self, "retained_extra_bones")
         layout.prop(self, "export_as")  # Add the dropdown to the preferences UI
+        layout.prop(self, "export_clips")
+        layout.prop(self, "export_key_rate")
+        layout.prop(self, "export_time_scale")
+        layout.prop(self, "sample_library_folder")
+        layout.prop(self, "bake_workers")
+        layout.prop(self, "beast_targets")
+        layout.prop(self, "autopose_solver")
+
+        updates, seconds_per_update = handlers.get_update_overhead()
+        column = layout.column(align=True)
+        column.label(text=f"Enabled in {enable_seconds * 1000.0:.1f} ms", icon="INFO")
+        column.label(text=f"Viewport updates handled: {updates}, {seconds_per_update * 1000000.0:.1f} µs per update on average")
 
 def register():
+    global enable_seconds
+    start = time.perf_counter()
+    import_seconds = start - import_start
+
     operators.register()
     panels.register()
     keymaps.register()
     handlers.register()
     bpy.utils.register_class(BizarreAnimUtils)
 
+    enable_seconds = import_seconds + time.perf_counter() - start
+
 
 def unregister():
     # Unregister handlers, panels, operators, and keymaps first
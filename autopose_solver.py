@@ -0,0 +1,188 @@
+import bpy
+import numpy as np
+from .utils import (
+    all_autopose_bones, transformable_autopose_bones, ik_target_to_autopose_map,
+    get_rest_geometry_key, get_rest_pose_cache, read_pose_matrices, solve_visual_rotations,
+    fetch_constraints_from_reference, apply_quaternion_from_reference
+)
+from .core import quaternion_multiply, quaternion_conjugate, quaternion_to_rotation_vector, rotation_vector_to_quaternion
+
+# Constraint-free autopose.
+# The reference armature's constraint network is linearized once per skeleton, around the reference armature's
+# pose: every IK target is nudged along each axis and the resulting autopose rotations are measured. During a drag the autopose rotations
+# are then computed directly from the IK target positions, with no constraints added to the rig.
+
+# Precomputed weights per reference armature and rest geometry of the rig, see calibrate_autopose_weights
+autopose_weights = {}
+
+# Target positions and bone rotations at the start of the current drag, per armature
+drag_start_states = {}
+
+# IK target positions are measured in the space of this bone, or of its first parent that isn't autoposed,
+# so the weights keep working when the whole rig moves (locomotion clips move the root and pelvis)
+ANCHOR_BONE = "Bip01 Pelvis"
+
+# Pose channels copied from the reference armature while calibrating
+pose_channels = (("location", 3), ("rotation_quaternion", 4), ("rotation_euler", 3), ("scale", 3))
+
+def get_anchor_index(armature):
+    """Return the pose.bones index of the bone IK target positions are measured relative to, None for armature space."""
+    anchor = armature.pose.bones.get(ANCHOR_BONE)
+    while anchor and anchor.name in all_autopose_bones:
+        anchor = anchor.parent
+    return get_rest_pose_cache(armature)["index"][anchor.name] if anchor else None
+
+def get_target_positions(pose, target_indices, anchor_index):
+    """Return IK target positions from (N, 4, 4) pose matrices, in the space of the anchor bone."""
+    positions = pose[target_indices, :3, 3]
+    if anchor_index is None:
+        return positions
+    anchor = np.linalg.inv(pose[anchor_index])
+    return positions @ anchor[:3, :3].T + anchor[:3, 3]
+
+def measure_autopose(armature, bone_names, target_indices, anchor_index):
+    """Evaluate the rig and return the IK target positions and autopose bone rotations."""
+    bpy.context.view_layer.update()
+    positions = get_target_positions(read_pose_matrices(armature), target_indices, anchor_index)
+    rotations = solve_visual_rotations(armature, bone_names)[1]
+    return positions, rotations
+
+def calibrate_autopose_weights(armature, reference_armature, delta=0.05):
+    """Measure how autopose rotations respond to IK target movement and store the weights for the skeleton.
+
+    The rig is put in the reference armature's pose, so the result doesn't depend on the pose it had.
+    Each IK target is moved by delta along every axis with the reference constraints applied, and a
+    least squares fit maps target displacements to autopose rotation vectors. The rig is restored afterwards."""
+    pose_bones = armature.pose.bones
+    reference_bones = reference_armature.pose.bones
+    bone_names = [name for name in all_autopose_bones if name in pose_bones]
+    target_names = [name for name in ik_target_to_autopose_map if name in pose_bones]
+    index = get_rest_pose_cache(armature)["index"]
+    target_indices = np.array([index[name] for name in target_names], dtype=np.int64)
+    anchor_index = get_anchor_index(armature)
+
+    saved_pose = {}
+    for property_name, size in pose_channels:
+        values = np.empty(len(pose_bones) * size, dtype=np.float32)
+        pose_bones.foreach_get(property_name, values)
+        saved_pose[property_name] = values
+
+    try:
+        for pose_bone in pose_bones:
+            reference_bone = reference_bones.get(pose_bone.name)
+            if reference_bone:
+                for property_name, _ in pose_channels:
+                    setattr(pose_bone, property_name, getattr(reference_bone, property_name))
+        reference_locations = {name: pose_bones[name].location.copy() for name in target_names}
+
+        for name in bone_names:
+            fetch_constraints_from_reference(reference_armature, armature, name)
+            apply_quaternion_from_reference(reference_armature, armature, name)
+        base_positions, base_rotations = measure_autopose(armature, bone_names, target_indices, anchor_index)
+
+        displacements = []
+        responses = []
+        for name in target_names:
+            for axis in range(3):
+                pose_bones[name].location[axis] += delta
+                positions, rotations = measure_autopose(armature, bone_names, target_indices, anchor_index)
+                pose_bones[name].location[axis] = reference_locations[name][axis]
+
+                displacements.append((positions - base_positions).ravel())
+                responses.append(quaternion_to_rotation_vector(quaternion_multiply(quaternion_conjugate(base_rotations), rotations)).ravel())
+    finally:
+        for name in bone_names:
+            bone = pose_bones[name]
+            while bone.constraints:
+                bone.constraints.remove(bone.constraints[0])
+        for property_name, values in saved_pose.items():
+            pose_bones.foreach_set(property_name, values)
+        armature.update_tag()
+        bpy.context.view_layer.update()
+
+    weights = np.linalg.lstsq(np.array(displacements), np.array(responses), rcond=None)[0]
+    weights = weights.reshape(len(target_names), 3, len(bone_names), 3)
+
+    # Bones only follow the IK targets they are mapped to, drop the fitting noise of the others
+    for t, target_name in enumerate(target_names):
+        for b, bone_name in enumerate(bone_names):
+            if bone_name not in ik_target_to_autopose_map[target_name]:
+                weights[t, :, b, :] = 0.0
+
+    data = {
+        "bones": bone_names,
+        "targets": target_names,
+        "target_indices": target_indices,
+        "anchor": anchor_index,
+        "base_positions": base_positions,
+        "base_rotations": base_rotations,
+        "weights": weights.reshape(len(target_names) * 3, len(bone_names) * 3),
+    }
+    autopose_weights[(reference_armature.name, get_rest_geometry_key(armature))] = data
+    return data
+
+def get_autopose_weights(armature, reference_armature):
+    """Return the precomputed autopose weights of the armature's skeleton, calibrating them on first use.
+
+    Calibration evaluates the rig many times, don't call this from a depsgraph handler."""
+    data = autopose_weights.get((reference_armature.name, get_rest_geometry_key(armature)))
+    if data is None:
+        data = calibrate_autopose_weights(armature, reference_armature)
+    return data
+
+def begin_autopose_drag(armature, reference_armature):
+    """Remember the state the transformable autopose bones are solved relative to during this drag.
+
+    Returns False if the rig's weights haven't been calibrated yet, see get_autopose_weights."""
+    data = autopose_weights.get((reference_armature.name, get_rest_geometry_key(armature)))
+    if data is None:
+        return False
+    pose = read_pose_matrices(armature)
+    drag_start_states[armature] = {
+        "weights": data,
+        "positions": get_target_positions(pose, data["target_indices"], data["anchor"]),
+        "rotations": np.array([armature.pose.bones[name].rotation_quaternion for name in data["bones"]], dtype=np.float64),
+    }
+    return True
+
+def end_autopose_drag(armature):
+    drag_start_states.pop(armature, None)
+
+def solve_autopose(armature, bone_names):
+    """Compute autopose rotations of the named bones directly from the current IK target positions.
+
+    Bones that can't be transformed by hand follow the calibrated pose, transformable ones keep their own
+    rotation from the start of the drag and only receive the change caused by the IK targets.
+    Returns True if any rotation was changed."""
+    start = drag_start_states.get(armature)
+    if start is None:
+        return False
+    data = start["weights"]
+
+    cache = get_rest_pose_cache(armature)
+    positions = get_target_positions(read_pose_matrices(armature), data["target_indices"], data["anchor"])
+    rotation_vectors = ((positions - data["base_positions"]).ravel() @ data["weights"]).reshape(-1, 3)
+    drag_rotation_vectors = ((positions - start["positions"]).ravel() @ data["weights"]).reshape(-1, 3)
+
+    solved = quaternion_multiply(data["base_rotations"], rotation_vector_to_quaternion(rotation_vectors))
+    transformable = np.array([name in transformable_autopose_bones for name in data["bones"]])
+    solved[transformable] = quaternion_multiply(start["rotations"], rotation_vector_to_quaternion(drag_rotation_vectors))[transformable]
+
+    pose_bones = armature.pose.bones
+    current = np.empty(len(pose_bones) * 4, dtype=np.float32)
+    pose_bones.foreach_get("rotation_quaternion", current)
+    current = current.reshape(-1, 4)
+
+    wanted = [i for i, name in enumerate(data["bones"]) if name in bone_names]
+    indices = np.array([cache["index"][data["bones"][i]] for i in wanted], dtype=np.int64)
+    solved = solved[wanted]
+    solved *= np.where(np.sum(current[indices] * solved, axis=-1, keepdims=True) < 0.0, -1.0, 1.0)
+
+    # Writing unchanged values would trigger another depsgraph update, and this handler again
+    if not len(indices) or np.abs(current[indices] - solved).max() < 1e-6:
+        return False
+
+    current[indices] = solved
+    pose_bones.foreach_set("rotation_quaternion", current.ravel())
+    armature.update_tag()
+    return True
@@ -0,0 +1,67 @@
+# Background worker baking one frame range of an action, started by exporter.bake_sharded_stages.
+# Loads the add-on from this folder, bakes the range with exporter.bake_frame_range and stores the samples
+# in a sample library folder, where the exporter picks them up and merges the shards.
+# The exporter adds --enable-autoexec unless script auto-execution was blocked for the file, so Python drivers
+# evaluate like they do in the session that started the worker.
+#
+# Run with:
+#   blender --background --factory-startup scene.blend --python bake_worker.py -- --object Rig --action "[Baked][Temp] Walk" --start 0 --end 49 --output /tmp/shards --key shard_0
+
+import argparse
+import importlib
+import importlib.util
+import json
+import os
+import sys
+
+import bpy
+
+ADDON_PATH = os.path.dirname(os.path.abspath(__file__))
+ADDON_NAME = "bizarre_anim_utils_worker"
+
+def parse_arguments():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(prog="bake_worker")
+    parser.add_argument("--object", required=True)
+    parser.add_argument("--action", required=True)
+    parser.add_argument("--start", type=int, required=True)
+    parser.add_argument("--end", type=int, required=True)
+    parser.add_argument("--bones", default="", help="JSON file with the names of the bones to bake, all bones if empty")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--key", required=True)
+    return parser.parse_args(argv)
+
+def import_addon():
+    """Import the add-on package from this folder without installing it."""
+    spec = importlib.util.spec_from_file_location(ADDON_NAME, os.path.join(ADDON_PATH, "__init__.py"), submodule_search_locations=[ADDON_PATH])
+    addon = importlib.util.module_from_spec(spec)
+    sys.modules[ADDON_NAME] = addon
+    spec.loader.exec_module(addon)
+    return addon
+
+def main():
+    arguments = parse_arguments()
+    import_addon()
+    exporter = importlib.import_module(f"{ADDON_NAME}.exporter")
+
+    obj = bpy.data.objects[arguments.object]
+    action = bpy.data.actions[arguments.action]
+    obj.animation_data.action = action
+
+    if bpy.context.object and bpy.context.object.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+    for other in bpy.context.view_layer.objects:
+        other.select_set(False)
+    bpy.context.view_layer.objects.active = obj
+    obj.select_set(True)
+
+    bone_names = None
+    if arguments.bones:
+        with open(arguments.bones) as file:
+            bone_names = set(json.load(file))
+
+    channels, times, values = exporter.bake_frame_range(obj, action, arguments.start, arguments.end, bone_names)
+    exporter.sample_library.save_samples(arguments.output, arguments.key, channels, times, values)
+
+if __name__ == "__main__":
+    main()
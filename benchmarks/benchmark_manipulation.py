@@ -0,0 +1,184 @@
+# Headless benchmark of the manipulation handler (check_manipulation).
+# Builds rigs shaped like the one in BizarreMorrowindRig.blend, simulates drags of their IK controllers and
+# reports how long the handler takes on drag start, on every update during the drag and on drag release.
+#
+# Run with:
+#   blender --background --factory-startup --python benchmarks/benchmark_manipulation.py -- --copies 4 --ghosts 16
+#
+# Arguments after "--":
+#   --copies N     number of rig copies in the scene (default 1)
+#   --dragged N    number of copies dragged at once (default 1)
+#   --chains N     number of IK limbs per rig, 1-4 (default 4)
+#   --ghosts N     number of ghost bones per rig (default 8)
+#   --cycles N     number of drag cycles (default 20)
+#   --updates N    depsgraph updates per drag (default 30)
+#   --solver S     CONSTRAINTS or WEIGHTS autopose (default CONSTRAINTS)
+
+import argparse
+import importlib.util
+import os
+import sys
+import time
+
+import bpy
+import numpy as np
+
+ADDON_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADDON_NAME = "bizarre_anim_utils"
+
+LIMBS = [
+    # (upper bone, IK bone, leaf bone, IK target, head, elbow, tip)
+    ("Bip01 UpperArm.L", "Bip01 Forearm.L", "Bip01 Hand.L", "Bip01 Arm IK Target.L", (0.2, 0.0, 1.4), (0.45, 0.02, 1.4), (0.7, 0.0, 1.4)),
+    ("Bip01 UpperArm.R", "Bip01 Forearm.R", "Bip01 Hand.R", "Bip01 Arm IK Target.R", (-0.2, 0.0, 1.4), (-0.45, 0.02, 1.4), (-0.7, 0.0, 1.4)),
+    ("Bip01 Thigh.L", "Bip01 Calf.L", "Bip01 Foot.L", "Bip01 Leg IK Target.L", (0.1, 0.0, 0.9), (0.1, -0.03, 0.5), (0.1, 0.0, 0.1)),
+    ("Bip01 Thigh.R", "Bip01 Calf.R", "Bip01 Foot.R", "Bip01 Leg IK Target.R", (-0.1, 0.0, 0.9), (-0.1, -0.03, 0.5), (-0.1, 0.0, 0.1)),
+]
+
+def parse_arguments():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(prog="benchmark_manipulation")
+    parser.add_argument("--copies", type=int, default=1)
+    parser.add_argument("--dragged", type=int, default=1)
+    parser.add_argument("--chains", type=int, default=4, choices=range(1, 5))
+    parser.add_argument("--ghosts", type=int, default=8)
+    parser.add_argument("--cycles", type=int, default=20)
+    parser.add_argument("--updates", type=int, default=30)
+    parser.add_argument("--solver", default='CONSTRAINTS', choices=['CONSTRAINTS', 'WEIGHTS'])
+    return parser.parse_args(argv)
+
+def import_addon():
+    """Import the add-on package from this checkout without installing it."""
+    spec = importlib.util.spec_from_file_location(ADDON_NAME, os.path.join(ADDON_PATH, "__init__.py"), submodule_search_locations=[ADDON_PATH])
+    addon = importlib.util.module_from_spec(spec)
+    sys.modules[ADDON_NAME] = addon
+    spec.loader.exec_module(addon)
+    return addon
+
+def build_rig(name, chains, ghosts, with_constraints=True):
+    """Create an armature with the bone names and constraint layout of the Bizarre rig."""
+    data = bpy.data.armatures.new(name)
+    rig = bpy.data.objects.new(name, data)
+    bpy.context.scene.collection.objects.link(rig)
+    bpy.context.view_layer.objects.active = rig
+    bpy.ops.object.mode_set(mode='EDIT')
+
+    def add_bone(bone_name, head, tail, parent=None):
+        bone = data.edit_bones.new(bone_name)
+        bone.head, bone.tail = head, tail
+        bone.parent = data.edit_bones.get(parent) if parent else None
+        bone.use_connect = False
+        return bone
+
+    add_bone("Bip01", (0, 0, 0), (0, 0.1, 0))
+    add_bone("Bip01 Bizarre Bone", (0, 0, 0), (0, 0, 0.1), "Bip01")
+    add_bone("Bip01 Pelvis", (0, 0, 0.9), (0, 0, 1.0), "Bip01")
+    add_bone("Bip01 Spine1", (0, 0, 1.0), (0, 0, 1.15), "Bip01 Pelvis")
+    add_bone("Bip01 Spine2", (0, 0, 1.15), (0, 0, 1.35), "Bip01 Spine1")
+    add_bone("Bip01 Clavicle.L", (0, 0, 1.35), (0.2, 0, 1.4), "Bip01 Spine2")
+    add_bone("Bip01 Clavicle.R", (0, 0, 1.35), (-0.2, 0, 1.4), "Bip01 Spine2")
+
+    parents = {"Bip01 UpperArm.L": "Bip01 Clavicle.L", "Bip01 UpperArm.R": "Bip01 Clavicle.R",
+               "Bip01 Thigh.L": "Bip01 Pelvis", "Bip01 Thigh.R": "Bip01 Pelvis"}
+    for upper, lower, leaf, target, head, elbow, tip in LIMBS[:chains]:
+        add_bone(upper, head, elbow, parents[upper])
+        add_bone(lower, elbow, tip, upper)
+        add_bone(leaf, tip, (tip[0], tip[1] - 0.1, tip[2]), lower)
+        add_bone(target, tip, (tip[0], tip[1] - 0.15, tip[2]), "Bip01")
+
+    bone_names = [bone.name for bone in data.edit_bones]
+    for i in range(ghosts):
+        followed = data.edit_bones[bone_names[i % len(bone_names)]]
+        add_bone(f"[Ghost] {followed.name}", followed.head, followed.tail, "Bip01")
+
+    bpy.ops.object.mode_set(mode='POSE')
+    for pose_bone in rig.pose.bones:
+        pose_bone.rotation_mode = 'QUATERNION'
+
+    if with_constraints:
+        for upper, lower, leaf, target, *_ in LIMBS[:chains]:
+            ik = rig.pose.bones[lower].constraints.new('IK')
+            ik.name = "IK"
+            ik.target, ik.subtarget, ik.chain_count = rig, target, 2
+            copy_rotation = rig.pose.bones[leaf].constraints.new('COPY_ROTATION')
+            copy_rotation.target, copy_rotation.subtarget = rig, target
+        for pose_bone in rig.pose.bones:
+            if pose_bone.name.startswith("[Ghost] "):
+                child_of = pose_bone.constraints.new('CHILD_OF')
+                child_of.target, child_of.subtarget = rig, pose_bone.name.replace("[Ghost] ", "")
+
+    bpy.ops.object.mode_set(mode='OBJECT')
+    return rig
+
+def build_reference_armature(chains):
+    """Create the 'Autopose Reference Armature' with simple autopose constraints."""
+    reference = build_rig("Autopose Reference Armature", chains, 0, with_constraints=False)
+    targets = [limb[3] for limb in LIMBS[:chains]]
+    for bone_name in ("Bip01 Spine1", "Bip01 Spine2", "Bip01 Clavicle.L", "Bip01 Clavicle.R", "Bip01 Pelvis"):
+        for target in targets:
+            track = reference.pose.bones[bone_name].constraints.new('DAMPED_TRACK')
+            track.target, track.subtarget, track.influence = reference, target, 0.1
+    return reference
+
+def percentiles(samples):
+    values = np.array(samples) * 1000.0
+    if not len(values):
+        return "no samples"
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return f"n={len(values):5d}  p50={p50:8.3f} ms  p90={p90:8.3f} ms  p99={p99:8.3f} ms  max={values.max():8.3f} ms"
+
+def main():
+    arguments = parse_arguments()
+    addon = import_addon()
+    handlers = addon.handlers
+    addon.panels.register_bone_properties()
+
+    addon_preferences = type("Preferences", (), {"autopose_solver": arguments.solver})()
+    handlers.use_precomputed_autopose = lambda: addon_preferences.autopose_solver == 'WEIGHTS'
+
+    build_reference_armature(arguments.chains)
+    rigs = [build_rig(f"Bizarre Rig {i}", arguments.chains, arguments.ghosts) for i in range(arguments.copies)]
+    dragged_rigs = rigs[:arguments.dragged]
+    for rig in rigs:
+        for limb in LIMBS[:arguments.chains]:
+            rig.data.bones[limb[3]].mode = 'MIXED_KINEMATICS'
+    dragged_target = LIMBS[0][3]
+    # The add-on calibrates precomputed autopose from a timer after loading a file, do it up front here
+    for rig in rigs:
+        handlers.calibrate_autopose(rig)
+
+    # Replace the window manager based detection with the simulated drag state
+    drag = {"active": False}
+    handlers.is_transform_active = lambda wm: drag["active"]
+    handlers.get_manipulated_rigs = lambda context: (
+        {rig: [rig.pose.bones[dragged_target]] for rig in dragged_rigs} if drag["active"] else {}
+    )
+
+    scene = bpy.context.scene
+    timings = {"start": [], "drag": [], "release": [], "idle": []}
+
+    def update(phase):
+        bpy.context.view_layer.update()
+        start = time.perf_counter()
+        handlers.check_manipulation(scene, bpy.context.evaluated_depsgraph_get())
+        timings[phase].append(time.perf_counter() - start)
+
+    for cycle in range(arguments.cycles):
+        drag["active"] = True
+        update("start")
+        for step in range(arguments.updates):
+            offset = 0.1 * np.sin((cycle * arguments.updates + step) * 0.1)
+            for rig in dragged_rigs:
+                rig.pose.bones[dragged_target].location = (offset, offset * 0.5, -offset)
+            update("drag")
+        drag["active"] = False
+        update("release")
+        for _ in range(arguments.updates):
+            update("idle")
+
+    print(f"check_manipulation: {arguments.copies} rig(s), {arguments.dragged} dragged, {arguments.chains} chain(s), "
+          f"{arguments.ghosts} ghost bone(s), {arguments.solver} autopose")
+    for phase, samples in timings.items():
+        print(f"  {phase:8s} {percentiles(samples)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# Headless check of the analytic IK solver (ik_solver.solve_chain_rotations) against the rig's IK constraints.
+# Builds a rig shaped like the one in BizarreMorrowindRig.blend, keys its IK targets, poles and chain parents,
+# then compares the FK inputs read from the fcurves with the evaluated pose and the analytic limb rotations
+# with the rotations the IK constraints produce.
+#
+# Run with:
+#   blender --background --factory-startup --python benchmarks/check_ik_solver.py -- --frames 50
+#
+# Arguments after "--":
+#   --frames N     number of keyed frames (default 50)
+#   --chains N     number of IK limbs, 1-4 (default 4)
+#   --poles        add pole targets to the IK constraints
+#   --seed N       random seed of the keyed poses (default 0)
+
+import argparse
+import os
+import sys
+
+import bpy
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from benchmark_manipulation import LIMBS, build_rig, import_addon
+
+def parse_arguments():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(prog="check_ik_solver")
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--chains", type=int, default=4, choices=range(1, 5))
+    parser.add_argument("--poles", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+def add_poles(rig, chains):
+    """Add a pole bone in front of every limb and use it as the pole target of the IK constraint."""
+    bpy.context.view_layer.objects.active = rig
+    bpy.ops.object.mode_set(mode='EDIT')
+    for upper, lower, leaf, target, head, elbow, tip in LIMBS[:chains]:
+        bone = rig.data.edit_bones.new(f"{lower} Pole")
+        bone.head = (elbow[0], elbow[1] - 0.5, elbow[2])
+        bone.tail = (elbow[0], elbow[1] - 0.6, elbow[2])
+        bone.parent = rig.data.edit_bones["Bip01"]
+    bpy.ops.object.mode_set(mode='POSE')
+    for upper, lower, *_ in LIMBS[:chains]:
+        rig.pose.bones[f"{lower} Pole"].rotation_mode = 'QUATERNION'
+        ik = rig.pose.bones[lower].constraints["IK"]
+        ik.pole_target, ik.pole_subtarget, ik.pole_angle = rig, f"{lower} Pole", np.pi / 2
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+def key_random_poses(rig, chains, frames, poles, rng):
+    """Key the chain parents, IK targets and poles with random poses, mixing rotation modes on the parents."""
+    parents = {"Bip01 Clavicle.L", "Bip01 Clavicle.R", "Bip01 Pelvis", "Bip01 Spine1", "Bip01 Spine2"}
+    rig.pose.bones["Bip01 Spine1"].rotation_mode = 'XYZ'
+    rig.pose.bones["Bip01 Spine2"].rotation_mode = 'ZXY'
+    for frame in frames:
+        for name in parents:
+            pose_bone = rig.pose.bones[name]
+            if pose_bone.rotation_mode == 'QUATERNION':
+                quat = np.concatenate([[1.0], rng.normal(0.0, 0.15, 3)])
+                pose_bone.rotation_quaternion = quat / np.linalg.norm(quat)
+                pose_bone.keyframe_insert("rotation_quaternion", frame=frame)
+            else:
+                pose_bone.rotation_euler = rng.normal(0.0, 0.15, 3)
+                pose_bone.keyframe_insert("rotation_euler", frame=frame)
+        for upper, lower, leaf, target, *_ in LIMBS[:chains]:
+            pose_bone = rig.pose.bones[target]
+            pose_bone.location = rng.normal(0.0, 0.1, 3)
+            quat = np.concatenate([[1.0], rng.normal(0.0, 0.3, 3)])
+            pose_bone.rotation_quaternion = quat / np.linalg.norm(quat)
+            pose_bone.keyframe_insert("location", frame=frame)
+            pose_bone.keyframe_insert("rotation_quaternion", frame=frame)
+            if poles:
+                pose_bone = rig.pose.bones[f"{lower} Pole"]
+                pose_bone.location = rng.normal(0.0, 0.1, 3)
+                pose_bone.keyframe_insert("location", frame=frame)
+
+def quaternion_angles(a, b):
+    """Angles in degrees between two arrays of quaternions."""
+    dots = np.abs(np.sum(a * b, axis=-1)) / (np.linalg.norm(a, axis=-1) * np.linalg.norm(b, axis=-1))
+    return np.degrees(2.0 * np.arccos(np.clip(dots, -1.0, 1.0)))
+
+def main():
+    arguments = parse_arguments()
+    addon = import_addon()
+    utils = addon.utils
+    ik_solver = addon.ik_solver
+    addon.panels.register_bone_properties()
+
+    rig = build_rig("Bizarre Rig", arguments.chains, 0)
+    if arguments.poles:
+        add_poles(rig, arguments.chains)
+    for limb in LIMBS[:arguments.chains]:
+        rig.data.bones[limb[3]].mode = 'MIXED_KINEMATICS'
+
+    rng = np.random.default_rng(arguments.seed)
+    frames = np.arange(arguments.frames, dtype=np.float64) * 2.0
+    key_random_poses(rig, arguments.chains, frames, arguments.poles, rng)
+    # Check between the keys too, where the fcurves interpolate
+    frames = np.concatenate([frames, frames[:-1] + 0.5])
+
+    utils.build_ik_map(rig)
+    chains = list(utils.ik_maps[rig].values())
+    input_bones = ik_solver.get_chain_input_bones(rig, chains)
+
+    input_pose = utils.sample_fk_pose_matrices(rig, input_bones, frames)
+    solved = ik_solver.solve_chain_rotations(rig, chains, input_pose)
+    bone_names = list(solved)
+    analytic = np.stack([solved[name] for name in bone_names], axis=1)
+
+    evaluated_pose = utils.sample_pose_matrices(rig, frames)
+    constraint = utils.bake_chain_rotations(rig, bone_names, frames)
+
+    index = utils.get_rest_pose_cache(rig)["index"]
+    indices = [index[name] for name in input_bones]
+    input_error = np.abs(input_pose[:, indices] - evaluated_pose[:, indices]).max()
+    angles = quaternion_angles(analytic, constraint)
+
+    print(f"check_ik_solver: {arguments.chains} chain(s), {len(frames)} frame(s), poles {'on' if arguments.poles else 'off'}")
+    print(f"  FK inputs from fcurves vs. evaluated pose: max abs error {input_error:.2e}")
+    for i, name in enumerate(bone_names):
+        print(f"  {name:24s} analytic vs. constraint: max {angles[:, i].max():8.4f} deg  mean {angles[:, i].mean():8.4f} deg")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+# Animation math of the add-on, working on plain NumPy arrays.
+# This module doesn't import bpy, so it can be used outside of Blender (build pipelines, tests, profiling)
+# by adding the add-on folder to sys.path and importing core. The Blender side (utils, ik_solver,
+# autopose_solver, exporter) reads data from the scene, calls into this module and writes the results back.
+#
+# Conventions:
+#   - Quaternions are WXYZ, in the last axis of (..., 4) arrays.
+#   - Matrices are row-major (..., 4, 4) arrays, as mathutils matrices converted with np.array.
+#   - Animation data is laid out as (frames, bones, channels).
+#   - Bones are referenced by index; parents are index arrays with -1 for root bones.
+
+import numpy as np
+
+# Quaternions
+
+def matrices_to_quaternions(matrices):
+    """Convert an (..., 4, 4) or (..., 3, 3) array of matrices into (..., 4) WXYZ quaternions, ignoring scale."""
+    m = np.asarray(matrices, dtype=np.float64)[..., :3, :3]
+    m = m / np.linalg.norm(m, axis=-2, keepdims=True)
+
+    m00, m01, m02 = m[..., 0, 0], m[..., 0, 1], m[..., 0, 2]
+    m10, m11, m12 = m[..., 1, 0], m[..., 1, 1], m[..., 1, 2]
+    m20, m21, m22 = m[..., 2, 0], m[..., 2, 1], m[..., 2, 2]
+
+    # Shepperd's method, pick the numerically stable branch per matrix
+    candidates = np.stack([
+        np.stack([1.0 + m00 + m11 + m22, m21 - m12, m02 - m20, m10 - m01], axis=-1),
+        np.stack([m21 - m12, 1.0 + m00 - m11 - m22, m01 + m10, m02 + m20], axis=-1),
+        np.stack([m02 - m20, m01 + m10, 1.0 - m00 + m11 - m22, m12 + m21], axis=-1),
+        np.stack([m10 - m01, m02 + m20, m12 + m21, 1.0 - m00 - m11 + m22], axis=-1),
+    ], axis=-2)
+    diagonal = np.stack([m00 + m11 + m22, m00, m11, m22], axis=-1)
+    branch = np.argmax(diagonal, axis=-1)
+
+    quats = np.take_along_axis(candidates, branch[..., None, None], axis=-2)[..., 0, :]
+    quats /= np.linalg.norm(quats, axis=-1, keepdims=True)
+    # Keep W positive, same as mathutils
+    quats *= np.where(quats[..., :1] < 0.0, -1.0, 1.0)
+    return quats
+
+def quaternion_multiply(a, b):
+    """Hamilton product of (..., 4) WXYZ quaternion arrays."""
+    aw, ax, ay, az = np.moveaxis(a, -1, 0)
+    bw, bx, by, bz = np.moveaxis(b, -1, 0)
+    return np.stack([
+        aw * bw - ax * bx - ay * by - az * bz,
+        aw * bx + ax * bw + ay * bz - az * by,
+        aw * by - ax * bz + ay * bw + az * bx,
+        aw * bz + ax * by - ay * bx + az * bw,
+    ], axis=-1)
+
+def quaternion_conjugate(quats):
+    return quats * np.array([1.0, -1.0, -1.0, -1.0])
+
+def quaternion_to_rotation_vector(quats):
+    """Logarithm map of (..., 4) unit quaternions to (..., 3) rotation vectors (axis * angle)."""
+    quats = quats * np.where(quats[..., :1] < 0.0, -1.0, 1.0)
+    vector = quats[..., 1:]
+    sin_half = np.linalg.norm(vector, axis=-1, keepdims=True)
+    angle = 2.0 * np.arctan2(sin_half, quats[..., :1])
+    return vector * np.where(sin_half > 1e-12, angle / np.maximum(sin_half, 1e-12), 2.0)
+
+def rotation_vector_to_quaternion(vectors):
+    """Exponential map of (..., 3) rotation vectors to (..., 4) unit quaternions."""
+    angle = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    axis = vectors / np.maximum(angle, 1e-12)
+    return np.concatenate([np.cos(angle * 0.5), axis * np.sin(angle * 0.5)], axis=-1)
+
+def align_quaternion_hemispheres(quats):
+    """Flip the sign of (F, ..., 4) quaternions along the first axis so consecutive rotations stay in one hemisphere.
+
+    Returns the aligned quaternions and a boolean (F, ...) array of the entries that were flipped."""
+    quats = np.array(quats, dtype=np.float64)
+    flips = np.zeros(quats.shape[:-1], dtype=bool)
+    if len(quats) < 2:
+        return quats, flips
+
+    crossings = np.sum(quats[1:] * quats[:-1], axis=-1) < 0.0
+    signs = np.cumprod(np.where(crossings, -1.0, 1.0), axis=0)
+    quats[1:] *= signs[..., None]
+    flips[1:] = signs < 0.0
+    return quats, flips
+
+def slerp_quaternions(times, quats, new_times):
+    """Sample (K, 4) quaternion keys at new_times with spherical linear interpolation.
+
+    Times outside the keys are clamped to the first and last key. Returns a (len(new_times), 4) array."""
+    times = np.asarray(times, dtype=np.float64)
+    quats = np.asarray(quats, dtype=np.float64)
+    new_times = np.clip(np.asarray(new_times, dtype=np.float64), times[0], times[-1])
+    if len(times) < 2:
+        return np.repeat(quats[:1], len(new_times), axis=0)
+
+    right = np.clip(np.searchsorted(times, new_times, side='right'), 1, len(times) - 1)
+    left = right - 1
+    span = times[right] - times[left]
+    factor = np.where(span > 0.0, (new_times - times[left]) / np.where(span > 0.0, span, 1.0), 0.0)[:, None]
+
+    a = quats[left]
+    b = quats[right]
+    dot = np.sum(a * b, axis=-1, keepdims=True)
+    b = np.where(dot < 0.0, -b, b)  # Shortest path
+    angle = np.arccos(np.clip(np.abs(dot), 0.0, 1.0))
+    sin_angle = np.sin(angle)
+    nearly_equal = sin_angle < 1e-6
+    safe_sin = np.where(nearly_equal, 1.0, sin_angle)
+    weight_a = np.where(nearly_equal, 1.0 - factor, np.sin((1.0 - factor) * angle) / safe_sin)
+    weight_b = np.where(nearly_equal, factor, np.sin(factor * angle) / safe_sin)
+    result = weight_a * a + weight_b * b
+    return result / np.linalg.norm(result, axis=-1, keepdims=True)
+
+def quaternions_to_matrices(quats):
+    """Convert (..., 4) WXYZ quaternions to (..., 3, 3) rotation matrices. Quaternions are normalized first, like Blender does."""
+    quats = np.asarray(quats, dtype=np.float64)
+    w, x, y, z = np.moveaxis(quats / np.linalg.norm(quats, axis=-1, keepdims=True), -1, 0)
+    return np.stack([
+        np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)], axis=-1),
+        np.stack([2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)], axis=-1),
+        np.stack([2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)], axis=-1),
+    ], axis=-2)
+
+def euler_to_matrices(angles, order):
+    """Convert (..., 3) XYZ euler angles to (..., 3, 3) rotation matrices.
+
+    order is a Blender rotation mode like 'XYZ', the axes are applied in that order."""
+    angles = np.asarray(angles, dtype=np.float64)
+    cos = np.cos(angles)
+    sin = np.sin(angles)
+    zeros = np.zeros(angles.shape[:-1])
+    ones = np.ones(angles.shape[:-1])
+    axis_matrices = {
+        'X': np.stack([np.stack([ones, zeros, zeros], -1), np.stack([zeros, cos[..., 0], -sin[..., 0]], -1), np.stack([zeros, sin[..., 0], cos[..., 0]], -1)], -2),
+        'Y': np.stack([np.stack([cos[..., 1], zeros, sin[..., 1]], -1), np.stack([zeros, ones, zeros], -1), np.stack([-sin[..., 1], zeros, cos[..., 1]], -1)], -2),
+        'Z': np.stack([np.stack([cos[..., 2], -sin[..., 2], zeros], -1), np.stack([sin[..., 2], cos[..., 2], zeros], -1), np.stack([zeros, zeros, ones], -1)], -2),
+    }
+    matrices = axis_matrices[order[0]]
+    for axis in order[1:]:
+        matrices = axis_matrices[axis] @ matrices
+    return matrices
+
+def compose_basis_matrices(location, rotation, scale):
+    """Compose (..., 4, 4) local bone matrices from (..., 3) locations, (..., 3, 3) rotations and (..., 3) scales."""
+    matrices = np.zeros(np.shape(location)[:-1] + (4, 4))
+    matrices[..., :3, :3] = rotation * np.asarray(scale)[..., None, :]
+    matrices[..., :3, 3] = location
+    matrices[..., 3, 3] = 1.0
+    return matrices
+
+def forward_kinematics(basis_matrices, rest_relative_inv, parents, indices):
+    """Compute armature-space pose matrices of the given bones from their local (basis) matrices.
+
+    basis_matrices is an (F, N, 4, 4) array in bone order, only the given bones and their parents need to be set.
+    Bones are assumed to fully inherit their parent's transform and to have no constraints.
+    Returns an (F, N, 4, 4) array where only the given bones and their parents are filled."""
+    parents = np.asarray(parents)
+    pose = np.broadcast_to(np.identity(4), basis_matrices.shape).copy()
+    done = set()
+
+    def solve(i):
+        if i in done:
+            return
+        parent = parents[i]
+        if parent >= 0:
+            solve(parent)
+            pose[:, i] = pose[:, parent] @ np.linalg.inv(rest_relative_inv[i]) @ basis_matrices[:, i]
+        else:
+            pose[:, i] = np.linalg.inv(rest_relative_inv[i]) @ basis_matrices[:, i]
+        done.add(i)
+
+    for i in indices:
+        solve(i)
+    return pose
+
+# Bone transforms
+
+def rest_relative_inverse(rest_matrices, parents):
+    """Return the inverted rest-relative matrix of every bone, i.e. (parentRestMtx^-1 @ boneRestMtx)^-1.
+
+    rest_matrices is an (N, 4, 4) array of armature-space rest matrices, parents an (N,) index array."""
+    parents = np.asarray(parents)
+    parent_rest = np.where((parents >= 0)[:, None, None], rest_matrices[parents], np.identity(4))
+    return np.linalg.inv(np.linalg.inv(parent_rest) @ rest_matrices)
+
+def local_rotations(pose_matrices, rest_relative_inv, parents, indices):
+    """Compute the local rotations that reproduce armature-space pose matrices.
+
+    pose_matrices is an (..., N, 4, 4) array (optionally with a leading frame axis), rest_relative_inv
+    comes from rest_relative_inverse. Returns (..., len(indices), 4) quaternions of the bones in indices."""
+    indices = np.asarray(indices, dtype=np.int64)
+    bone_parents = np.asarray(parents)[indices]
+    parent_pose = np.where((bone_parents >= 0)[:, None, None], pose_matrices[..., bone_parents, :, :], np.identity(4))
+    local = rest_relative_inv[indices] @ np.linalg.inv(parent_pose) @ pose_matrices[..., indices, :, :]
+    return matrices_to_quaternions(local)
+
+# Two-bone IK
+
+def normalize(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+def rotate_around_axis(vectors, axis, angle):
+    """Rotate (F, 3) vectors around (F, 3) unit axes by an angle (Rodrigues' formula)."""
+    cos, sin = np.cos(angle), np.sin(angle)
+    dot = np.sum(axis * vectors, axis=-1, keepdims=True)
+    return vectors * cos + np.cross(axis, vectors) * sin + axis * dot * (1.0 - cos)
+
+def rotation_between(u, v):
+    """Return (F, 3, 3) matrices of the shortest rotations taking unit vectors u onto unit vectors v."""
+    w = np.cross(u, v)
+    c = np.maximum(np.sum(u * v, axis=-1), -1.0 + 1e-9)
+    skew = np.zeros(w.shape[:-1] + (3, 3))
+    skew[..., 0, 1], skew[..., 0, 2] = -w[..., 2], w[..., 1]
+    skew[..., 1, 0], skew[..., 1, 2] = w[..., 2], -w[..., 0]
+    skew[..., 2, 0], skew[..., 2, 1] = -w[..., 1], w[..., 0]
+    return np.identity(3) + skew + (skew @ skew) / (1.0 + c)[..., None, None]
+
+def compose_matrices(x_axis, y_axis, position):
+    """Build (F, 4, 4) matrices from orthonormal X and Y axes and a position."""
+    matrices = np.zeros(x_axis.shape[:-1] + (4, 4))
+    matrices[..., :3, 0] = x_axis
+    matrices[..., :3, 1] = y_axis
+    matrices[..., :3, 2] = np.cross(x_axis, y_axis)
+    matrices[..., :3, 3] = position
+    matrices[..., 3, 3] = 1.0
+    return matrices
+
+def solve_two_bone_ik(root, target, pole, pole_angle, upper_rest, lower_rest, lower_length):
+    """Solve a two-bone chain for F frames at once.
+
+    root, target and pole are (F, 3) arrays in armature space, pole may be None.
+    upper_rest and lower_rest are the 4x4 rest matrices of the chain bones, pole_angle follows the IK constraint.
+    Returns the (F, 4, 4) armature-space pose matrices of the upper and the lower bone."""
+    upper_length = np.linalg.norm(lower_rest[:3, 3] - upper_rest[:3, 3])
+    rest_end = lower_rest[:3, 3] + lower_rest[:3, 1] * lower_length
+
+    # Direction from the root to the target, with the reach clamped to what the limb can do
+    offset = target - root
+    distance = np.clip(np.linalg.norm(offset, axis=-1), abs(upper_length - lower_length) + 1e-6, upper_length + lower_length - 1e-6)
+    chain_axis = normalize(offset)
+
+    rest_axis = normalize(rest_end - upper_rest[:3, 3])
+    if pole is None:
+        # Without a pole the chain keeps its rest roll, swung onto the new chain axis
+        x_axis = (rotation_between(np.broadcast_to(rest_axis, chain_axis.shape), chain_axis) @ upper_rest[:3, 0])
+    else:
+        # With a pole the root bone's X axis points at the pole, rotated around the chain by the pole angle
+        to_pole = pole - root
+        to_pole = to_pole - chain_axis * np.sum(to_pole * chain_axis, axis=-1, keepdims=True)
+        x_axis = rotate_around_axis(normalize(to_pole), chain_axis, pole_angle)
+    x_axis = normalize(x_axis - chain_axis * np.sum(x_axis * chain_axis, axis=-1, keepdims=True))
+
+    # Bend on the same side as in the rest pose
+    rest_elbow_offset = lower_rest[:3, 3] - upper_rest[:3, 3]
+    bend_side = 1.0 if np.dot(rest_elbow_offset, np.cross(upper_rest[:3, 0], rest_axis)) >= 0.0 else -1.0
+    bend_axis = np.cross(x_axis, chain_axis) * bend_side
+
+    # Law of cosines gives the angle between the chain axis and the upper bone
+    cos_root = np.clip((upper_length ** 2 + distance ** 2 - lower_length ** 2) / (2.0 * upper_length * distance), -1.0, 1.0)
+    sin_root = np.sqrt(1.0 - cos_root ** 2)
+    elbow = root + upper_length * (chain_axis * cos_root[..., None] + bend_axis * sin_root[..., None])
+    end = root + chain_axis * distance[..., None]
+
+    upper_pose = compose_matrices(x_axis, normalize(elbow - root), root)
+
+    # The lower bone follows the upper one as in the rest pose, then swings onto the end position
+    lower_follow = upper_pose @ (np.linalg.inv(upper_rest) @ lower_rest)
+    swing = rotation_between(lower_follow[..., :3, 1], normalize(end - elbow))
+    lower_pose = lower_follow.copy()
+    lower_pose[..., :3, :3] = swing @ lower_follow[..., :3, :3]
+    lower_pose[..., :3, 3] = elbow
+    return upper_pose, lower_pose
+
+# Channels and keys
+
+def get_bone_name_from_data_path(data_path):
+    """Extract the bone name from a 'pose.bones["name"].property' data path."""
+    return data_path.split('"')[1] if '"' in data_path else None
+
+def filter_bone_channels(data_paths, kept_bones):
+    """Return a boolean mask of the channels to keep: bone channels of kept bones, and all non-bone channels."""
+    kept_bones = set(kept_bones)
+    return np.array([
+        bone_name is None or bone_name in kept_bones
+        for bone_name in map(get_bone_name_from_data_path, data_paths)
+    ], dtype=bool)
+
+def find_marker_clips(markers):
+    """Find the animation groups defined by Morrowind text key markers.
+
+    markers is a list of (name, frame) pairs. A group runs from its 'Group: Start' to its 'Group: Stop' marker,
+    other text keys are ignored. Returns (group, start_frame, stop_frame) tuples sorted by start frame."""
+    starts = {}
+    stops = {}
+    for name, frame in markers:
+        group, separator, key = name.rpartition(":")
+        key = key.strip().lower()
+        if not separator or not group.strip():
+            continue
+        if key == "start":
+            starts[group.strip()] = frame
+        elif key == "stop":
+            stops[group.strip()] = frame
+    return sorted(
+        ((group, start, stops[group]) for group, start in starts.items() if group in stops and stops[group] > start),
+        key=lambda clip: clip[1]
+    )
+
+def find_changed_frame_ranges(old_keys, new_keys):
+    """Find the frames where an fcurve evaluates differently after its keys were edited.
+
+    old_keys and new_keys are (K, D) arrays with the key frame in the first column and the rest of the key data
+    (value, handles, interpolation) in the others. A changed, added or removed key affects the curve from the
+    previous key to the next one, keys at the ends also affect the extrapolated frames beyond them.
+    Returns a list of (start, end) frame ranges, which may be infinite."""
+    old_keys = {row[0]: row for row in np.asarray(old_keys, dtype=np.float64)}
+    new_keys = {row[0]: row for row in np.asarray(new_keys, dtype=np.float64)}
+    frames = np.union1d(list(old_keys), list(new_keys))
+    ranges = []
+    for i, frame in enumerate(frames):
+        if frame in old_keys and frame in new_keys and np.array_equal(old_keys[frame], new_keys[frame]):
+            continue
+        start = frames[i - 1] if i > 0 else -np.inf
+        end = frames[i + 1] if i < len(frames) - 1 else np.inf
+        ranges.append((start, end))
+    return ranges
+
+def split_frame_range(first_frame, last_frame, count):
+    """Split [first_frame, last_frame] into at most count contiguous (start, end) ranges of nearly equal length."""
+    bounds = np.linspace(first_frame, last_frame + 1, min(count, last_frame - first_frame + 1) + 1).round().astype(int)
+    return [(int(start), int(end) - 1) for start, end in zip(bounds[:-1], bounds[1:])]
+
+def merge_frame_ranges(ranges, margin, first_frame, last_frame):
+    """Grow frame ranges by margin, clamp them to [first_frame, last_frame] and merge overlapping ones.
+
+    Returns a sorted list of (start, end) integer frame ranges."""
+    clamped = []
+    for start, end in ranges:
+        start = max(first_frame, int(np.floor(max(start - margin, first_frame))))
+        end = min(last_frame, int(np.ceil(min(end + margin, last_frame))))
+        if start <= end:
+            clamped.append((start, end))
+
+    merged = []
+    for start, end in sorted(clamped):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def resample_times(first_frame, last_frame, step):
+    """Return key times from first_frame to last_frame, step frames apart. The last frame is always included,
+    steps that don't divide the range give sub-frame times."""
+    times = np.arange(first_frame, last_frame, step, dtype=np.float64)
+    if not len(times) or last_frame - times[-1] > 1e-6:
+        times = np.append(times, float(last_frame))
+    return times
+
+def decimate_keys(times, values, max_error):
+    """Select the keys needed to reproduce a linearly interpolated curve within max_error.
+
+    times is a (K,) array, values a (K,) or (K, C) array; channels of one (K, C) array are decimated together.
+    Uses Ramer-Douglas-Peucker with the value deviation at each key. Returns a (K,) boolean mask of kept keys."""
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64).reshape(len(times), -1)
+    keep = np.zeros(len(times), dtype=bool)
+    if len(times) < 3:
+        keep[:] = True
+        return keep
+
+    keep[0] = keep[-1] = True
+    segments = [(0, len(times) - 1)]
+    while segments:
+        first, last = segments.pop()
+        if last - first < 2:
+            continue
+        factor = ((times[first + 1:last] - times[first]) / (times[last] - times[first]))[:, None]
+        interpolated = values[first] + (values[last] - values[first]) * factor
+        error = np.abs(values[first + 1:last] - interpolated).max(axis=1)
+        worst = int(np.argmax(error))
+        if error[worst] > max_error:
+            split = first + 1 + worst
+            keep[split] = True
+            segments.append((first, split))
+            segments.append((split, last))
+    return keep
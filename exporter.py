@@ -1,6 +1,14 @@
 import bpy
 import re
 import os
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+import numpy as np
+from .core import filter_bone_channels, get_bone_name_from_data_path, align_quaternion_hemispheres, find_marker_clips, find_changed_frame_ranges, merge_frame_ranges, slerp_quaternions, resample_times, split_frame_range, decimate_keys
+from . import sample_library
 
 # Authors: ChatGPT 4.o and Maksim Eremenko
 # A one-click stop to exporting current action into a .nif/.kf files.
@@ -28,11 +36,505 @@ def remove_tags(action_name):
     """Remove any '[tag]' from the action name."""
     return re.sub(r'\[.*?\]', '', action_name)
 
-def set_interpolation_to_linear(action):
-    """Set all keyframe interpolations to linear for a given action."""
+# Value of 'LINEAR' in the keyframe interpolation enum, as used by foreach_set
+INTERPOLATION_LINEAR = 1
+
+def filter_action_bones(action, kept_bones):
+    """Remove fcurves of bones that aren't in kept_bones."""
+    fcurves = list(action.fcurves)
+    keep = filter_bone_channels([fcurve.data_path for fcurve in fcurves], kept_bones)
+    for fcurve, kept in zip(fcurves, keep):
+        if not kept:
+            action.fcurves.remove(fcurve)
+
+def align_rotation_channels(action):
+    """Keep the baked quaternion keys of every bone in one hemisphere, so q/-q sign flips between frames
+    don't look like motion to the decimator. Returns the number of sign flips that were removed."""
+    quaternion_curves = {}
     for fcurve in action.fcurves:
-        for keyframe in fcurve.keyframe_points:
-            keyframe.interpolation = 'LINEAR'
+        if fcurve.data_path.endswith(".rotation_quaternion") and get_bone_name_from_data_path(fcurve.data_path):
+            quaternion_curves.setdefault(fcurve.data_path, [None] * 4)[fcurve.array_index] = fcurve
+
+    sign_flips = 0
+    for fcurves in quaternion_curves.values():
+        if None in fcurves or len({len(fcurve.keyframe_points) for fcurve in fcurves}) != 1:
+            continue  # Only complete channels with shared keys can be aligned
+        key_count = len(fcurves[0].keyframe_points)
+        co = np.empty((4, key_count * 2), dtype=np.float32)
+        for component, fcurve in enumerate(fcurves):
+            fcurve.keyframe_points.foreach_get("co", co[component])
+        if not all(np.array_equal(co[0, 0::2], co[component, 0::2]) for component in range(1, 4)):
+            continue
+
+        quats, flips = align_quaternion_hemispheres(co[:, 1::2].T)
+        if not flips.any():
+            continue
+        co[:, 1::2] = quats.T
+        for component, fcurve in enumerate(fcurves):
+            fcurve.keyframe_points.foreach_set("co", co[component])
+            fcurve.update()
+        # Every run of negated keys starts and ends with a flip, count the transitions rather than the keys
+        sign_flips += int(flips[0]) + np.count_nonzero(np.diff(flips.astype(np.int8)))
+    return sign_flips
+
+def resample_action(action, step, time_scale=1.0):
+    """Resample every fcurve of a baked action to keys step frames apart and scale its timing around the first frame.
+
+    Rotation quaternions are interpolated with slerp, other channels linearly. Markers are moved with the keys."""
+    quaternion_curves = {}
+    other_curves = []
+    for fcurve in action.fcurves:
+        if fcurve.data_path.endswith("rotation_quaternion"):
+            quaternion_curves.setdefault(fcurve.data_path, [None] * 4)[fcurve.array_index] = fcurve
+        else:
+            other_curves.append(fcurve)
+    def read_keys(fcurve):
+        points = fcurve.keyframe_points
+        co = np.empty(len(points) * 2, dtype=np.float64)
+        points.foreach_get("co", co)
+        return co[0::2], co[1::2]
+
+    for data_path, fcurves in list(quaternion_curves.items()):
+        if None in fcurves or len({tuple(read_keys(fcurve)[0]) for fcurve in fcurves}) != 1:
+            # Quaternions without four channels keyed on the same frames are resampled channel by channel
+            other_curves.extend(fcurve for fcurve in fcurves if fcurve)
+            del quaternion_curves[data_path]
+
+    def write_keys(fcurve, times, values):
+        points = fcurve.keyframe_points
+        points.clear()
+        points.add(len(times))
+        points.foreach_set("co", np.stack([first_frame + (times - first_frame) * time_scale, values], axis=-1).ravel())
+        points.foreach_set("interpolation", np.full(len(times), INTERPOLATION_LINEAR, dtype=np.int32))
+        fcurve.update()
+
+    first_frame, last_frame = action.frame_range
+    new_times = resample_times(first_frame, last_frame, step)
+    for fcurves in quaternion_curves.values():
+        key_times, _ = read_keys(fcurves[0])
+        quats = np.stack([read_keys(fcurve)[1] for fcurve in fcurves], axis=-1)
+        resampled = slerp_quaternions(key_times, quats, new_times)
+        for component, fcurve in enumerate(fcurves):
+            write_keys(fcurve, new_times, resampled[:, component])
+
+    for fcurve in other_curves:
+        if not len(fcurve.keyframe_points):
+            continue
+        interpolation = np.empty(len(fcurve.keyframe_points), dtype=np.int32)
+        fcurve.keyframe_points.foreach_get("interpolation", interpolation)
+        if np.all(interpolation == INTERPOLATION_LINEAR):
+            key_times, key_values = read_keys(fcurve)
+            values = np.interp(new_times, key_times, key_values)
+        else:
+            values = np.array([fcurve.evaluate(frame) for frame in new_times])
+        write_keys(fcurve, new_times, values)
+
+    for marker in action.pose_markers:
+        marker.frame = int(round(first_frame + (marker.frame - first_frame) * time_scale))
+
+# Constraint properties that only affect the UI, left out of fingerprint_rig
+UI_CONSTRAINT_PROPERTIES = {"rna_type", "show_expanded", "active", "is_override_data_editable", "error_location", "error_rotation"}
+
+def describe_struct(struct, skipped=()):
+    """List the property values of an RNA struct, with ID pointers as names and nested structs described too."""
+    parts = []
+    for prop in struct.bl_rna.properties:
+        if prop.identifier in skipped:
+            continue
+        value = getattr(struct, prop.identifier, None)
+        if prop.type == 'POINTER':
+            value = value.name if isinstance(value, bpy.types.ID) else None
+        elif prop.type == 'COLLECTION':
+            value = [describe_struct(item) for item in value]
+        elif prop.type in {'FLOAT', 'INT', 'BOOLEAN'} and prop.is_array:
+            value = np.array(value, dtype=np.float64).ravel().tolist()
+        elif isinstance(value, set):
+            value = sorted(value)  # Enum flags, set order changes between sessions
+        parts.append((prop.identifier, value))
+    return parts
+
+def fingerprint_rig(obj):
+    """Fingerprint what a bake reads from the rig besides the action: rest matrices, constraints and bone modes."""
+    parts = [obj.name, obj.data.name if obj.data else ""]
+    parts.extend(describe_struct(constraint, UI_CONSTRAINT_PROPERTIES) for constraint in obj.constraints)
+    if obj.type == 'ARMATURE':
+        bones = obj.data.bones
+        rest = np.empty(len(bones) * 16, dtype=np.float32)
+        bones.foreach_get("matrix_local", rest)
+        parts.append(rest)
+        parts.append([(bone.name, getattr(bone, "mode", "")) for bone in bones])
+        for pose_bone in obj.pose.bones:
+            parts.append(pose_bone.name)
+            parts.extend(describe_struct(constraint, UI_CONSTRAINT_PROPERTIES) for constraint in pose_bone.constraints)
+    return sample_library.fingerprint(*parts)
+
+def fingerprint_action(obj, action, start_frame, end_frame, bone_names=None, rig_fingerprint=None):
+    """Fingerprint everything a bake of the action reads: the rig (see fingerprint_rig), the frame range, the baked bones and every fcurve key."""
+    parts = [rig_fingerprint or fingerprint_rig(obj), start_frame, end_frame, sorted(bone_names) if bone_names is not None else None]
+    for fcurve in action.fcurves:
+        points = fcurve.keyframe_points
+        keys = np.empty(len(points) * 6, dtype=np.float32)
+        co = keys[:len(points) * 2]
+        points.foreach_get("co", co)
+        points.foreach_get("handle_left", keys[len(points) * 2:len(points) * 4])
+        points.foreach_get("handle_right", keys[len(points) * 4:])
+        interpolation = np.empty(len(points), dtype=np.int32)
+        points.foreach_get("interpolation", interpolation)
+        parts.extend([fcurve.data_path, fcurve.array_index, fcurve.mute, keys, interpolation])
+    return sample_library.fingerprint(*parts)
+
+def read_action_samples(action, start_frame, end_frame):
+    """Read every fcurve of a baked action as one (F, C) array sampled on each frame."""
+    times = np.arange(start_frame, end_frame + 1, dtype=np.float32)
+    channels = []
+    values = np.empty((len(times), len(action.fcurves)), dtype=np.float32)
+    for c, fcurve in enumerate(action.fcurves):
+        channels.append((fcurve.data_path, fcurve.array_index, fcurve.group.name if fcurve.group else ""))
+        points = fcurve.keyframe_points
+        co = np.empty(len(points) * 2, dtype=np.float32)
+        points.foreach_get("co", co)
+        if len(points) == len(times) and np.array_equal(co[0::2], times):
+            values[:, c] = co[1::2]
+        else:
+            values[:, c] = [fcurve.evaluate(frame) for frame in times]
+    return channels, times, values
+
+def write_action_samples(action, channels, times, values):
+    """Replace the keys of the given channels with linearly interpolated samples, in bulk."""
+    for c, (data_path, index, group) in enumerate(channels):
+        fcurve = action.fcurves.find(data_path, index=index)
+        if fcurve is None:
+            fcurve = action.fcurves.new(data_path, index=index, action_group=group)
+        points = fcurve.keyframe_points
+        points.clear()
+        points.add(len(times))
+        points.foreach_set("co", np.stack([times, values[:, c]], axis=-1).astype(np.float32).ravel())
+        points.foreach_set("interpolation", np.full(len(times), INTERPOLATION_LINEAR, dtype=np.int32))
+        fcurve.update()
+
+# Frames baked per step of a modal export, see bake_action_stages
+BAKE_CHUNK_FRAMES = 25
+
+def bake_frame_range(obj, action, start_frame, end_frame, bone_names=None):
+    """Bake a frame range of the object's action with visual keying into a scratch action and return its samples.
+
+    If bone_names is given, only those bones are evaluated and keyed. The action itself is left untouched,
+    so the rig keeps evaluating the source keys for the following ranges.
+    nla.bake bakes every selected object, so only obj is selected and active during the bake; the user's
+    selection is restored afterwards, it can change between the steps of a modal export."""
+    view_layer = bpy.context.view_layer
+    saved_objects = [other for other in view_layer.objects if other.select_get()]
+    saved_active = view_layer.objects.active
+    for other in saved_objects:
+        other.select_set(False)
+    obj.select_set(True)
+    view_layer.objects.active = obj
+
+    bones = obj.data.bones
+    saved_selection = None
+    if bone_names is not None:
+        # nla.bake keys the selected bones, select exactly the wanted ones
+        saved_selection = np.empty(len(bones), dtype=bool)
+        bones.foreach_get("select", saved_selection)
+        bones.foreach_set("select", np.array([bone.name in bone_names for bone in bones], dtype=bool))
+
+    try:
+        bpy.ops.nla.bake(frame_start=start_frame, frame_end=end_frame, only_selected=bone_names is not None, visual_keying=True, clear_constraints=False, clear_parents=False, use_current_action=False, bake_types={'POSE', 'OBJECT'})
+    finally:
+        if saved_selection is not None:
+            bones.foreach_set("select", saved_selection)
+        obj.select_set(False)
+        for other in saved_objects:
+            other.select_set(True)
+        view_layer.objects.active = saved_active
+
+    scratch_action = obj.animation_data.action
+    try:
+        return read_action_samples(scratch_action, start_frame, end_frame)
+    finally:
+        obj.animation_data.action = action
+        if scratch_action != action:
+            bpy.data.actions.remove(scratch_action)
+
+# Source keys and baked samples of the last bake of every action, see bake_action_stages
+bake_records = {}
+
+# Frames re-baked on both sides of a changed key range, constraints can carry a change a bit further
+DIRTY_RANGE_MARGIN = 2
+
+def read_fcurve_keys(fcurve):
+    """Read the keys of an fcurve as a (K, 7) array of frame, value, left and right handles and interpolation."""
+    points = fcurve.keyframe_points
+    keys = np.empty((len(points), 7), dtype=np.float64)
+    buffer = np.empty(len(points) * 2, dtype=np.float64)
+    for column, attribute in ((0, "co"), (2, "handle_left"), (4, "handle_right")):
+        points.foreach_get(attribute, buffer)
+        keys[:, column:column + 2] = buffer.reshape(-1, 2)
+    interpolation = np.empty(len(points), dtype=np.int32)
+    points.foreach_get("interpolation", interpolation)
+    keys[:, 6] = interpolation
+    return keys
+
+def get_bake_record_key(obj, action):
+    # Copies of one source action get numeric suffixes, they share a record.
+    # Keyed by the object itself like the rig caches, a renamed rig keeps its record and a new one with the same name doesn't get it.
+    return obj, re.sub(r"\.\d{3}$", "", action.name)
+
+def find_dirty_ranges(record, rig_fingerprint, action_keys, start_frame, end_frame, bone_names):
+    """Return the frame ranges whose bake is out of date since the recorded bake, or None if all of it is.
+
+    Edits to the rig itself (constraints, bone modes, rest pose) can change any frame, they invalidate the whole bake."""
+    if (record is None or record["rig"] != rig_fingerprint or record["range"] != (start_frame, end_frame)
+            or record["bone_names"] != bone_names or record["keys"].keys() != action_keys.keys()):
+        return None
+    ranges = []
+    for channel, keys in action_keys.items():
+        ranges.extend(find_changed_frame_ranges(record["keys"][channel], keys))
+    return merge_frame_ranges(ranges, DIRTY_RANGE_MARGIN, start_frame, end_frame)
+
+def bake_action_stages(context, obj, action, start_frame, end_frame, chunk_frames=None, bone_names=None):
+    """Bake the object's current action (a copy of the source action) with visual keying, chunk_frames at a time.
+    If bone_names is given, only those bones are baked.
+
+    Yields the baked fraction after every chunk, the samples are written into the action at the end.
+    If a sample library folder is set in the preferences, the bake is looked up there by the action's
+    fingerprint and written straight into the action, without evaluating the rig. New bakes are stored.
+    If the same action was baked before in this session, only the frames affected by edited keys are re-baked
+    and spliced into the previous samples."""
+    bone_names = frozenset(bone_names) if bone_names is not None else None
+    action_keys = {(fcurve.data_path, fcurve.array_index): read_fcurve_keys(fcurve) for fcurve in action.fcurves}
+    record_key = get_bake_record_key(obj, action)
+    rig_fingerprint = fingerprint_rig(obj)
+
+    addon_prefs = context.preferences.addons[__package__].preferences
+    library_folder = bpy.path.abspath(addon_prefs.sample_library_folder)
+    key = fingerprint_action(obj, action, start_frame, end_frame, bone_names, rig_fingerprint) if library_folder else None
+
+    stored = sample_library.load_samples(library_folder, key) if key else None
+    if stored:
+        channels, times, values, _ = stored
+        write_action_samples(action, channels, times, values)
+        bake_records[record_key] = {"rig": rig_fingerprint, "range": (start_frame, end_frame), "bone_names": bone_names, "keys": action_keys,
+                                    "channels": channels, "values": np.array(values)}
+        print(f"Loaded baked samples of '{action.name}' from the sample library ({key})")
+        yield 1.0
+        return
+
+    record = bake_records.get(record_key)
+    dirty_ranges = find_dirty_ranges(record, rig_fingerprint, action_keys, start_frame, end_frame, bone_names)
+    if dirty_ranges is None:
+        record = None
+        dirty_ranges = [(start_frame, end_frame)]
+    else:
+        print(f"Re-baking frames {dirty_ranges} of '{action.name}'")
+
+    times = np.arange(start_frame, end_frame + 1, dtype=np.float32)
+    channels = record["channels"] if record else None
+    values = record["values"].copy() if record else None
+
+    worker_count = min(addon_prefs.bake_workers, len(times) // SHARD_MIN_FRAMES)
+    if record is None and worker_count > 1:
+        # A full bake of a long range, split it across background workers
+        sharded = yield from bake_sharded_stages(obj, action, start_frame, end_frame, bone_names, worker_count)
+        if sharded:
+            channels, values = sharded
+            dirty_ranges = []
+
+    chunk_frames = chunk_frames or end_frame - start_frame + 1
+    chunks = [
+        (chunk_start, min(chunk_start + chunk_frames - 1, range_end))
+        for range_start, range_end in dirty_ranges
+        for chunk_start in range(range_start, range_end + 1, chunk_frames)
+    ]
+    frame_count = sum(chunk_end - chunk_start + 1 for chunk_start, chunk_end in chunks)
+    baked_frames = 0
+    for chunk_start, chunk_end in chunks:
+        chunk_channels, _, chunk_values = bake_frame_range(obj, action, chunk_start, chunk_end, bone_names)
+        if channels is None:
+            channels = chunk_channels
+            values = np.empty((len(times), len(channels)), dtype=np.float32)
+        elif chunk_channels != channels:
+            # Match the channel order of the first chunk
+            columns = {channel: c for c, channel in enumerate(chunk_channels)}
+            chunk_values = chunk_values[:, [columns[channel] for channel in channels]]
+        values[chunk_start - start_frame:chunk_end - start_frame + 1] = chunk_values
+        baked_frames += chunk_end - chunk_start + 1
+        yield baked_frames / frame_count
+    if not chunks:
+        yield 1.0
+
+    write_action_samples(action, channels, times, values)
+    bake_records[record_key] = {"rig": rig_fingerprint, "range": (start_frame, end_frame), "bone_names": bone_names, "keys": action_keys,
+                                "channels": channels, "values": values}
+
+    if key:
+        sample_library.save_samples(library_folder, key, channels, times, values, metadata={"action": action.name, "object": obj.name})
+
+# Script run by the background bake workers
+WORKER_SCRIPT_PATH = os.path.join(os.path.dirname(__file__), "bake_worker.py")
+
+# Shards are only worth a Blender process each above this many frames
+SHARD_MIN_FRAMES = 50
+
+# Largest difference between the samples of a seam frame baked by two neighbouring shards
+SEAM_TOLERANCE = 1e-4
+
+# Frames re-baked around a seam whose shards disagree
+SEAM_MARGIN = 2
+
+def get_quaternion_columns(channels):
+    """Return the column indices of every complete rotation_quaternion in a list of sample channels."""
+    quaternions = {}
+    for c, (data_path, index, _) in enumerate(channels):
+        if data_path.endswith(".rotation_quaternion") and 0 <= index < 4:
+            quaternions.setdefault(data_path, [None] * 4)[index] = c
+    return [columns for columns in quaternions.values() if None not in columns]
+
+def max_sample_difference(channels, a, b):
+    """Largest difference between two rows of samples, with quaternions compared up to their sign (q and -q are one rotation)."""
+    difference = np.abs(a - b)
+    for columns in get_quaternion_columns(channels):
+        difference[columns] = min(np.abs(a[columns] - b[columns]).max(), np.abs(a[columns] + b[columns]).max())
+    return difference.max() if len(difference) else 0.0
+
+def bake_sharded_stages(obj, action, start_frame, end_frame, bone_names, worker_count):
+    """Bake a frame range of the object's action in parallel background Blender processes.
+
+    The file is saved to a temporary copy, every worker bakes one shard of the range from it and stores its
+    samples in a temporary sample library. Every shard after the first also bakes the last frame of the previous
+    one, seams where the two disagree are re-baked here. A generator yielding the fraction of finished workers,
+    returns (channels, values) for the whole range.
+
+    Workers only run Python drivers if this session does. One frame is checked against an in-process bake,
+    if the workers evaluated the rig differently None is returned and the range has to be baked here."""
+    folder = tempfile.mkdtemp(prefix="bizarre_bake_")
+    processes = []
+    try:
+        blend_path = os.path.join(folder, "scene.blend")
+        bpy.ops.wm.save_as_mainfile(filepath=blend_path, copy=True)
+        bones_path = ""
+        if bone_names is not None:
+            bones_path = os.path.join(folder, "bones.json")
+            with open(bones_path, "w") as file:
+                json.dump(sorted(bone_names), file)
+
+        # Python drivers only run with auto-execution, which --factory-startup turns off.
+        # Allow it in the workers unless it was blocked for this file in this session.
+        autoexec = [] if bpy.app.autoexec_fail else ["--enable-autoexec"]
+
+        shards = split_frame_range(start_frame, end_frame, worker_count)
+        log_paths = [os.path.join(folder, f"shard_{s}.log") for s in range(len(shards))]
+        for s, (shard_start, shard_end) in enumerate(shards):
+            with open(log_paths[s], "w") as log:
+                processes.append(subprocess.Popen([
+                    bpy.app.binary_path, "--background", "--factory-startup", *autoexec, blend_path, "--python", WORKER_SCRIPT_PATH, "--",
+                    "--object", obj.name, "--action", action.name, "--start", str(max(start_frame, shard_start - 1)), "--end", str(shard_end),
+                    "--bones", bones_path, "--output", folder, "--key", f"shard_{s}"
+                ], stdout=log, stderr=subprocess.STDOUT))
+
+        while any(process.poll() is None for process in processes):
+            yield sum(process.poll() is not None for process in processes) / len(processes)
+
+        for s, process in enumerate(processes):
+            if process.returncode != 0:
+                with open(log_paths[s]) as log:
+                    raise RuntimeError(f"Bake worker of frames {shards[s][0]}-{shards[s][1]} failed:\n{log.read()[-2000:]}")
+
+        channels = None
+        values = None
+        seams = []
+        for s, (shard_start, shard_end) in enumerate(shards):
+            # Copies, memory-mapped files would keep the folder from being removed on Windows
+            shard_channels, _, shard_values, _ = sample_library.load_samples(folder, f"shard_{s}")
+            shard_values = np.array(shard_values)
+            if channels is None:
+                channels = shard_channels
+                values = np.empty((end_frame - start_frame + 1, len(channels)), dtype=np.float32)
+            elif shard_channels != channels:
+                columns = {channel: c for c, channel in enumerate(shard_channels)}
+                shard_values = shard_values[:, [columns[channel] for channel in channels]]
+            if s > 0:
+                # The first row is the last frame of the previous shard. The shard's bake started fresh there,
+                # so its quaternions can have the opposite sign, keep them in the previous shard's hemisphere
+                previous = values[shard_start - 1 - start_frame]
+                for columns in get_quaternion_columns(channels):
+                    if np.dot(shard_values[0, columns], previous[columns]) < 0.0:
+                        shard_values[:, columns] *= -1.0
+                if max_sample_difference(channels, shard_values[0], previous) > SEAM_TOLERANCE:
+                    seams.append(shard_start)
+                shard_values = shard_values[1:]
+            values[shard_start - start_frame:shard_end - start_frame + 1] = shard_values
+
+        # Compare a frame of the last shard with the rig as this session evaluates it
+        check_frame = shards[-1][0] + (shards[-1][1] - shards[-1][0]) // 2
+        check_channels, _, check_values = bake_frame_range(obj, action, check_frame, check_frame, bone_names)
+        columns = {channel: c for c, channel in enumerate(check_channels)}
+        if set(check_channels) != set(channels) or max_sample_difference(
+                channels, check_values[0, [columns[channel] for channel in channels]], values[check_frame - start_frame]) > SEAM_TOLERANCE:
+            print(f"Bake workers disagree with this session at frame {check_frame}, baking in this session instead")
+            return None
+
+        for seam in seams:
+            seam_start = max(start_frame, seam - SEAM_MARGIN)
+            seam_end = min(end_frame, seam + SEAM_MARGIN)
+            print(f"Shards disagree at frame {seam}, re-baking frames {seam_start}-{seam_end}")
+            seam_channels, _, seam_values = bake_frame_range(obj, action, seam_start, seam_end, bone_names)
+            columns = {channel: c for c, channel in enumerate(seam_channels)}
+            values[seam_start - start_frame:seam_end - start_frame + 1] = seam_values[:, [columns[channel] for channel in channels]]
+
+        return channels, values
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        try:
+            shutil.rmtree(folder)
+        except OSError as error:
+            print(f"Couldn't remove the bake worker folder {folder}: {error}")
+
+# Pause between the steps of a pipeline that isn't driven by a modal timer, so waiting for bake workers doesn't spin
+STAGE_POLL_SECONDS = 0.02
+
+def bake_action(context, obj, action, start_frame, end_frame):
+    """Bake the object's current action in one go, see bake_action_stages."""
+    for _ in bake_action_stages(context, obj, action, start_frame, end_frame):
+        time.sleep(STAGE_POLL_SECONDS)
+
+# Custom property marking the actions created by the exporter, holds the name of their source action
+scratch_action_property = "bizarre_scratch_source"
+
+def replace_action(action, name):
+    """Give the action a name. An action that already has the name is replaced: its users are moved over
+    to the given action and it is removed, so repeated exports don't pile up .001 copies."""
+    existing = bpy.data.actions.get(name)
+    if existing and existing != action:
+        existing.user_remap(action)
+        bpy.data.actions.remove(existing)
+    action.name = name
+    return action
+
+def copy_scratch_action(source_action, name):
+    """Copy an action into a scratch action with the given name, replacing the previous one."""
+    action = source_action.copy()
+    action[scratch_action_property] = source_action.name
+    action.use_fake_user = False
+    if bpy.data.actions.get(name) == source_action:
+        return action  # Never replace the source itself
+    return replace_action(action, name)
+
+def promote_scratch_action(action, name):
+    """Keep a finished scratch action as a result: give it the name (replacing the previous result) and a fake user."""
+    if scratch_action_property in action:
+        del action[scratch_action_property]
+    replace_action(action, name).use_fake_user = True
+    return action
+
+def remove_orphan_scratch_actions():
+    """Remove scratch actions nothing uses anymore, including temporary actions left by older versions."""
+    for action in list(bpy.data.actions):
+        if action.users == 0 and (scratch_action_property in action or action.name.startswith("[Baked][Temp]")):
+            bpy.data.actions.remove(action)
 
 def load_object_from_blend(filepath, object_name):
     """Load an object from an external .blend file and add it to the current scene, ignoring objects starting with 'Tri Shadow'."""
@@ -53,47 +555,60 @@ def load_object_from_blend(filepath, object_name):
     
     return obj
 
+# Child object names per object of a .blend file, with the file's modification time, see get_blend_object_children
+blend_object_children = {}
+
+def get_blend_object_children(filepath):
+    """Return a map of the objects in an external .blend file to the names of their children.
+
+    The file's objects are linked temporarily to read their parents, the result is cached until the file changes."""
+    mtime = os.path.getmtime(filepath)
+    cached = blend_object_children.get(filepath)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    linked_before = set(bpy.data.libraries)
+    with bpy.data.libraries.load(filepath, link=True) as (data_from, data_to):
+        data_to.objects = list(data_from.objects)
+    children = {}
+    library = None
+    for obj in data_to.objects:
+        if obj:
+            library = obj.library
+            children.setdefault(obj.name, [])
+            if obj.parent:
+                children.setdefault(obj.parent.name, []).append(obj.name)
+    if library and library not in linked_before:
+        bpy.data.libraries.remove(library)  # Never remove a library the user linked
+
+    blend_object_children[filepath] = (mtime, children)
+    return children
+
 def load_objects_from_blend_bulk(filepath, object_names):
-    """Load multiple objects from an external .blend file, link them to the scene, and clean up unlinked objects, ignoring objects starting with 'Tri Shadow'."""
-    loaded_objects = {}
+    """Load objects and their children from an external .blend file in one go and link them to the scene,
+    ignoring objects starting with 'Tri Shadow'.
+
+    Objects that are already in the file are reused instead of loaded again as .001 copies."""
+    children = get_blend_object_children(filepath)
+    wanted_names = []
+    pending = [name for name in object_names if name in children]
+    while pending:
+        name = pending.pop()
+        if name.startswith("Tri Shadow") or name in wanted_names:
+            continue
+        wanted_names.append(name)
+        pending.extend(children[name])
 
-    # Load all objects from the external file
     with bpy.data.libraries.load(filepath, link=False) as (data_from, data_to):
-        data_to.objects = [name for name in data_from.objects if not name.startswith("Tri Shadow")]
-
-    # Store loaded objects in a dictionary
-    # Outside of loading context data_to.objects becomes a list of objects
-    for obj in data_to.objects:            
-        if obj:  # Ensure the object is not None
-            loaded_objects[obj.name] = obj
-
-    # Link the desired object and its children to the scene
-    def link_to_scene(obj):
-        """Recursively link an object and its children to the scene."""
-        existing_obj = bpy.context.scene.collection.objects.get(obj.name)
-        if existing_obj:            
-            bpy.data.objects.remove(existing_obj, do_unlink=True)
-        # Add object to scene    
-        bpy.context.scene.collection.objects.link(obj)
-        
-        for child in obj.children:
-            link_to_scene(child)
-
-    root_objects = []
-    for object_name in object_names:
-        if object_name.startswith("Tri Shadow"):
-            continue  # Ignore objects starting with "Tri Shadow"
-        root_obj = loaded_objects.pop(object_name, None)
-        if root_obj:
-            link_to_scene(root_obj)
-            root_objects.append(root_obj)
-
-    # Clean up unlinked objects
-    for obj_name, obj in loaded_objects.items():
-        if obj and obj.users == 0:  # If the object is not linked to any scene or collection
-            bpy.data.objects.remove(obj, do_unlink=True)
-
-    return root_objects
+        data_to.objects = [name for name in wanted_names if not bpy.data.objects.get(name)]
+
+    scene_objects = bpy.context.scene.collection.objects
+    for name in wanted_names:
+        obj = bpy.data.objects.get(name)
+        if obj and name not in bpy.context.scene.objects:
+            scene_objects.link(obj)
+
+    return [bpy.data.objects[name] for name in object_names if name in wanted_names and bpy.data.objects.get(name)]
 
 def remove_object_from_scene(object_name):
     """Remove an object from the scene if it exists."""
@@ -103,199 +618,353 @@ def remove_object_from_scene(object_name):
 
 
 
-class ExportAnimationOperator(bpy.types.Operator):
-    bl_idname = "export.animation"
-    bl_label = "Export Animation"
-    bl_description = "Export the current action as a .nif/.kf file, baking and decimating keyframes"
-    bl_options = {'REGISTER', 'UNDO'}
-
-    def execute(self, context):
-        # Access properties from the add-on preferences
-        addon_prefs = context.preferences.addons[__package__].preferences
-        export_folder = addon_prefs.export_folder
-        retained_extra_bones = [bone.strip() for bone in addon_prefs.retained_extra_bones.split(',')]  # Strip spaces
-        export_as = addon_prefs.export_as
-
-        # Determine the reference armature name
-        if export_as == '1ST_PERSON':
-            reference_armature_name = "1st Person Reference Armat"
-        elif export_as == '3RD_PERSON':
-            # Use "3rd Person Khajiit Reference Armature" if the action has the [Beast] tag
-            obj = context.object
-            if obj.animation_data and obj.animation_data.action and "[Beast]" in obj.animation_data.action.name:
-                reference_armature_name = "3rd Person Khajiit Reference Armature"
-            else:
-                reference_armature_name = "3rd Person Reference Armat"
-
-        # Ensure we're in object mode
-        bpy.ops.object.mode_set(mode='OBJECT')
-
-        # Get the current object and its action
+def slice_action(action, start_frame, end_frame):
+    """Return a copy of the action with only the keys and markers between start_frame and end_frame.
+
+    Keys are added on both ends of the range, so the clip plays exactly like that part of the action."""
+    clip_action = action.copy()
+    for fcurve in clip_action.fcurves:
+        points = fcurve.keyframe_points
+        for frame in (start_frame, end_frame):
+            points.insert(frame, fcurve.evaluate(frame), options={'FAST'})
+
+        count = len(points)
+        co = np.empty(count * 2, dtype=np.float32)
+        handle_left = np.empty(count * 2, dtype=np.float32)
+        handle_right = np.empty(count * 2, dtype=np.float32)
+        interpolation = np.empty(count, dtype=np.int32)
+        points.foreach_get("co", co)
+        points.foreach_get("handle_left", handle_left)
+        points.foreach_get("handle_right", handle_right)
+        points.foreach_get("interpolation", interpolation)
+
+        kept = (co[0::2] >= start_frame) & (co[0::2] <= end_frame)
+        kept_pairs = np.repeat(kept, 2)
+        points.clear()
+        points.add(int(kept.sum()))
+        points.foreach_set("co", co[kept_pairs])
+        points.foreach_set("handle_left", handle_left[kept_pairs])
+        points.foreach_set("handle_right", handle_right[kept_pairs])
+        points.foreach_set("interpolation", interpolation[kept])
+        fcurve.update()
+
+    for marker in list(clip_action.pose_markers):
+        if not start_frame <= marker.frame <= end_frame:
+            clip_action.pose_markers.remove(marker)
+    return clip_action
+
+# Largest value deviation decimate_action may introduce
+DECIMATE_MAX_ERROR = 0.000005
+
+def decimate_action(action, max_error=DECIMATE_MAX_ERROR):
+    """Remove the keys of linearly interpolated fcurves that can be reproduced within max_error, in bulk.
+
+    Channels of one property keyed on the same frames (e.g. the four of a quaternion) are decimated together,
+    so they keep sharing their keys. Fcurves with other interpolations are left untouched."""
+    curves_by_path = {}
+    for fcurve in action.fcurves:
+        curves_by_path.setdefault(fcurve.data_path, []).append(fcurve)
+
+    for fcurves in curves_by_path.values():
+        keys = [read_fcurve_keys(fcurve) for fcurve in fcurves]
+        linear = [(fcurve, k) for fcurve, k in zip(fcurves, keys) if len(k) > 2 and np.all(k[:, 6] == INTERPOLATION_LINEAR)]
+        if not linear:
+            continue
+        if len({tuple(k[:, 0]) for _, k in linear}) == 1:
+            groups = [linear]
+        else:
+            groups = [[item] for item in linear]
+
+        for group in groups:
+            times = group[0][1][:, 0]
+            keep = decimate_keys(times, np.stack([k[:, 1] for _, k in group], axis=-1), max_error)
+            if keep.all():
+                continue
+            for fcurve, k in group:
+                points = fcurve.keyframe_points
+                points.clear()
+                points.add(int(keep.sum()))
+                points.foreach_set("co", k[keep, :2].astype(np.float32).ravel())
+                points.foreach_set("interpolation", np.full(int(keep.sum()), INTERPOLATION_LINEAR, dtype=np.int32))
+                fcurve.update()
+
+def export_armature(armature, export_path):
+    """Export the armature and its current action with the Morrowind exporter."""
+    # The exporter expects the root armature to be named "Bip01" or "Bip01."
+    original_name = armature.name  # Save the original name
+    if not (armature.name.startswith('Bip01') or armature.name.startswith('Bip01.')):
+        armature.name = "Bip01"  # Temporarily rename the armature
+
+    try:
+        # The export only includes the selected objects, the selection may have changed during a modal export
+        for other in bpy.context.view_layer.objects:
+            other.select_set(False)
+        bpy.context.view_layer.objects.active = armature
+        armature.select_set(True)
+
+        # Export the object
+        print(f"Exporting animation to: {export_path}")
+        bpy.ops.export_scene.mw(filepath=export_path, use_selection=True, export_animations=True, extract_keyframe_data=True)
+    finally:
+        # Restore the original name after export
+        armature.name = original_name
+
+def run_stages(stages):
+    """Run a staged pipeline to completion and return its result."""
+    while True:
+        try:
+            next(stages)
+        except StopIteration as stop:
+            return stop.value
+        time.sleep(STAGE_POLL_SECONDS)
+
+def export_animation(operator, context):
+    """Bake, decimate and export the current action of the active object in one go. Runs ExportAnimationOperator."""
+    return run_stages(export_animation_stages(operator, context))
+
+def export_animation_stages(operator, context, chunk_frames=None):
+    """Bake, decimate and export the current action of the active object.
+
+    A generator yielding (progress, message) after every stage and bake chunk, so a modal operator can run
+    the export over several event loop iterations. Returns the operator result. If the export fails or the
+    generator is closed before it finishes, the original action is restored and the temporary one removed."""
+    # Access properties from the add-on preferences
+    addon_prefs = context.preferences.addons[__package__].preferences
+    export_folder = addon_prefs.export_folder
+    retained_extra_bones = [bone.strip() for bone in addon_prefs.retained_extra_bones.split(',')]  # Strip spaces
+    export_as = addon_prefs.export_as
+
+    # Determine the reference armature name
+    if export_as == '1ST_PERSON':
+        reference_armature_name = "1st Person Reference Armat"
+    elif export_as == '3RD_PERSON':
+        # Use "3rd Person Khajiit Reference Armature" if the action has the [Beast] tag
         obj = context.object
-        if obj.animation_data and obj.animation_data.action:
-            original_action = obj.animation_data.action
-            original_action_name = original_action.name
-
-            # Check if the action is already baked
-            if "[Baked]" in original_action_name:
-                # Clone the action into [Baked][Temp]
-                temp_action = original_action.copy()
-                temp_action.name = f"[Baked][Temp] {remove_tags(original_action_name)}"
-                obj.animation_data.action = temp_action
-            elif has_raw_tag(original_action_name):
-
-                # Copy the action and rename it
-                temp_action = original_action.copy()
-                temp_action.name = replace_raw_with_baked(original_action_name)
-                obj.animation_data.action = temp_action
-
+        if obj.animation_data and obj.animation_data.action and "[Beast]" in obj.animation_data.action.name:
+            reference_armature_name = "3rd Person Khajiit Reference Armature"
+        else:
+            reference_armature_name = "3rd Person Reference Armat"
+
+    # Get the current object and its action
+    obj = context.object
+    if not obj.animation_data or not obj.animation_data.action:
+        operator.report({'ERROR'}, "No animation action found on the current object.")
+        return {'CANCELLED'}
+
+    original_action = obj.animation_data.action
+    original_action_name = original_action.name
+    if "[Baked]" not in original_action_name and not has_raw_tag(original_action_name):
+        operator.report({'ERROR'}, "The action not start with the '[Raw]' or '[Baked]' tag. Aborting operation.")
+        return {'CANCELLED'}
+
+    # Ensure we're in object mode
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+    scene = bpy.context.scene
+    original_frame_range = (scene.frame_start, scene.frame_end)
+    result = None
+    temp_action = None
+    try:
+        # Load the reference armature first, only the bones it has (and the retained extra bones) are baked
+        reference_armature = load_object_from_blend(refArmaturesFilePath, reference_armature_name)
+        if not reference_armature:
+            operator.report({'ERROR'}, f"Reference armature '{reference_armature_name}' not found in external file.")
+            result = {'CANCELLED'}
+            return result
+        reference_bone_names = {bone.name for bone in reference_armature.data.bones}
+        exported_bone_names = reference_bone_names | set(retained_extra_bones)
+
+        try:
+            # Work in the [Baked][Temp] copy of the action, it replaces the one left by the previous export
+            temp_action = copy_scratch_action(original_action, f"[Baked][Temp] {remove_tags(original_action_name)}")
+            obj.animation_data.action = temp_action
+
+            if has_raw_tag(original_action_name) and "[Baked]" not in original_action_name:
                 # Get all keyframes for the action
                 keyframes = [kp.co[0] for fcurve in temp_action.fcurves for kp in fcurve.keyframe_points]
                 start_frame = int(min(keyframes))
                 end_frame = int(max(keyframes))
 
                 # Limit the frame range for the action
-                bpy.context.scene.frame_start = start_frame
-                bpy.context.scene.frame_end = end_frame
+                scene.frame_start = start_frame
+                scene.frame_end = end_frame
 
                 # Bake the action with visual keying
-                bpy.ops.nla.bake(frame_start=start_frame, frame_end=end_frame, only_selected=False, visual_keying=True, clear_constraints=False, clear_parents=False, use_current_action=True, bake_types={'POSE'})
-                bpy.ops.nla.bake(frame_start=start_frame, frame_end=end_frame, only_selected=False, visual_keying=True, clear_constraints=False, clear_parents=False, use_current_action=True, bake_types={'OBJECT'})
-                set_interpolation_to_linear(temp_action)
+                for baked in bake_action_stages(context, obj, temp_action, start_frame, end_frame, chunk_frames, exported_bone_names):
+                    yield 0.8 * baked, f"Baking frames {start_frame}-{end_frame}"
+
+            yield 0.8, "Filtering bones"
+            # Drop the source keys of bones that aren't exported
+            filter_action_bones(temp_action, exported_bone_names)
+
+            # Remove quaternion sign flips, the decimator would keep them as detail
+            sign_flips = align_rotation_channels(temp_action)
+
+            # Resample to the export key rate and time scale
+            if addon_prefs.export_key_rate > 0.0 or addon_prefs.export_time_scale != 1.0:
+                yield 0.82, "Resampling keys"
+                step = scene.render.fps / scene.render.fps_base / addon_prefs.export_key_rate if addon_prefs.export_key_rate > 0.0 else 1.0
+                resample_action(temp_action, step, addon_prefs.export_time_scale)
+
+            # Get the sanitized action name without tags
+            action_name = sanitize_filename(remove_tags(temp_action.name))
+
+            # The rig the export started on, the active object may have changed between the steps
+            current_armature = obj
+            if not current_armature or current_armature.type != 'ARMATURE':
+                operator.report({'ERROR'}, "No valid armature selected or active armature name does not start with 'Bip01' or 'Bip01.'.")
+                result = {'CANCELLED'}
+                return result
+
+            # Either the whole action, or every marker group sliced from the one bake
+            if addon_prefs.export_clips == 'MARKERS':
+                clips = find_marker_clips([(marker.name, marker.frame) for marker in temp_action.pose_markers])
+                if not clips:
+                    operator.report({'ERROR'}, "No 'Group: Start' and 'Group: Stop' markers found in the action.")
+                    result = {'CANCELLED'}
+                    return result
             else:
-                self.report({'ERROR'}, "The action not start with the '[Raw]' or '[Baked]' tag. Aborting operation.")
-                return {'CANCELLED'}
-            
-
-            # Load the reference armature
-            reference_armature = load_object_from_blend(refArmaturesFilePath, reference_armature_name)
-            if not reference_armature:
-                self.report({'ERROR'}, f"Reference armature '{reference_armature_name}' not found in external file.")
-                return {'CANCELLED'}
-
-            try:
-                # Filter bones based on the reference armature
-                reference_bone_names = {bone.name for bone in reference_armature.data.bones}
-                for fcurve in temp_action.fcurves[:]:
-                    bone_name = fcurve.data_path.split('"')[1] if '"' in fcurve.data_path else None
-                    if bone_name and bone_name not in reference_bone_names and bone_name not in retained_extra_bones:
-                        temp_action.fcurves.remove(fcurve)
-
-                # Apply Decimate to all keyframes using graph.decimate
-                bpy.ops.object.mode_set(mode='POSE')
-                bpy.ops.pose.select_all(action='SELECT')  # Select all bones in pose mode
-                current_area_type = bpy.context.area.type
-                bpy.context.area.type = 'GRAPH_EDITOR'
-                bpy.ops.graph.select_all(action='SELECT')  # Select all keyframes in the graph editor
-                bpy.ops.graph.decimate(mode='ERROR', remove_error_margin=0.000005)
-                bpy.ops.object.mode_set(mode='OBJECT')
-                bpy.context.area.type = current_area_type
-
-                # Get the sanitized action name without tags
-                action_name = sanitize_filename(remove_tags(temp_action.name))
-
-                # Select the currently active armature if its name starts with "Bip01" or "Bip01."
-                current_armature = context.object
-                if current_armature and current_armature.type == 'ARMATURE':
-                    original_name = current_armature.name  # Save the original name
-                    if not (current_armature.name.startswith('Bip01') or current_armature.name.startswith('Bip01.')):
-                        current_armature.name = "Bip01"  # Temporarily rename the armature
-
-                    try:
-                        bpy.context.view_layer.objects.active = current_armature
-                        current_armature.select_set(True)
-
-                        # Export the object
-                        export_path = f"{export_folder}{action_name}.nif"
-                        print(f"Exporting animation to: {export_path}")
-                        bpy.ops.export_scene.mw(filepath=export_path, use_selection=True, export_animations=True, extract_keyframe_data=True)
-                    finally:
-                        # Restore the original name after export
-                        current_armature.name = original_name
+                first_frame, last_frame = temp_action.frame_range
+                clips = [(None, int(np.floor(first_frame)), int(np.ceil(last_frame)))]
+
+            for c, (group, clip_start, clip_stop) in enumerate(clips):
+                yield 0.85 + 0.15 * c / len(clips), f"Exporting {group or action_name}"
+                if group is None:
+                    clip_action = temp_action
+                    file_name = action_name
                 else:
-                    self.report({'ERROR'}, "No valid armature selected or active armature name does not start with 'Bip01' or 'Bip01.'.")
-                    return {'CANCELLED'}
-            finally:
-                # Ensure the reference armature is removed from the scene
-                remove_object_from_scene(reference_armature_name)
-
-        else:
-            self.report({'ERROR'}, "No animation action found on the current object.")
-            return {'CANCELLED'}
-
-        self.report({'INFO'}, "Animation exported successfully.")
-        return {'FINISHED'}
-
-class TransferToBeastsOperator(bpy.types.Operator):
-    bl_idname = "export.transfer_to_beasts"
-    bl_label = "Transfer to Beasts"
-    bl_description = "Retarget the current animation for beast armatures. A beast retargeting rig will be imported. You can export animation straight from the beast rig if you feel satisfied with the result."
-    bl_options = {'REGISTER', 'UNDO'}
-
-    def execute(self, context):
-        # Access the current object and its action
-        obj = context.object
-        if not obj or not obj.animation_data or not obj.animation_data.action:
-            self.report({'ERROR'}, "No animation action found on the current object.")
-            return {'CANCELLED'}
-
-        original_action = obj.animation_data.action
-        original_action_name = original_action.name
-
-        # Ensure the action has the '[Raw]' tag
-        if not has_raw_tag(original_action_name):
-            self.report({'ERROR'}, "The action does not contain the '[Raw]' tag. Aborting operation.")
+                    clip_action = slice_action(temp_action, clip_start, clip_stop)
+                    clip_action.name = f"{temp_action.name} [{group}]"
+                    current_armature.animation_data.action = clip_action
+                    file_name = f"{action_name}_{sanitize_filename(group)}"
+
+                frame_range = (scene.frame_start, scene.frame_end)
+                scene.frame_start, scene.frame_end = clip_start, clip_stop
+                try:
+                    decimate_action(clip_action)
+                    export_armature(current_armature, f"{export_folder}{file_name}.nif")
+                finally:
+                    scene.frame_start, scene.frame_end = frame_range
+                    if clip_action != temp_action:
+                        current_armature.animation_data.action = temp_action
+                        bpy.data.actions.remove(clip_action)
+        finally:
+            # Ensure the reference armature is removed from the scene
+            remove_object_from_scene(reference_armature_name)
+
+        if has_raw_tag(original_action_name) and "[Baked]" not in original_action_name:
+            # Keep the bake as "[Baked] ...", replacing the result of the previous export
+            promote_scratch_action(temp_action, replace_raw_with_baked(original_action_name))
+            temp_action = None
+        result = {'FINISHED'}
+    finally:
+        if result != {'FINISHED'}:
+            # Failed or cancelled, roll back to the state before the export
+            if bpy.context.object and bpy.context.object.mode != 'OBJECT':
+                bpy.ops.object.mode_set(mode='OBJECT')
+            scene.frame_start, scene.frame_end = original_frame_range
+        obj.animation_data.action = original_action
+        if temp_action:
+            bpy.data.actions.remove(temp_action)
+        remove_orphan_scratch_actions()
+
+    operator.report({'INFO'}, f"Animation exported successfully. Corrected {sign_flips} quaternion sign flips.")
+    return result
+
+def parse_beast_targets(text):
+    """Parse the beast skeletons preference, a comma-separated list of 'Prefix' or 'Prefix=Label' entries.
+
+    Prefix names the '<Prefix> Armature', '<Prefix> Retarget Driver Armature' and '<Prefix> Default Stance'
+    of the reference file, Label is used in the baked action's name. Returns (prefix, label) pairs."""
+    targets = []
+    for entry in text.split(','):
+        prefix, _, label = entry.partition('=')
+        if prefix.strip():
+            targets.append((prefix.strip(), label.strip() or prefix.strip()))
+    return targets
+
+def transfer_to_beasts(operator, context):
+    """Bake the current action and retarget it to the beast armature. Runs TransferToBeastsOperator."""
+    # Access the current object and its action
+    obj = context.object
+    if not obj or not obj.animation_data or not obj.animation_data.action:
+        operator.report({'ERROR'}, "No animation action found on the current object.")
+        return {'CANCELLED'}
+
+    original_action = obj.animation_data.action
+    original_action_name = original_action.name
+
+    # Ensure the action has the '[Raw]' tag
+    if not has_raw_tag(original_action_name):
+        operator.report({'ERROR'}, "The action does not contain the '[Raw]' tag. Aborting operation.")
+        return {'CANCELLED'}
+
+    # Step 1: Bake the action for the current object
+    # The bake runs in a scratch copy, the "[Baked]" result of the previous transfer is only replaced once it succeeded
+    remove_orphan_scratch_actions()
+    cloned_action = copy_scratch_action(original_action, f"[Baked][Temp] {remove_tags(original_action_name)}")
+    obj.animation_data.action = cloned_action
+
+    keyframes = [kp.co[0] for fcurve in cloned_action.fcurves for kp in fcurve.keyframe_points]
+    start_frame = int(min(keyframes))
+    end_frame = int(max(keyframes))
+
+    bpy.context.scene.frame_start = start_frame
+    bpy.context.scene.frame_end = end_frame
+
+    try:
+        bake_action(context, obj, cloned_action, start_frame, end_frame)
+    except Exception:
+        bpy.data.actions.remove(cloned_action)
+        raise
+    finally:
+        obj.animation_data.action = original_action
+    promote_scratch_action(cloned_action, replace_raw_with_baked(original_action_name))
+
+    # Step 2: Retarget the baked action to every beast skeleton
+    targets = parse_beast_targets(context.preferences.addons[__package__].preferences.beast_targets)
+    if not targets:
+        operator.report({'ERROR'}, "No beast skeletons set in the add-on preferences.")
+        return {'CANCELLED'}
+
+    # Load the armatures of all targets from the reference file at once
+    armature_names = [name for prefix, _ in targets for name in (f"{prefix} Retarget Driver Armature", f"{prefix} Armature")]
+    missing_names = [name for name in armature_names if not bpy.data.objects.get(name)]
+    if missing_names:
+        load_objects_from_blend_bulk(refArmaturesFilePath, missing_names)
+
+    bpy.ops.object.mode_set(mode='OBJECT')
+    beast_armature = None
+    for prefix, label in targets:
+        driver_armature = bpy.data.objects.get(f"{prefix} Retarget Driver Armature")
+        beast_armature = bpy.data.objects.get(f"{prefix} Armature")
+        if not driver_armature or not beast_armature:
+            operator.report({'ERROR'}, f"Driver armature '{prefix} Retarget Driver Armature' or '{prefix} Armature' not found in external file.")
             return {'CANCELLED'}
+        driver_armature.animation_data.action = cloned_action
 
-        # Step 1: Bake the action for the current object
-        cloned_action = original_action.copy()
-        cloned_action.name = replace_raw_with_baked(original_action_name)
-        obj.animation_data.action = cloned_action
-
-        keyframes = [kp.co[0] for fcurve in cloned_action.fcurves for kp in fcurve.keyframe_points]
-        start_frame = int(min(keyframes))
-        end_frame = int(max(keyframes))
-
-        bpy.context.scene.frame_start = start_frame
-        bpy.context.scene.frame_end = end_frame
-
-        bpy.ops.nla.bake(frame_start=start_frame, frame_end=end_frame, only_selected=False, visual_keying=True, clear_constraints=False, clear_parents=False, use_current_action=True, bake_types={'POSE'})
-        bpy.ops.nla.bake(frame_start=start_frame, frame_end=end_frame, only_selected=False, visual_keying=True, clear_constraints=False, clear_parents=False, use_current_action=True, bake_types={'OBJECT'})
-        set_interpolation_to_linear(cloned_action)
-        
-        # Load related armatures
-        driver_armature = bpy.data.objects.get("Khajiit Retarget Driver Armature")
-        khajiit_armature = bpy.data.objects.get("Khajiit Armature")
-        if not driver_armature and not khajiit_armature:
-            driver_armature, khajiit_armature = load_objects_from_blend_bulk(refArmaturesFilePath, ["Khajiit Retarget Driver Armature","Khajiit Armature"])
-            if not driver_armature or not khajiit_armature:
-                self.report({'ERROR'}, "Driver armature 'Khajiit Retarget Driver Armature' or 'Khajiit Armature' not found in external file.")
-                return {'CANCELLED'}      
-        
-        driver_armature.animation_data.action = cloned_action        
-        
-        # Set the Khajiit armature's action to "Khajiit Default Stance" if it exists
-        default_stance_action = bpy.data.actions.get("Khajiit Default Stance")
-        if default_stance_action:
-            khajiit_armature.animation_data.action = default_stance_action
-        else:
-            self.report({'ERROR'}, "Can't find Khajiit Default Stance action. It should've been imported together with Khajiit armature. Can't continue.")
+        # Set the beast armature's action to its default stance
+        default_stance_action = bpy.data.actions.get(f"{prefix} Default Stance")
+        if not default_stance_action:
+            operator.report({'ERROR'}, f"Can't find {prefix} Default Stance action. It should've been imported together with {prefix} armature. Can't continue.")
             return {'CANCELLED'}
+        beast_armature.animation_data.action = default_stance_action
 
-        # Bake the action for the Khajiit armature
-        bpy.ops.object.mode_set(mode='OBJECT')
+        # Bake the action for the beast armature
         bpy.ops.object.select_all(action='DESELECT')
-        bpy.context.view_layer.objects.active = khajiit_armature
-        khajiit_armature.select_set(True)
+        bpy.context.view_layer.objects.active = beast_armature
+        beast_armature.select_set(True)
         bpy.ops.object.mode_set(mode='POSE')
 
         bpy.ops.nla.bake(frame_start=start_frame, frame_end=end_frame, only_selected=False, visual_keying=True, clear_constraints=False, clear_parents=False, use_current_action=False, bake_types={'POSE'})
         bpy.ops.nla.bake(frame_start=start_frame, frame_end=end_frame, only_selected=False, visual_keying=True, clear_constraints=False, clear_parents=False, use_current_action=True, bake_types={'OBJECT'})
+        bpy.ops.object.mode_set(mode='OBJECT')
 
-        # Rename the baked action for the Khajiit armature
-        baked_action = khajiit_armature.animation_data.action
+        # Rename the baked action for the beast armature
+        baked_action = beast_armature.animation_data.action
         if baked_action:
-            baked_action.name = f"[Baked][Beast] Beast {remove_tags(original_action_name)}"
+            # Replace the beast action of the previous transfer instead of adding a .001 copy
+            promote_scratch_action(baked_action, f"[Baked][Beast] {label} {remove_tags(original_action_name)}")
 
             # Transfer markers from the original action to the baked action
             if original_action and original_action.pose_markers:
@@ -303,11 +972,10 @@ class TransferToBeastsOperator(bpy.types.Operator):
                     new_marker = baked_action.pose_markers.new(name=marker.name)
                     new_marker.frame = marker.frame
 
-        # Ensure the Khajiit armature is selected and active
-        bpy.ops.object.mode_set(mode='OBJECT')
-        bpy.ops.object.select_all(action='DESELECT')
-        khajiit_armature.select_set(True)
-        bpy.context.view_layer.objects.active = khajiit_armature
+    # Ensure the last beast armature is selected and active
+    bpy.ops.object.select_all(action='DESELECT')
+    beast_armature.select_set(True)
+    bpy.context.view_layer.objects.active = beast_armature
 
-        self.report({'INFO'}, "Transfer to Beasts completed successfully.")
-        return {'FINISHED'}
+    operator.report({'INFO'}, f"Transfer to {len(targets)} beast skeleton(s) completed successfully.")
+    return {'FINISHED'}
@@ -1,208 +1,413 @@
 import bpy
 from bpy.app.handlers import persistent
-from .utils import ik_maps, is_bizarre_armature, build_ik_map, is_auto_posing_bone, is_transformable_auto_posing_bone, apply_visual_transform, toggle_ik
+from .utils import clear_rig_caches, refresh_rig_caches, bone_role_tables, prewarm_rig_caches, ROLE_AUTOPOSE, get_bones_with_role, ik_maps, is_bizarre_armature, build_ik_map, get_ghost_bones, fetch_constraints_from_reference, apply_quaternion_from_reference, is_auto_posing_bone, is_transformable_auto_posing_bone, apply_visual_transform, toggle_ik
 
-ignoreDepsgraphUpdate = False
-previous_is_manipulated = False
-
-def fetch_constraints_from_reference(reference_armature, target_armature, bone_name):
-    """Fetch constraints from the reference armature and apply them to the target armature's bone."""
-    ref_bone = reference_armature.pose.bones.get(bone_name)
-    target_bone = target_armature.pose.bones.get(bone_name)    
+import sys
+import time
 
-    if not ref_bone or not target_bone:
-        return
+ignoreDepsgraphUpdate = False
 
-    # Remove existing constraints from the target bone
-    while target_bone.constraints:
-        target_bone.constraints.remove(target_bone.constraints[0])
-
-    # Copy constraints from the reference bone
-    for ref_constraint in ref_bone.constraints:
-        new_constraint = target_bone.constraints.new(type=ref_constraint.type)
-        for attr in dir(ref_constraint):
-            if not attr.startswith("_") and hasattr(new_constraint, attr):
-                try:
-                    setattr(new_constraint, attr, getattr(ref_constraint, attr))
-                except AttributeError:
-                    pass
-
-        # Update target to point to the target armature
-        if hasattr(new_constraint, "target"):
-            new_constraint.target = target_armature
-
-        # A lazy fix for a case when reference armature uses empty objects for autoposing targets instead of bones.
-        # I've updated main armature to use bones, but I don't want to update the reference armature.
-        if hasattr(new_constraint, "subtarget") and ref_constraint.target and not isinstance(ref_constraint.target.data, bpy.types.Armature):
-            new_constraint.subtarget = f"Bip01 {ref_constraint.target.name}"
-
-def apply_quaternion_from_reference(reference_armature, target_armature, bone_name):
-    """Apply quaternion rotation from the reference armature to the target armature's bone."""
-    ref_bone = reference_armature.pose.bones.get(bone_name)
-    target_bone = target_armature.pose.bones.get(bone_name)
-
-    if ref_bone and target_bone:
-        target_bone.rotation_quaternion = ref_bone.rotation_quaternion
+# Number of depsgraph updates seen by check_manipulation and the time spent in it
+update_stats = {"updates": 0, "seconds": 0.0}
+
+# Object count on the last check for Bizarre rigs, see track_rig_edits
+watched_object_count = -1
+
+# Armatures that were being manipulated on the previous update
+manipulation_states = {}
+
+# Rigs whose autopose weights are calibrated by a timer, see schedule_autopose_calibration
+pending_calibrations = set()
+
+# Remaining steps of the cache pre-warm after a file load, see prewarm_caches
+prewarm_steps = None
+
+# Time a single run of the pre-warm timer may take
+PREWARM_SLICE_SECONDS = 0.005
+
+def is_transform_active(wm):
+    """Check if any transform operator is running in any window."""
+    for w in wm.windows:
+        for operator in w.modal_operators:
+            if operator.bl_idname in {'TRANSFORM_OT_translate', 'TRANSFORM_OT_rotate', 'TRANSFORM_OT_resize'}:
+                return True
+    return False
+
+def is_playing_back(wm):
+    """Check if the timeline is playing or being scrubbed in any window."""
+    for w in wm.windows:
+        screen = w.screen
+        if screen and (screen.is_animation_playing or screen.is_scrubbing):
+            return True
+    return False
+
+def use_precomputed_autopose():
+    """Check if autopose should be solved from precomputed weights instead of reference constraints."""
+    addon = bpy.context.preferences.addons.get(__package__)
+    return addon is not None and addon.preferences.autopose_solver == 'WEIGHTS'
+
+def get_manipulated_rigs(context):
+    """Return a map of Bizarre armatures with selected pose bones to those selected bones."""
+    manipulated = {}
+    for bone in context.selected_pose_bones or ():
+        armature = bone.id_data
+        if armature not in manipulated:
+            if not is_bizarre_armature(armature):
+                continue
+            manipulated[armature] = []
+        manipulated[armature].append(bone)
+    return manipulated
 
 @persistent
 def check_manipulation(scene, depsgraph):
-    global previous_is_manipulated, ignoreDepsgraphUpdate
-
+    start = time.perf_counter()
+    try:
+        update_manipulation()
+    finally:
+        update_stats["updates"] += 1
+        update_stats["seconds"] += time.perf_counter() - start
+
+def update_manipulation():
     if ignoreDepsgraphUpdate:
         return
 
-    wm = bpy.context.window_manager
-    armature = bpy.context.object
+    context = bpy.context
 
-    # Do nothing if "This Rig is Bizarre" is OFF
-    if not is_bizarre_armature(armature):
+    # Playback and scrubbing update the depsgraph every frame, but nothing can be dragged meanwhile
+    if not manipulation_states and is_playing_back(context.window_manager):
         return
-    
-    # Collect IK chain bones
-    if armature not in ik_maps:
-        build_ik_map(armature)
 
-    reference_armature = bpy.data.objects.get("Autopose Reference Armature")
-
-    if armature and armature.type == 'ARMATURE':
-        is_manipulated = False
-
-        # Check if any transform operator is active
-        for w in wm.windows:
-            for operator in w.modal_operators:
-                if operator.bl_idname in {'TRANSFORM_OT_translate', 'TRANSFORM_OT_rotate', 'TRANSFORM_OT_resize'}:
-                    is_manipulated = True
+    manipulated = get_manipulated_rigs(context) if is_transform_active(context.window_manager) else {}
 
+    # Nothing is dragged now and nothing was dragged before - nothing to do
+    if not manipulated and not manipulation_states:
+        return
 
-    
-        # Ensure that autopose bones cant be manipulated
-        if is_manipulated:
-            reference_armature = bpy.data.objects.get("Autopose Reference Armature")
-            if not reference_armature:
-                return
+    reference_armature = bpy.data.objects.get("Autopose Reference Armature")
 
-            selected_bones = bpy.context.selected_pose_bones
-            if not selected_bones:
-                return
+    # Only rigs that are manipulated now or were manipulated on the previous update need processing
+    for armature in set(manipulated) | set(manipulation_states):
+        try:
+            update_rig_manipulation(armature, armature in manipulated, manipulated.get(armature, ()), reference_armature)
+        except ReferenceError:
+            # The rig was removed while being manipulated
+            manipulation_states.pop(armature, None)
+
+def update_rig_manipulation(armature, is_manipulated, selected_bones, reference_armature):
+    """Process one rig, applying state transitions when its manipulation state changed."""
+    global ignoreDepsgraphUpdate
+    # Collect IK chain bones
+    if armature not in ik_maps:
+        build_ik_map(armature)
 
-            for bone in selected_bones:
-                if bone.bone.auto_posing and is_auto_posing_bone(bone) and not is_transformable_auto_posing_bone(bone):
-                    # Reset the bone's rotation using the reference armature
-                    apply_quaternion_from_reference(reference_armature, armature, bone.name)
-                    
+    previous_is_manipulated = manipulation_states.get(armature, False)
+    use_weights = use_precomputed_autopose()
+
+    # Ensure that autopose bones cant be manipulated
+    if is_manipulated:
+        if not reference_armature:
+            return
+
+        for bone in selected_bones:
+            if bone.bone.auto_posing and is_auto_posing_bone(bone) and not is_transformable_auto_posing_bone(bone):
+                # Reset the bone's rotation using the reference armature
+                apply_quaternion_from_reference(reference_armature, armature, bone.name)
+
+        # Solve autopose directly from the IK targets, calibrating the weights on the first drag
+        if use_weights:
+            from .autopose_solver import begin_autopose_drag, solve_autopose
+            ignoreDepsgraphUpdate = True
+            try:
+                if not previous_is_manipulated and not begin_autopose_drag(armature, reference_armature):
+                    # Not calibrated yet, that takes many evaluations of the rig and can't run in this handler
+                    schedule_autopose_calibration(armature)
+                solve_autopose(armature, {
+                    bone.name for bone in get_bones_with_role(armature, ROLE_AUTOPOSE)
+                    if bone.bone.auto_posing
+                })
+            finally:
+                ignoreDepsgraphUpdate = False
 
         # Handle ghost bones during manipulation
         # This is a very sneaky way to sometimes force blender to not break in dependency cycles
         # the ghost bone always closely follows the parent, but during manipulation (when all complicated autoposing is active)
         # it is snapped to parent via python instead, without the use of constraint. This migh help blender not break down parts of the
         # armature/mesh due to constraint dependency cycles.
-        for bone in armature.pose.bones:
-            if bone.name.startswith("[Ghost] "):  # Check if the bone is a ghost bone
-                target_bone_name = bone.name.replace("[Ghost] ", "")
-                target_bone = armature.pose.bones.get(target_bone_name)
-
-                if is_manipulated:
-                    # Remove child-of constraint from the ghost bone
-                    for constraint in bone.constraints:
-                        if constraint.type == 'CHILD_OF':
-                            bone.constraints.remove(constraint)
-                            # print(f"Removed child-of constraint from ghost bone '{bone.name}'")
-
-                    # Snap ghost bone's position to the target bone's position
-                    if target_bone:
-                        bone.matrix = target_bone.matrix
-                        # print(f"Snapped ghost bone '{bone.name}' to target bone '{target_bone_name}'")
-
-        # Only proceed if the manipulation state has changed
-        if is_manipulated != previous_is_manipulated:
-            previous_is_manipulated = is_manipulated
-
-            if not is_manipulated:
-                # Handle ghost bones when manipulation ends                
-                for bone in armature.pose.bones:
-                    if bone.name.startswith("[Ghost] "):  # Check if the bone is a ghost bone
-                        target_bone_name = bone.name.replace("[Ghost] ", "")
-                        target_bone = armature.pose.bones.get(target_bone_name)
-
-                        # Snap ghost bone's position to the target bone's position
-                        if target_bone:
-                            bone.matrix = target_bone.matrix
-                            # print(f"Snapped ghost bone '{bone.name}' to target bone '{target_bone_name}'")
-
-                        # Re-add child-of constraint to the ghost bone
-                        if target_bone:
-                            child_of_constraint = bone.constraints.new(type='CHILD_OF')
-                            child_of_constraint.target = armature
-                            child_of_constraint.subtarget = target_bone.name
-                            # print(f"Re-added child-of constraint to ghost bone '{bone.name}' targeting '{target_bone_name}'")
-
-                # Collect all bones that need their transforms applied
-                bones_to_apply = []
-
-                # Collect auto-posing bones
-                if reference_armature:
-                    bones_to_apply.extend([
-                        bone for bone in armature.pose.bones
-                        if bone.bone.auto_posing and is_auto_posing_bone(bone)
-                    ])
-                
-
-                for ik_data in ik_maps.get(armature, {}).values():
-                    ik_target_bone = ik_data['target_bone']
-                    chain_bones = ik_data['chain_bones']
-
-                    if ik_target_bone.bone.mode == 'MIXED_KINEMATICS':
-                        bones_to_apply.extend(chain_bones)
-
-                # Apply visual transform to all collected bones
-                # print("Applying all visual transforms")
-                apply_visual_transform(bones_to_apply)
-
-                # Handle auto-posing bones
-                for bone in bones_to_apply:
-                    if bone.bone.auto_posing and is_auto_posing_bone(bone):
-                        # Remove constraints from the bone
-                        while bone.constraints:
-                            bone.constraints.remove(bone.constraints[0])
-
-                # Handle IK chains
-                for ik_data in ik_maps.get(armature, {}).values():
-                    ik_target_bone = ik_data['target_bone']
-                    if ik_target_bone.bone.mode == 'MIXED_KINEMATICS':
-                        toggle_ik(ik_data, False)
-
-            else:
-                # Handle Auto-Posing bones during manipulation
-                if reference_armature:
-                    for bone in armature.pose.bones:
-                        if bone.bone.auto_posing and is_auto_posing_bone(bone):
-                            # Add constraints from the reference armature
-                            fetch_constraints_from_reference(reference_armature, armature, bone.name)
-
-                            # Fetch quaternion rotation from the reference armature
-                            if not is_transformable_auto_posing_bone(bone):
-                                apply_quaternion_from_reference(reference_armature, armature, bone.name)
-
-                # Handle IK chains during manipulation
-                for ik_data in ik_maps.get(armature, {}).values():
-                    ik_constraint_bone = ik_data['constraint_bone']
-                    ik_target_bone = ik_data['target_bone']
-                    leaf_bone = ik_data['leaf_bone']
-
-                    if ik_target_bone.bone.mode == 'MIXED_KINEMATICS':
-                        toggle_ik(ik_data, True)
+        for bone, target_bone in get_ghost_bones(armature):
+            # Remove child-of constraint from the ghost bone
+            for constraint in bone.constraints:
+                if constraint.type == 'CHILD_OF':
+                    bone.constraints.remove(constraint)
+
+            # Snap ghost bone's position to the target bone's position
+            if target_bone:
+                bone.matrix = target_bone.matrix
+
+    # Only proceed if the manipulation state has changed
+    if is_manipulated == previous_is_manipulated:
+        return
 
+    if is_manipulated:
+        manipulation_states[armature] = True
+    else:
+        manipulation_states.pop(armature, None)
+
+    if not is_manipulated:
+        # Handle ghost bones when manipulation ends
+        for bone, target_bone in get_ghost_bones(armature):
+            if target_bone:
+                # Snap ghost bone's position to the target bone's position
+                bone.matrix = target_bone.matrix
+
+                # Re-add child-of constraint to the ghost bone
+                child_of_constraint = bone.constraints.new(type='CHILD_OF')
+                child_of_constraint.target = armature
+                child_of_constraint.subtarget = target_bone.name
+
+        # Collect all bones that need their transforms applied
+        bones_to_apply = []
+
+        # Collect auto-posing bones, precomputed autopose already wrote their rotations
+        if use_weights:
+            from .autopose_solver import end_autopose_drag
+            end_autopose_drag(armature)
+        elif reference_armature:
+            bones_to_apply.extend([
+                bone for bone in get_bones_with_role(armature, ROLE_AUTOPOSE)
+                if bone.bone.auto_posing
+            ])
+
+        for ik_data in ik_maps.get(armature, {}).values():
+            ik_target_bone = ik_data['target_bone']
+            chain_bones = ik_data['chain_bones']
+
+            if ik_target_bone.bone.mode == 'MIXED_KINEMATICS':
+                bones_to_apply.extend(chain_bones)
+
+        # Apply visual transform to all collected bones
+        apply_visual_transform(bones_to_apply)
+
+        # Handle auto-posing bones
+        for bone in bones_to_apply:
+            if bone.bone.auto_posing and is_auto_posing_bone(bone):
+                # Remove constraints from the bone
+                while bone.constraints:
+                    bone.constraints.remove(bone.constraints[0])
+
+        # Handle IK chains
+        for ik_data in ik_maps.get(armature, {}).values():
+            ik_target_bone = ik_data['target_bone']
+            if ik_target_bone.bone.mode == 'MIXED_KINEMATICS':
+                toggle_ik(ik_data, False)
+
+    else:
+        # Handle Auto-Posing bones during manipulation
+        if reference_armature and not use_weights:
+            for bone in get_bones_with_role(armature, ROLE_AUTOPOSE):
+                if bone.bone.auto_posing:
+                    # Add constraints from the reference armature
+                    fetch_constraints_from_reference(reference_armature, armature, bone.name)
+
+                    # Fetch quaternion rotation from the reference armature
+                    if not is_transformable_auto_posing_bone(bone):
+                        apply_quaternion_from_reference(reference_armature, armature, bone.name)
+
+        # Handle IK chains during manipulation
+        for ik_data in ik_maps.get(armature, {}).values():
+            ik_target_bone = ik_data['target_bone']
+
+            if ik_target_bone.bone.mode == 'MIXED_KINEMATICS':
+                toggle_ik(ik_data, True)
+
+
+def scene_has_bizarre_rig():
+    return any(is_bizarre_armature(obj) for obj in bpy.data.objects if obj.type == 'ARMATURE')
+
+def update_handler_registration():
+    """Attach check_manipulation only while the file contains a Bizarre rig.
+
+    Must not run from inside a depsgraph handler, Blender is iterating the handler list then,
+    see schedule_handler_registration."""
+    global watched_object_count
+    watched_object_count = len(bpy.data.objects)
+    handlers = bpy.app.handlers.depsgraph_update_post
+
+    if scene_has_bizarre_rig():
+        if check_manipulation not in handlers:
+            handlers.append(check_manipulation)
+    elif check_manipulation in handlers:
+        handlers.remove(check_manipulation)
+
+def schedule_handler_registration():
+    """Run update_handler_registration right after the current depsgraph update."""
+    if not bpy.app.timers.is_registered(update_handler_registration):
+        bpy.app.timers.register(update_handler_registration, first_interval=0.0)
 
+@persistent
+def track_rig_edits(scene, depsgraph):
+    start = time.perf_counter()
+    try:
+        update_rig_edits(depsgraph)
+    finally:
+        # Both handlers run on the same updates, only count the update once
+        if check_manipulation not in bpy.app.handlers.depsgraph_update_post:
+            update_stats["updates"] += 1
+        update_stats["seconds"] += time.perf_counter() - start
+
+def update_rig_edits(depsgraph):
+    """Drop the caches of rigs whose bones or limb constraints were edited outside of a drag,
+    and recheck whether check_manipulation is needed when objects are added or removed or a rig changed.
+
+    Rigs are only hashed on armature data updates and on geometry updates of armature objects
+    (constraint edits), not on the transform-only updates of posing, keying and frame changes."""
+    if ignoreDepsgraphUpdate or manipulation_states:
+        return
+    armature_updated = depsgraph.id_type_updated('ARMATURE')
+    if not armature_updated and not depsgraph.id_type_updated('OBJECT') and not depsgraph.id_type_updated('COLLECTION'):
+        return
+    wm = bpy.context.window_manager
+    if is_playing_back(wm) or is_transform_active(wm):
+        return  # Posing doesn't change what the caches are built from
+
+    changed = len(bpy.data.objects) != watched_object_count
+    for update in depsgraph.updates:
+        updated = update.id.original
+        if isinstance(updated, bpy.types.Armature):
+            armatures = list(bone_role_tables)
+        elif isinstance(updated, bpy.types.Object) and updated.type == 'ARMATURE' and update.is_updated_geometry:
+            armatures = [updated]
+        else:
+            continue
+        for armature in armatures:
+            try:
+                if armature.data == updated or armature == updated:
+                    changed |= refresh_rig_caches(armature)
+            except ReferenceError:
+                bone_role_tables.pop(armature, None)  # The object was removed
+                changed = True
+    if changed:
+        schedule_handler_registration()
+
+def calibrate_autopose(armature):
+    """Calibrate the precomputed autopose weights of a rig, if that solver is used and the reference armature exists."""
+    global ignoreDepsgraphUpdate
+    reference_armature = bpy.data.objects.get("Autopose Reference Armature")
+    if not reference_armature or not use_precomputed_autopose() or not is_bizarre_armature(armature):
+        return
+    from .autopose_solver import get_autopose_weights
+    ignoreDepsgraphUpdate = True
+    try:
+        get_autopose_weights(armature, reference_armature)
+    finally:
+        ignoreDepsgraphUpdate = False
+
+def calibrate_pending_autopose():
+    """Timer calibrating the rigs that were dragged before their autopose weights existed."""
+    if manipulation_states:
+        return 0.1  # Calibration poses the rig, wait for the drag to end
+    while pending_calibrations:
+        try:
+            calibrate_autopose(pending_calibrations.pop())
+        except ReferenceError:
+            pass  # The rig was removed meanwhile
+    return None
+
+def schedule_autopose_calibration(armature):
+    pending_calibrations.add(armature)
+    if not bpy.app.timers.is_registered(calibrate_pending_autopose):
+        bpy.app.timers.register(calibrate_pending_autopose, first_interval=0.0)
+
+def iterate_prewarm_steps():
+    for armature in [obj for obj in bpy.data.objects if obj.type == 'ARMATURE']:
+        yield from prewarm_rig_caches(armature)
+        calibrate_autopose(armature)
+        yield
+
+def prewarm_caches():
+    """Timer building the rig caches of the file in small time slices, so the first drag doesn't pay for them."""
+    global prewarm_steps
+    if prewarm_steps is None:
+        return None
+    deadline = time.perf_counter() + PREWARM_SLICE_SECONDS
+    try:
+        while time.perf_counter() < deadline:
+            next(prewarm_steps)
+    except (StopIteration, ReferenceError):
+        # Done, or an armature was removed meanwhile and the rest is built on demand
+        prewarm_steps = None
+        return None
+    return 0.01
+
+def start_prewarm():
+    global prewarm_steps
+    prewarm_steps = iterate_prewarm_steps()
+    if not bpy.app.timers.is_registered(prewarm_caches):
+        bpy.app.timers.register(prewarm_caches, first_interval=0.0)
+
+def clear_caches():
+    """Drop the caches keyed by armatures of the previous file."""
+    manipulation_states.clear()
+    pending_calibrations.clear()
+    clear_rig_caches()
+    # Caches of the modules that are only loaded once they're needed
+    for module_name, cache_names in (("ik_solver", ("chain_rest_caches",)), ("autopose_solver", ("drag_start_states", "autopose_weights")), ("exporter", ("bake_records",))):
+        module = sys.modules.get(f"{__package__}.{module_name}")
+        for cache_name in cache_names if module else ():
+            getattr(module, cache_name).clear()
 
+@persistent
+def update_handler_registration_on_load(dummy):
+    clear_caches()
+    update_handler_registration()
+    start_prewarm()
 
-def register():
-    if not check_manipulation in bpy.app.handlers.depsgraph_update_post:
-        bpy.app.handlers.depsgraph_update_post.append(check_manipulation)  # Register handler
-    
+@persistent
+def on_playback_start(scene, depsgraph):
+    """Detach the manipulation handler for the duration of playback.
 
-def unregister():
+    Constraints are left alone: ghost bones break dependency cycles, other bones depend on them while playing too."""
+    if manipulation_states:
+        return
     if check_manipulation in bpy.app.handlers.depsgraph_update_post:
-        bpy.app.handlers.depsgraph_update_post.remove(check_manipulation)  # Unregister handler
+        bpy.app.handlers.depsgraph_update_post.remove(check_manipulation)
+
+@persistent
+def on_playback_stop(scene, depsgraph):
+    """Re-attach the manipulation handler if the file still needs it."""
+    schedule_handler_registration()
+
+def get_update_overhead():
+    """Return the number of handled depsgraph updates and the average time spent per update, in seconds."""
+    updates = update_stats["updates"]
+    return updates, update_stats["seconds"] / updates if updates else 0.0
 
+def register():
+    if update_handler_registration_on_load not in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.append(update_handler_registration_on_load)
+    # bpy.data can't be accessed while the add-on is being registered, check the file right after
+    schedule_handler_registration()
+    bpy.app.timers.register(start_prewarm, first_interval=0.0)
+    if track_rig_edits not in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.append(track_rig_edits)
+    # Playback handlers are missing in older Blender versions, playback is then detected in check_manipulation
+    if hasattr(bpy.app.handlers, "animation_playback_pre"):
+        if on_playback_start not in bpy.app.handlers.animation_playback_pre:
+            bpy.app.handlers.animation_playback_pre.append(on_playback_start)
+        if on_playback_stop not in bpy.app.handlers.animation_playback_post:
+            bpy.app.handlers.animation_playback_post.append(on_playback_stop)
 
 
+def unregister():
+    for timer in (prewarm_caches, update_handler_registration, calibrate_pending_autopose):
+        if bpy.app.timers.is_registered(timer):
+            bpy.app.timers.unregister(timer)
+    if update_handler_registration_on_load in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(update_handler_registration_on_load)
+    if hasattr(bpy.app.handlers, "animation_playback_pre"):
+        if on_playback_start in bpy.app.handlers.animation_playback_pre:
+            bpy.app.handlers.animation_playback_pre.remove(on_playback_start)
+        if on_playback_stop in bpy.app.handlers.animation_playback_post:
+            bpy.app.handlers.animation_playback_post.remove(on_playback_stop)
+    for handler in (check_manipulation, track_rig_edits):
+        if handler in bpy.app.handlers.depsgraph_update_post:
+            bpy.app.handlers.depsgraph_update_post.remove(handler)  # Unregister handler
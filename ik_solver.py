@@ -0,0 +1,156 @@
+import numpy as np
+from .core import matrices_to_quaternions, solve_two_bone_ik
+from .utils import get_rest_pose_cache
+
+# Analytic two-bone IK for the limb chains of the Bizarre rig (upper arm/forearm, thigh/calf).
+# Solves the same problem as the limb IK constraints directly in NumPy and for many frames at once.
+# Its FK inputs (chain parents, IK targets, poles) come from utils.sample_fk_pose_matrices, which reads them
+# from the fcurves, so converting IK to FK needs neither depsgraph evaluation nor toggling the constraints.
+# The solver itself is core.solve_two_bone_ik, this module feeds it with the rig's chain data.
+# benchmarks/check_ik_solver.py compares the result with the IK constraints.
+
+# Rest data per armature and chain, see get_chain_rest_data
+chain_rest_caches = {}
+
+def is_supported_bone(pose_bone):
+    """Check that a chain bone has no IK settings the analytic solver ignores: locks, limits, stiffness or stretch."""
+    return not (
+        pose_bone.lock_ik_x or pose_bone.lock_ik_y or pose_bone.lock_ik_z
+        or pose_bone.use_ik_limit_x or pose_bone.use_ik_limit_y or pose_bone.use_ik_limit_z
+        or pose_bone.ik_stiffness_x or pose_bone.ik_stiffness_y or pose_bone.ik_stiffness_z
+        or pose_bone.ik_stretch
+    )
+
+def is_supported_leaf(armature, ik_data):
+    """Check that the leaf bone plainly copies the world rotation of the IK target, as the solver assumes."""
+    leaf = ik_data['leaf_bone']
+    target = ik_data['target_bone']
+    for constraint in leaf.constraints if leaf else ():
+        if constraint.mute:
+            continue
+        if not (constraint.type == 'COPY_ROTATION' and constraint.target == armature and constraint.subtarget == target.name
+                and constraint.influence == 1.0 and constraint.use_x and constraint.use_y and constraint.use_z
+                and not (constraint.invert_x or constraint.invert_y or constraint.invert_z) and constraint.mix_mode == 'REPLACE'
+                and constraint.target_space == 'WORLD' and constraint.owner_space == 'WORLD'):
+            return False
+    return True
+
+def is_plain_fk(pose_bone):
+    """Check that a bone and its parents have no active constraints, so their pose follows from the fcurves alone."""
+    while pose_bone:
+        if any(not constraint.mute and constraint.influence > 0.0 for constraint in pose_bone.constraints):
+            return False
+        pose_bone = pose_bone.parent
+    return True
+
+def is_supported_chain(armature, ik_data):
+    """Check that the analytic solver models everything the chain's IK constraint does.
+
+    It solves a two-bone chain reaching a bone of the same armature with its tail, at full influence, with the
+    legacy IK solver and without locks, limits or stretching (use_stretch does nothing while the bones' ik_stretch is 0).
+    The bones it reads from the fcurves (chain parents, target, pole) must not be constrained. Other chains have to be baked with their constraints."""
+    constraint = ik_data['constraint']
+    lower = ik_data['constraint_bone']
+    upper = lower.parent
+    target = ik_data['target_bone']
+    pole_supported = constraint.pole_target is None or (constraint.pole_target == armature and constraint.pole_subtarget in armature.pose.bones)
+    return (
+        upper is not None and target is not None and constraint.target == armature and target.id_data == armature
+        and constraint.chain_count == 2 and constraint.use_tail and constraint.use_location and not constraint.use_rotation
+        and constraint.influence == 1.0 and constraint.weight == 1.0
+        and armature.pose.ik_solver == 'LEGACY' and pole_supported
+        and is_supported_bone(lower) and is_supported_bone(upper) and is_supported_leaf(armature, ik_data)
+        and is_plain_fk(upper.parent) and is_plain_fk(target)
+        and (constraint.pole_target is None or is_plain_fk(armature.pose.bones[constraint.pole_subtarget]))
+    )
+
+def get_chain_rest_data(armature, ik_data):
+    """Collect the data the analytic solver needs for an IK chain.
+
+    Rest data is cached until the armature's rest-pose cache is rebuilt. The constraint settings
+    (chain length, pole target, pole angle) are read live, so edits to the IK constraint apply immediately."""
+    lower = ik_data['constraint_bone']
+    upper = lower.parent
+    if upper is None or not is_supported_chain(armature, ik_data):
+        return None
+    constraint = ik_data['constraint']
+
+    cache = get_rest_pose_cache(armature)
+    key = (armature, lower.name)
+    data = chain_rest_caches.get(key)
+    if not data or data["rest_pose_cache"] is not cache:
+        leaf = ik_data['leaf_bone']
+        data = {
+            "rest_pose_cache": cache,
+            "upper": cache["index"][upper.name],
+            "lower": cache["index"][lower.name],
+            "leaf": cache["index"][leaf.name] if leaf else None,
+            "target": cache["index"][ik_data['target_bone'].name],
+            "lower_length": lower.bone.length,
+            "upper_rest": np.array(upper.bone.matrix_local, dtype=np.float64),
+            "lower_rest": np.array(lower.bone.matrix_local, dtype=np.float64),
+        }
+        chain_rest_caches[key] = data
+
+    pole_index = cache["index"][constraint.pole_subtarget] if constraint.pole_target else None
+    return dict(data, pole=pole_index, pole_angle=constraint.pole_angle)
+
+def get_chain_input_bones(armature, chains):
+    """Return the names of the FK bones the solver reads for the chains: chain parents, IK targets and poles."""
+    names = get_rest_pose_cache(armature)["names"]
+    parents = get_rest_pose_cache(armature)["parents"]
+    bone_names = set()
+    for ik_data in chains:
+        data = get_chain_rest_data(armature, ik_data)
+        if not data:
+            continue
+        if parents[data["upper"]] >= 0:
+            bone_names.add(names[parents[data["upper"]]])
+        bone_names.add(names[data["target"]])
+        if data["pole"] is not None:
+            bone_names.add(names[data["pole"]])
+    return sorted(bone_names)
+
+def solve_chain_rotations(armature, chains, pose_matrices):
+    """Solve the local rotations of IK chains analytically from sampled pose matrices.
+
+    pose_matrices is an (F, N, 4, 4) array of armature-space matrices in pose.bones order, as returned by
+    sample_fk_pose_matrices. Only the bones listed by get_chain_input_bones are read from it.
+    Returns a map of bone names to (F, 4) quaternions for the chain and leaf bones."""
+    cache = get_rest_pose_cache(armature)
+    rest_relative_inv = cache["rest_relative_inv"]
+    parents = cache["parents"]
+    names = cache["names"]
+
+    rotations = {}
+    for ik_data in chains:
+        data = get_chain_rest_data(armature, ik_data)
+        if not data:
+            continue  # Not a two-bone chain
+
+        upper, lower, leaf = data["upper"], data["lower"], data["leaf"]
+        root_parent = parents[upper]
+        if root_parent >= 0:
+            parent_pose = pose_matrices[:, root_parent]
+        else:
+            parent_pose = np.broadcast_to(np.identity(4), (len(pose_matrices), 4, 4))
+        root = (parent_pose @ np.linalg.inv(rest_relative_inv[upper]))[..., :3, 3]
+
+        target_pose = pose_matrices[:, data["target"]]
+        pole = pose_matrices[:, data["pole"], :3, 3] if data["pole"] is not None else None
+
+        upper_pose, lower_pose = solve_two_bone_ik(
+            root, target_pose[..., :3, 3], pole, data["pole_angle"],
+            data["upper_rest"], data["lower_rest"], data["lower_length"]
+        )
+
+        rotations[names[upper]] = matrices_to_quaternions(rest_relative_inv[upper] @ np.linalg.inv(parent_pose) @ upper_pose)
+        rotations[names[lower]] = matrices_to_quaternions(rest_relative_inv[lower] @ np.linalg.inv(upper_pose) @ lower_pose)
+
+        if leaf is not None:
+            # The leaf bone copies the rotation of the IK target and sits at the tip of the chain
+            leaf_pose = target_pose.copy()
+            leaf_pose[..., :3, 3] = (lower_pose @ np.linalg.inv(rest_relative_inv[leaf]))[..., :3, 3]
+            rotations[names[leaf]] = matrices_to_quaternions(rest_relative_inv[leaf] @ np.linalg.inv(lower_pose) @ leaf_pose)
+
+    return rotations
@@ -1,7 +1,10 @@
 import bpy
-from bpy.app.handlers import persistent
-from .utils import is_bizarre_armature, find_ik_chain_data, insert_keyframes_for_bones, ik_target_to_autopose_map, assign_bone_group, select_bone_group
-from .exporter import ExportAnimationOperator, TransferToBeastsOperator
+import numpy as np
+from .utils import (
+    is_bizarre_armature, ROLE_AUTOPOSE, get_bones_with_role, fetch_constraints_from_reference, apply_quaternion_from_reference, is_transformable_auto_posing_bone, find_ik_chain_data, insert_keyframes_for_bones, insert_keyframes_bulk, ik_target_to_autopose_map, assign_bone_group, select_bone_group,
+    ik_maps, build_ik_map, toggle_ik, saved_constraints_property, snapshot_constraint_states, set_all_constraints_mute, restore_constraint_states, get_keyed_frames, bake_chain_rotations, sample_fk_pose_matrices, write_rotation_keys, invalidate_rig_caches
+)
+from .core import align_quaternion_hemispheres
 
 class AutoPoseKeyframeOperator(bpy.types.Operator):
     bl_idname = "pose.autopose_insert_keyframe"
@@ -29,6 +32,218 @@ class AutoPoseKeyframeOperator(bpy.types.Operator):
 
         return {'PASS_THROUGH'}
 
+class AutoPoseKeyframeRangeOperator(bpy.types.Operator):
+    bl_idname = "pose.autopose_keyframe_range"
+    bl_label = "AutoPose Keyframe Range"
+    bl_description = "Key the IK chain and autopose bones of the selected IK controllers on many frames at once"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    frames: bpy.props.EnumProperty(
+        name="Frames",
+        description="Which frames to key",
+        items=[
+            ('KEYS', "Existing Keys", "Every frame on which the selected IK controllers are keyed"),
+            ('RANGE', "Frame Range", "Every step-th frame of the scene frame range"),
+        ],
+        default='KEYS'
+    )
+
+    step: bpy.props.IntProperty(
+        name="Step",
+        description="Distance between keys in Frame Range mode",
+        default=1,
+        min=1
+    )
+
+    def execute(self, context):
+        armature = context.object
+        if not is_bizarre_armature(armature):
+            self.report({'ERROR'}, "Active object is not a Bizarre armature.")
+            return {'CANCELLED'}
+
+        ik_targets = [bone for bone in context.selected_pose_bones or () if bone.name in ik_target_to_autopose_map]
+        if not ik_targets:
+            self.report({'ERROR'}, "Select at least one IK controller.")
+            return {'CANCELLED'}
+
+        bones_to_key = []
+        for ik_target in ik_targets:
+            ik_data = find_ik_chain_data(armature, ik_target)
+            if ik_data:
+                bones_to_key.extend(bone.name for bone in ik_data['chain_bones'])
+            bones_to_key.extend(ik_target_to_autopose_map[ik_target.name])
+        bones_to_key = list(dict.fromkeys(bones_to_key))
+
+        if self.frames == 'KEYS':
+            action = armature.animation_data.action if armature.animation_data else None
+            frames = get_keyed_frames(action, [bone.name for bone in ik_targets]) if action else []
+        else:
+            frames = np.arange(context.scene.frame_start, context.scene.frame_end + 1, self.step, dtype=np.float32)
+
+        if not len(frames):
+            self.report({'ERROR'}, "No frames to key.")
+            return {'CANCELLED'}
+
+        insert_keyframes_bulk(armature, bones_to_key, frames)
+        self.report({'INFO'}, f"Keyed {len(bones_to_key)} bone(s) on {len(frames)} frame(s).")
+        return {'FINISHED'}
+
+class BakeMixedKinematicsOperator(bpy.types.Operator):
+    bl_idname = "pose.bake_mixed_kinematics"
+    bl_label = "Bake Mixed Kinematics"
+    bl_description = "Convert the IK pose of the chosen limbs into FK rotation keys on every keyed frame of the current action"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    chains: bpy.props.EnumProperty(
+        name="Chains",
+        description="Which IK chains to convert",
+        items=[
+            ('MIXED', "Mixed Kinematics", "All chains whose IK controller is in Mixed Kinematics mode"),
+            ('SELECTED', "Selected", "Chains of the selected IK controllers"),
+        ],
+        default='MIXED'
+    )
+
+    solver: bpy.props.EnumProperty(
+        name="Solver",
+        description="How the IK pose is computed",
+        items=[
+            ('ANALYTIC', "Analytic", "Solve two-bone limbs directly, without evaluating the IK constraints. Limbs with IK settings the solver doesn't model are baked with their constraints"),
+            ('CONSTRAINTS', "Constraints", "Evaluate the rig's IK constraints on every frame"),
+        ],
+        default='ANALYTIC'
+    )
+
+    def execute(self, context):
+        armature = context.object
+        if not is_bizarre_armature(armature):
+            self.report({'ERROR'}, "Active object is not a Bizarre armature.")
+            return {'CANCELLED'}
+
+        action = armature.animation_data.action if armature.animation_data else None
+        if not action:
+            self.report({'ERROR'}, "No animation action found on the current object.")
+            return {'CANCELLED'}
+
+        if armature not in ik_maps:
+            build_ik_map(armature)
+
+        selected_bones = set(context.selected_pose_bones or ())
+        chains = [
+            ik_data for ik_data in ik_maps[armature].values()
+            if ik_data['target_bone'] and (
+                ik_data['target_bone'] in selected_bones if self.chains == 'SELECTED'
+                else ik_data['target_bone'].bone.mode == 'MIXED_KINEMATICS'
+            )
+        ]
+        if not chains:
+            self.report({'ERROR'}, "No matching IK chains found.")
+            return {'CANCELLED'}
+
+        frames = get_keyed_frames(action, [bone.name for ik_data in chains for bone in ik_data['bones']])
+        if not len(frames):
+            self.report({'ERROR'}, "The chosen chains have no keys.")
+            return {'CANCELLED'}
+
+        # The analytic solver reads its FK inputs straight from the fcurves, the constraints are left alone.
+        # Chains with settings it doesn't model are baked with their constraints instead.
+        solved = {}
+        constraint_chains = chains
+        if self.solver == 'ANALYTIC':
+            from .ik_solver import solve_chain_rotations, get_chain_input_bones, is_supported_chain
+            supported = [is_supported_chain(armature, ik_data) for ik_data in chains]
+            analytic_chains = [ik_data for ik_data, is_supported in zip(chains, supported) if is_supported]
+            constraint_chains = [ik_data for ik_data, is_supported in zip(chains, supported) if not is_supported]
+            if analytic_chains:
+                input_pose = sample_fk_pose_matrices(armature, get_chain_input_bones(armature, analytic_chains), frames)
+                solved = solve_chain_rotations(armature, analytic_chains, input_pose)
+
+        if constraint_chains:
+            # Evaluate every keyed frame once with the IK constraints on, then restore their previous states
+            constraint_bone_names = [bone.name for ik_data in constraint_chains for bone in ik_data['chain_bones']]
+            ik_states = [not ik_data['constraint'].mute for ik_data in constraint_chains]
+            try:
+                for ik_data in constraint_chains:
+                    toggle_ik(ik_data, True)
+                baked = bake_chain_rotations(armature, constraint_bone_names, frames)
+            finally:
+                for ik_data, state in zip(constraint_chains, ik_states):
+                    toggle_ik(ik_data, state)
+            solved.update((name, baked[:, i]) for i, name in enumerate(constraint_bone_names))
+
+        bone_names = list(solved)
+        rotations = np.stack([solved[name] for name in bone_names], axis=1)
+        rotations, _ = align_quaternion_hemispheres(rotations)
+        for i, bone_name in enumerate(bone_names):
+            write_rotation_keys(action, bone_name, frames, rotations[:, i])
+
+        self.report({'INFO'}, f"Baked {len(chains)} chain(s) on {len(frames)} frame(s).")
+        return {'FINISHED'}
+
+class ResolveAutoposeOperator(bpy.types.Operator):
+    bl_idname = "pose.resolve_autopose"
+    bl_label = "Re-solve Autopose"
+    bl_description = "Recompute autopose bone rotations from the IK controllers on every keyed frame of the current action"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        armature = context.object
+        if not is_bizarre_armature(armature):
+            self.report({'ERROR'}, "Active object is not a Bizarre armature.")
+            return {'CANCELLED'}
+
+        action = armature.animation_data.action if armature.animation_data else None
+        if not action:
+            self.report({'ERROR'}, "No animation action found on the current object.")
+            return {'CANCELLED'}
+
+        reference_armature = bpy.data.objects.get("Autopose Reference Armature")
+        if not reference_armature:
+            self.report({'ERROR'}, "Can't find 'Autopose Reference Armature' in the scene.")
+            return {'CANCELLED'}
+
+        autopose_bones = [bone for bone in get_bones_with_role(armature, ROLE_AUTOPOSE) if bone.bone.auto_posing]
+        if not autopose_bones:
+            self.report({'ERROR'}, "Auto-posing is disabled on all bones.")
+            return {'CANCELLED'}
+
+        bone_names = [bone.name for bone in autopose_bones]
+        frames = get_keyed_frames(action, list(ik_target_to_autopose_map) + bone_names)
+        if not len(frames):
+            self.report({'ERROR'}, "The IK controllers have no keys.")
+            return {'CANCELLED'}
+
+        # Set the rig up the same way as during a manipulation: reference constraints on the autopose bones,
+        # and reference rotations under them for the bones that can't be transformed by hand.
+        muted_fcurves = []
+        for bone in autopose_bones:
+            fetch_constraints_from_reference(reference_armature, armature, bone.name)
+            if not is_transformable_auto_posing_bone(bone):
+                data_path = f'pose.bones["{bone.name}"].rotation_quaternion'
+                for fcurve in action.fcurves:
+                    if fcurve.data_path == data_path and not fcurve.mute:
+                        fcurve.mute = True
+                        muted_fcurves.append(fcurve)
+                apply_quaternion_from_reference(reference_armature, armature, bone.name)
+
+        try:
+            rotations = bake_chain_rotations(armature, bone_names, frames)
+        finally:
+            for fcurve in muted_fcurves:
+                fcurve.mute = False
+            for bone in autopose_bones:
+                while bone.constraints:
+                    bone.constraints.remove(bone.constraints[0])
+            invalidate_rig_caches(armature)
+
+        rotations, _ = align_quaternion_hemispheres(rotations)
+        for i, bone_name in enumerate(bone_names):
+            write_rotation_keys(action, bone_name, frames, rotations[:, i])
+        context.scene.frame_set(context.scene.frame_current)
+
+        self.report({'INFO'}, f"Re-solved {len(bone_names)} autopose bone(s) on {len(frames)} frame(s).")
+        return {'FINISHED'}
+
 class AssignBoneGroupOperator(bpy.types.Operator):
     bl_idname = "pose.assign_bone_group"
     bl_label = "Assign Bone Group"
@@ -41,7 +256,8 @@ class AssignBoneGroupOperator(bpy.types.Operator):
         if context.mode != 'POSE' or context.area.type != 'VIEW_3D':
             return {'PASS_THROUGH'}  # Pass through the event if not in Pose Mode or 3D View
 
-        assign_bone_group(self.group_number)
+        count = assign_bone_group(self.group_number)
+        self.report({'INFO'}, f"Assigned {count} bone(s) to group {self.group_number}.")
         return {'FINISHED'}
 
 class SelectBoneGroupOperator(bpy.types.Operator):
@@ -56,7 +272,11 @@ class SelectBoneGroupOperator(bpy.types.Operator):
         if context.mode != 'POSE' or context.area.type != 'VIEW_3D':
             return {'PASS_THROUGH'}  # Pass through the event if not in Pose Mode or 3D View
 
-        select_bone_group(self.group_number)
+        count = select_bone_group(self.group_number)
+        if count is None:
+            self.report({'WARNING'}, f"No bones assigned to group {self.group_number}.")
+            return {'CANCELLED'}
+        self.report({'INFO'}, f"Selected {count} bone(s) from group {self.group_number}.")
         return {'FINISHED'}
 
 class DisableAutoPosingSelectedOperator(bpy.types.Operator):
@@ -109,40 +329,146 @@ class DisableAutoPosingAllOperator(bpy.types.Operator):
                     else: bone.auto_posing = True
         return {'FINISHED'}
 
+# State of the running modal export, drawn by the export panel
+export_progress = {"running": False, "progress": 0.0, "message": "", "cancel_requested": False}
+
+class ExportAnimationOperator(bpy.types.Operator):
+    bl_idname = "export.animation"
+    bl_label = "Export Animation"
+    bl_description = "Export the current action as a .nif/.kf file, baking and decimating keyframes"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    _stages = None
+    _timer = None
+
+    @classmethod
+    def poll(cls, context):
+        return not export_progress["running"]
+
+    def execute(self, context):
+        # The exporter is only loaded once it's needed
+        from . import exporter
+        return exporter.export_animation(self, context)
+
+    def invoke(self, context, event):
+        # Run the export in steps from a timer, so the UI stays responsive and the export can be cancelled
+        from . import exporter
+        # bpy.context, because the context passed here is only valid during this call
+        self._stages = exporter.export_animation_stages(self, bpy.context, exporter.BAKE_CHUNK_FRAMES)
+
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.01, window=context.window)
+        wm.progress_begin(0, 100)
+        wm.modal_handler_add(self)
+        export_progress.update(running=True, progress=0.0, message="Starting export", cancel_requested=False)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        # An Esc that cancels another modal operator (e.g. a grab in the viewport) isn't meant for the export
+        cancel = event.type == 'ESC' and event.value == 'PRESS' and not any(
+            operator.bl_idname != 'EXPORT_OT_animation' for operator in context.window.modal_operators)
+        if cancel or export_progress["cancel_requested"]:
+            # Closing the pipeline rolls back the temporary action
+            self._stages.close()
+            self.finish(context)
+            self.report({'WARNING'}, "Export cancelled.")
+            return {'CANCELLED'}
+
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        try:
+            progress, message = next(self._stages)
+        except StopIteration as stop:
+            self.finish(context)
+            return stop.value
+        except Exception as error:
+            self.finish(context)
+            self.report({'ERROR'}, f"Export failed: {error}")
+            return {'CANCELLED'}
+
+        export_progress.update(progress=progress, message=message)
+        context.window_manager.progress_update(int(progress * 100))
+        for area in context.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+        return {'RUNNING_MODAL'}
+
+    def finish(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        export_progress.update(running=False, progress=0.0, message="", cancel_requested=False)
+        for area in context.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
+class CancelExportOperator(bpy.types.Operator):
+    bl_idname = "export.cancel_animation_export"
+    bl_label = "Cancel Export"
+    bl_description = "Cancel the running export and remove its temporary action"
+
+    @classmethod
+    def poll(cls, context):
+        return export_progress["running"]
+
+    def execute(self, context):
+        export_progress["cancel_requested"] = True
+        return {'FINISHED'}
+
+class TransferToBeastsOperator(bpy.types.Operator):
+    bl_idname = "export.transfer_to_beasts"
+    bl_label = "Transfer to Beasts"
+    bl_description = "Retarget the current animation for beast armatures. A beast retargeting rig will be imported. You can export animation straight from the beast rig if you feel satisfied with the result."
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        from . import exporter
+        return exporter.transfer_to_beasts(self, context)
+
+constraint_scope_items = [
+    ('ACTIVE', "Active", "Only the active armature"),
+    ('SELECTED', "Selected", "All selected armatures"),
+    ('SCENE', "Scene", "All armatures in the scene"),
+]
+
+def get_scoped_armatures(context, scope):
+    """Return the armatures an operator with a constraint scope works on."""
+    if scope == 'ACTIVE':
+        objects = [context.object] if context.object else []
+    elif scope == 'SELECTED':
+        objects = context.selected_objects
+    else:
+        objects = context.scene.objects
+    return [obj for obj in objects if obj.type == 'ARMATURE']
+
 class MuteConstraintsOperator(bpy.types.Operator):
     bl_idname = "export.mute_constraints"
     bl_label = "Mute Constraints"
     bl_description = "Mute all constraints on the armature and its bones. Constraint states are saved and can be later restored. Handy to view baked/vanilla animations without constraints affecting the motion."
     bl_options = {'REGISTER', 'UNDO'}
 
+    scope: bpy.props.EnumProperty(name="Armatures", items=constraint_scope_items, default='ACTIVE')
+
     def execute(self, context):
-        obj = context.object
-        if not obj or obj.type != 'ARMATURE':
-            self.report({'ERROR'}, "Active object is not an armature.")
+        armatures = get_scoped_armatures(context, self.scope)
+        if not armatures:
+            self.report({'ERROR'}, "No armatures to mute.")
             return {'CANCELLED'}
 
         # Check if constraints are already muted
-        if "saved_constraints" in obj:
+        armatures = [obj for obj in armatures if saved_constraints_property not in obj]
+        if not armatures:
             self.report({'ERROR'}, "Constraints are already muted. Restore them before muting again.")
             return {'CANCELLED'}
 
-        # Save and mute all constraints on the armature object itself
-        saved_constraints = {"object_constraints": [constraint.mute for constraint in obj.constraints]}
-
-        for constraint in obj.constraints:
-            constraint.mute = True
+        # Save the mute states into the armature's custom property, then mute everything
+        for obj in armatures:
+            obj[saved_constraints_property] = snapshot_constraint_states(obj)
+            set_all_constraints_mute(obj, True)
+            invalidate_rig_caches(obj)
 
-        # Save and mute all constraints on the armature's bones
-        bone_constraints = {}
-        for bone in obj.pose.bones:
-            bone_constraints[bone.name] = [constraint.mute for constraint in bone.constraints]
-            for constraint in bone.constraints:
-                constraint.mute = True
-
-        # Store the saved constraints in the armature's custom property
-        saved_constraints["bone_constraints"] = bone_constraints
-        obj["saved_constraints"] = saved_constraints
-        self.report({'INFO'}, "All constraints muted and states saved.")
+        self.report({'INFO'}, f"All constraints muted and states saved on {len(armatures)} armature(s).")
         return {'FINISHED'}
 
 class RestoreConstraintsOperator(bpy.types.Operator):
@@ -151,73 +477,57 @@ class RestoreConstraintsOperator(bpy.types.Operator):
     bl_description = "Restore all previously muted constraints on the armature and its bones"
     bl_options = {'REGISTER', 'UNDO'}
 
+    scope: bpy.props.EnumProperty(name="Armatures", items=constraint_scope_items, default='ACTIVE')
+
     @classmethod
     def poll(cls, context):
+        # Only look at the active and selected objects, poll runs on every redraw. Execute checks the full scope.
         obj = context.object
-        return obj and obj.type == 'ARMATURE' and "saved_constraints" in obj
+        if obj is not None and obj.type == 'ARMATURE' and saved_constraints_property in obj:
+            return True
+        return any(obj.type == 'ARMATURE' and saved_constraints_property in obj for obj in context.selected_objects)
 
     def execute(self, context):
-        obj = context.object
-        if not obj or obj.type != 'ARMATURE':
-            self.report({'ERROR'}, "Active object is not an armature.")
-            return {'CANCELLED'}
-
-        if "saved_constraints" not in obj:
+        armatures = [obj for obj in get_scoped_armatures(context, self.scope) if saved_constraints_property in obj]
+        if not armatures:
             self.report({'ERROR'}, "No saved constraint states to restore.")
             return {'CANCELLED'}
 
-        # Retrieve saved constraints
-        saved_constraints = obj["saved_constraints"]
+        for obj in armatures:
+            restore_constraint_states(obj, obj[saved_constraints_property])
+            # Remove the saved constraints from the armature's custom property
+            del obj[saved_constraints_property]
+            invalidate_rig_caches(obj)
 
-        # Restore constraints on the armature object itself
-        for constraint, saved_state in zip(obj.constraints, saved_constraints["object_constraints"]):
-            constraint.mute = saved_state
-
-        # Restore constraints on the armature's bones
-        for bone in obj.pose.bones:
-            if bone.name in saved_constraints["bone_constraints"]:
-                for constraint, saved_state in zip(bone.constraints, saved_constraints["bone_constraints"][bone.name]):
-                    constraint.mute = saved_state
-
-        # Remove the saved constraints from the armature's custom property
-        del obj["saved_constraints"]
-        self.report({'INFO'}, "Constraints restored to their previous states.")
+        self.report({'INFO'}, f"Constraints restored to their previous states on {len(armatures)} armature(s).")
         return {'FINISHED'}
 
-@persistent
-def clear_ik_map_on_load(dummy):
-    print("FILE LOADED")
-    """Clear the IK map when a new file is loaded."""
-    global ik_target_to_autopose_map
-    ik_target_to_autopose_map.clear()
-    print("IK map cleared on file load.")
-
 def register():
     bpy.utils.register_class(AutoPoseKeyframeOperator)
+    bpy.utils.register_class(AutoPoseKeyframeRangeOperator)
+    bpy.utils.register_class(BakeMixedKinematicsOperator)
+    bpy.utils.register_class(ResolveAutoposeOperator)
     bpy.utils.register_class(AssignBoneGroupOperator)
     bpy.utils.register_class(SelectBoneGroupOperator)
     bpy.utils.register_class(DisableAutoPosingSelectedOperator)
     bpy.utils.register_class(DisableAutoPosingAllOperator)
     bpy.utils.register_class(ExportAnimationOperator)
+    bpy.utils.register_class(CancelExportOperator)
     bpy.utils.register_class(TransferToBeastsOperator)
     bpy.utils.register_class(MuteConstraintsOperator)
     bpy.utils.register_class(RestoreConstraintsOperator)
 
-    # Register the file load handler
-    if clear_ik_map_on_load not in bpy.app.handlers.load_post:
-        bpy.app.handlers.load_post.append(clear_ik_map_on_load)
-
 def unregister():
-    # Unregister the file load handler
-    if clear_ik_map_on_load in bpy.app.handlers.load_post:
-        bpy.app.handlers.load_post.remove(clear_ik_map_on_load)
-
     bpy.utils.unregister_class(DisableAutoPosingAllOperator)
     bpy.utils.unregister_class(DisableAutoPosingSelectedOperator)
     bpy.utils.unregister_class(SelectBoneGroupOperator)
     bpy.utils.unregister_class(AssignBoneGroupOperator)
     bpy.utils.unregister_class(AutoPoseKeyframeOperator)
+    bpy.utils.unregister_class(AutoPoseKeyframeRangeOperator)
+    bpy.utils.unregister_class(BakeMixedKinematicsOperator)
+    bpy.utils.unregister_class(ResolveAutoposeOperator)
     bpy.utils.unregister_class(ExportAnimationOperator)
+    bpy.utils.unregister_class(CancelExportOperator)
     bpy.utils.unregister_class(TransferToBeastsOperator)
     bpy.utils.unregister_class(MuteConstraintsOperator)
     bpy.utils.unregister_class(RestoreConstraintsOperator)
@@ -1,7 +1,6 @@
 import bpy
-from .utils import is_bizarre_armature, is_ik_chain_target_bone, is_auto_posing_bone, build_ik_map, ik_maps, toggle_auto_posing, switch_kinematics_mode
-from .exporter import ExportAnimationOperator, TransferToBeastsOperator
-from .operators import MuteConstraintsOperator, RestoreConstraintsOperator
+from .utils import is_bizarre_armature, is_ik_chain_target_bone, is_auto_posing_bone, toggle_auto_posing, switch_kinematics_mode
+from .operators import export_progress, ExportAnimationOperator, CancelExportOperator, TransferToBeastsOperator, MuteConstraintsOperator, RestoreConstraintsOperator, BakeMixedKinematicsOperator, AutoPoseKeyframeRangeOperator, ResolveAutoposeOperator
 
 # Check Blender version
 BLENDER_VERSION = bpy.app.version
@@ -34,10 +33,6 @@ class IKPanel(bpy.types.Panel):
         add_separator(column, factor=1.0, separator_type='LINE')
         
         if armature and is_bizarre_armature(armature):
-            # Ensure IK map is built for the armature
-            if armature not in ik_maps:
-                build_ik_map(armature)
-
             selected_bones = context.selected_pose_bones
             if selected_bones:
                 pose_bone = selected_bones[0]
@@ -48,6 +43,11 @@ class IKPanel(bpy.types.Panel):
                     column.prop(bone, "auto_posing")
                     column.label(text="Ctrl+A: Toggle", icon="INFO")
                     column.label(text="Ctrl+Shift+A: Toggle All")
+
+            add_separator(column, factor=1.0, separator_type='SPACE')
+            column.operator(AutoPoseKeyframeRangeOperator.bl_idname, text="Key Limbs on All Keys")
+            column.operator(BakeMixedKinematicsOperator.bl_idname, text="Bake Mixed Kinematics")
+            column.operator(ResolveAutoposeOperator.bl_idname, text="Re-solve Autopose")
         else:
             column.label(text="Select either an IK controller or an autoposing bone of a Bizarre Morrowind armature distributed with this addon.",icon="INFO")
 
@@ -91,6 +91,7 @@ class ExportPanel(bpy.types.Panel):
         # Transfer to Beasts button
         column.label(text="Conversion to Khajiit/Argonian",icon="ARMATURE_DATA")
         add_separator(column, factor=0.5, separator_type='SPACE')
+        column.prop(addon_prefs, "beast_targets", text="Skeletons")
         column.operator(TransferToBeastsOperator.bl_idname, text="Transfer to Beasts")
         add_separator(column, factor=1.0, separator_type='SPACE')
 
@@ -108,15 +109,32 @@ class ExportPanel(bpy.types.Panel):
         column.label(text="Extra Bones to Export:",icon="BONE_DATA")
         column.prop(addon_prefs, "retained_extra_bones", text="")
 
+        # Sample library field
+        column.label(text="Sample Library:",icon="FILE_CACHE")
+        column.prop(addon_prefs, "sample_library_folder", text="")
+
         # Export as dropdown
         column.label(text="Export as:",icon="ARMATURE_DATA")
         column.prop(addon_prefs, "export_as", text="")        
 
+        # Export clips dropdown
+        column.label(text="Export Clips:",icon="MARKER_HLT")
+        column.prop(addon_prefs, "export_clips", text="")
+
+        # Key rate and time scale
+        row = column.row(align=True)
+        row.prop(addon_prefs, "export_key_rate", text="Key Rate")
+        row.prop(addon_prefs, "export_time_scale", text="Time Scale")
+
         # Export button
         add_separator(column, factor=1.0, separator_type='SPACE')
         add_separator(column, factor=1.0, separator_type='LINE')
         add_separator(column, factor=1.0, separator_type='SPACE')
-        column.operator(ExportAnimationOperator.bl_idname, text="Export Animation")
+        if export_progress["running"]:
+            column.label(text=f"{export_progress['message']}... {export_progress['progress']:.0%}", icon="TIME")
+            column.operator(CancelExportOperator.bl_idname, text="Cancel Export", icon="CANCEL")
+        else:
+            column.operator(ExportAnimationOperator.bl_idname, text="Export Animation")
         add_separator(column, factor=1.0, separator_type='SPACE')
         
 
@@ -135,6 +153,9 @@ class ExportPanel(bpy.types.Panel):
         row = column.row(align=True)
         row.operator(MuteConstraintsOperator.bl_idname, text="Mute Constraints")
         row.operator(RestoreConstraintsOperator.bl_idname, text="Restore Constraints")
+        row = column.row(align=True)
+        row.operator(MuteConstraintsOperator.bl_idname, text="Mute All Rigs").scope = 'SCENE'
+        row.operator(RestoreConstraintsOperator.bl_idname, text="Restore All Rigs").scope = 'SCENE'
 
         column.label(text="Removing constraints allows you to properly view baked actions.", icon="INFO")
         add_separator(column, factor=1.0, separator_type='SPACE')
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# On-disk library of baked animation samples.
+# Every entry is a folder named after the fingerprint of the action it was baked from, holding:
+#   times.npy     - (F,) float32 frame numbers
+#   values.npy    - (F, C) float32 samples, one column per channel
+#   channels.json - [data_path, array_index, group] of every column, plus free-form metadata
+# The .npy files are memory-mapped on load, so readers get the samples without copying them.
+# Like core, this module doesn't import bpy and can be used from plain Python processes.
+
+def fingerprint(*parts):
+    """Hash strings, numbers and NumPy arrays into a hex key."""
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            digest.update(str(part.dtype).encode())
+            digest.update(str(part.shape).encode())
+            digest.update(np.ascontiguousarray(part).tobytes())
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def get_entry_path(folder, key):
+    return os.path.join(folder, key)
+
+def has_samples(folder, key):
+    return bool(folder) and os.path.isfile(os.path.join(get_entry_path(folder, key), "channels.json"))
+
+def save_samples(folder, key, channels, times, values, metadata=None):
+    """Store baked samples under a key. The entry is written to a temporary folder and moved in place,
+    so readers never see a half-written entry."""
+    os.makedirs(folder, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f".{key}.", dir=folder)
+    try:
+        np.save(os.path.join(staging, "times.npy"), np.asarray(times, dtype=np.float32))
+        np.save(os.path.join(staging, "values.npy"), np.asarray(values, dtype=np.float32))
+        with open(os.path.join(staging, "channels.json"), "w") as file:
+            json.dump({"channels": [list(channel) for channel in channels], "metadata": metadata or {}}, file)
+
+        entry = get_entry_path(folder, key)
+        if os.path.isdir(entry):
+            shutil.rmtree(entry)
+        os.replace(staging, entry)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+def load_samples(folder, key):
+    """Load an entry as (channels, times, values, metadata) with memory-mapped arrays, or None if it doesn't exist."""
+    if not has_samples(folder, key):
+        return None
+    entry = get_entry_path(folder, key)
+    with open(os.path.join(entry, "channels.json")) as file:
+        description = json.load(file)
+    times = np.load(os.path.join(entry, "times.npy"), mmap_mode='r')
+    values = np.load(os.path.join(entry, "values.npy"), mmap_mode='r')
+    channels = [tuple(channel) for channel in description["channels"]]
+    return channels, times, values, description["metadata"]
+
+def list_keys(folder):
+    """Return the keys of all complete entries in the library."""
+    if not folder or not os.path.isdir(folder):
+        return []
+    return sorted(name for name in os.listdir(folder) if not name.startswith(".") and has_samples(folder, name))
@@ -0,0 +1,168 @@
+# Tests of the Blender-independent animation math in core.py, run with: python -m pytest tests
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import core
+
+def random_quaternions(count, seed=0):
+    quats = np.random.default_rng(seed).normal(size=(count, 4))
+    return quats / np.linalg.norm(quats, axis=-1, keepdims=True)
+
+def bone_matrix(head, tail, x_hint=(1.0, 0.0, 0.0)):
+    """4x4 rest matrix of a bone with its Y axis along head -> tail, like Bone.matrix_local."""
+    head = np.array(head, dtype=np.float64)
+    y_axis = core.normalize(np.array(tail, dtype=np.float64) - head)
+    x_axis = core.normalize(np.array(x_hint) - y_axis * np.dot(x_hint, y_axis))
+    return core.compose_matrices(x_axis, y_axis, head)
+
+# decimate_keys
+
+def test_decimate_keys_keeps_ends_of_a_straight_line():
+    times = np.arange(10, dtype=np.float64)
+    keep = core.decimate_keys(times, times * 2.0 + 1.0, 1e-6)
+    assert keep.tolist() == [True] + [False] * 8 + [True]
+
+def test_decimate_keys_keeps_corners():
+    times = np.arange(11, dtype=np.float64)
+    values = np.abs(times - 5.0)
+    keep = core.decimate_keys(times, values, 1e-6)
+    assert np.flatnonzero(keep).tolist() == [0, 5, 10]
+
+def test_decimate_keys_stays_within_error():
+    times = np.arange(100, dtype=np.float64)
+    values = np.sin(times * 0.1)
+    max_error = 1e-3
+    keep = core.decimate_keys(times, values, max_error)
+    assert keep.sum() < len(times)
+    assert np.abs(np.interp(times, times[keep], values[keep]) - values).max() <= max_error
+
+def test_decimate_keys_decimates_channels_together():
+    times = np.arange(11, dtype=np.float64)
+    values = np.stack([times, np.abs(times - 5.0)], axis=-1)
+    keep = core.decimate_keys(times, values, 1e-6)
+    assert np.flatnonzero(keep).tolist() == [0, 5, 10]
+
+def test_decimate_keys_keeps_short_curves():
+    assert core.decimate_keys([0.0, 1.0], [0.0, 5.0], 1.0).tolist() == [True, True]
+
+# slerp_quaternions
+
+def test_slerp_quaternions_hits_keys_and_midpoint():
+    angle = np.pi / 2
+    quats = np.array([[1.0, 0.0, 0.0, 0.0], [np.cos(angle / 2), 0.0, 0.0, np.sin(angle / 2)]])
+    result = core.slerp_quaternions([0.0, 10.0], quats, [0.0, 5.0, 10.0])
+    assert np.allclose(result[0], quats[0])
+    assert np.allclose(result[2], quats[1])
+    assert np.allclose(result[1], [np.cos(angle / 4), 0.0, 0.0, np.sin(angle / 4)])
+
+def test_slerp_quaternions_takes_shortest_path_and_clamps():
+    quats = random_quaternions(2)
+    result = core.slerp_quaternions([0.0, 1.0], np.stack([quats[0], -quats[1]]), [-1.0, 0.5, 2.0])
+    assert np.allclose(result[0], quats[0])
+    assert np.allclose(np.abs(result[2]), np.abs(quats[1]))
+    direct = core.slerp_quaternions([0.0, 1.0], quats, [0.5])[0]
+    assert np.isclose(abs(np.dot(result[1], direct)), 1.0)
+    assert np.allclose(np.linalg.norm(result, axis=-1), 1.0)
+
+# align_quaternion_hemispheres
+
+def test_align_quaternion_hemispheres_removes_sign_flips():
+    quats = np.repeat(random_quaternions(1), 6, axis=0)
+    quats[2:4] *= -1.0
+    aligned, flips = core.align_quaternion_hemispheres(quats)
+    assert np.allclose(aligned, quats[0])
+    assert flips.tolist() == [False, False, True, True, False, False]
+
+def test_align_quaternion_hemispheres_per_bone():
+    quats = np.repeat(random_quaternions(2)[None], 3, axis=0)
+    quats[1, 0] *= -1.0
+    aligned, flips = core.align_quaternion_hemispheres(quats)
+    assert np.all(np.sum(aligned[1:] * aligned[:-1], axis=-1) > 0.0)
+    assert flips.tolist() == [[False, False], [True, False], [False, False]]
+
+# find_changed_frame_ranges / merge_frame_ranges
+
+def keys(frames, values):
+    return np.stack([np.asarray(frames, dtype=np.float64), np.asarray(values, dtype=np.float64)], axis=-1)
+
+def test_find_changed_frame_ranges_unchanged():
+    old = keys([0, 10, 20], [0.0, 1.0, 0.0])
+    assert core.find_changed_frame_ranges(old, old.copy()) == []
+
+def test_find_changed_frame_ranges_edited_key_spans_neighbours():
+    old = keys([0, 10, 20, 30], [0.0, 1.0, 0.0, 1.0])
+    new = keys([0, 10, 20, 30], [0.0, 2.0, 0.0, 1.0])
+    assert core.find_changed_frame_ranges(old, new) == [(0.0, 20.0)]
+
+def test_find_changed_frame_ranges_end_keys_reach_infinity():
+    old = keys([0, 10], [0.0, 1.0])
+    new = keys([0, 10, 20], [0.0, 1.0, 5.0])
+    assert core.find_changed_frame_ranges(old, new) == [(10.0, np.inf)]
+    assert core.find_changed_frame_ranges(new, keys([0, 10, 20], [9.0, 1.0, 5.0])) == [(-np.inf, 10.0)]
+
+def test_merge_frame_ranges_grows_clamps_and_merges():
+    ranges = [(10, 12), (15, 20), (-np.inf, 2), (40.5, np.inf)]
+    assert core.merge_frame_ranges(ranges, 2, 0, 50) == [(0, 4), (8, 22), (38, 50)]
+
+def test_merge_frame_ranges_merges_adjacent():
+    assert core.merge_frame_ranges([(0, 5), (6, 10)], 0, 0, 100) == [(0, 10)]
+
+# resample_times
+
+def test_resample_times_whole_steps():
+    assert core.resample_times(0, 10, 2).tolist() == [0, 2, 4, 6, 8, 10]
+
+def test_resample_times_includes_last_frame():
+    assert core.resample_times(0, 10, 3).tolist() == [0, 3, 6, 9, 10]
+    assert np.allclose(core.resample_times(0, 1, 0.4), [0.0, 0.4, 0.8, 1.0])
+
+# solve_two_bone_ik
+
+UPPER_REST = bone_matrix((0.0, 0.0, 0.0), (0.0, 1.0, -0.05))
+LOWER_REST = bone_matrix((0.0, 1.0, -0.05), (0.0, 2.0, 0.0))
+UPPER_LENGTH = np.linalg.norm(LOWER_REST[:3, 3] - UPPER_REST[:3, 3])
+LOWER_LENGTH = np.linalg.norm(np.array([0.0, 2.0, 0.0]) - LOWER_REST[:3, 3])
+
+def solve(targets, pole=None, pole_angle=0.0):
+    root = np.zeros_like(targets)
+    return core.solve_two_bone_ik(root, targets, pole, pole_angle, UPPER_REST, LOWER_REST, LOWER_LENGTH)
+
+def assert_rotations(poses):
+    rotations = poses[..., :3, :3]
+    assert np.allclose(rotations @ np.swapaxes(rotations, -1, -2), np.identity(3), atol=1e-9)
+    assert np.allclose(np.linalg.det(rotations), 1.0)
+
+@pytest.mark.parametrize("use_pole", [False, True])
+def test_solve_two_bone_ik_reaches_target(use_pole):
+    rng = np.random.default_rng(1)
+    directions = core.normalize(rng.normal(size=(50, 3)))
+    targets = directions * rng.uniform(0.5, 1.9, size=(50, 1))
+    pole = np.tile([1.0, 0.5, 0.0], (50, 1)) if use_pole else None
+    upper_pose, lower_pose = solve(targets, pole)
+
+    assert_rotations(upper_pose)
+    assert_rotations(lower_pose)
+    assert np.allclose(upper_pose[:, :3, 3], 0.0)
+    # The upper bone points at the elbow and keeps its length, the lower bone's tail reaches the target
+    elbow = lower_pose[:, :3, 3]
+    assert np.allclose(np.linalg.norm(elbow, axis=-1), UPPER_LENGTH)
+    assert np.allclose(core.normalize(elbow), upper_pose[:, :3, 1])
+    assert np.allclose(elbow + lower_pose[:, :3, 1] * LOWER_LENGTH, targets, atol=1e-6)
+
+def test_solve_two_bone_ik_stretches_towards_unreachable_target():
+    targets = np.array([[0.0, 0.0, 5.0], [3.0, 0.0, 0.0]])
+    upper_pose, lower_pose = solve(targets)
+    tips = lower_pose[:, :3, 3] + lower_pose[:, :3, 1] * LOWER_LENGTH
+    assert np.allclose(core.normalize(tips), core.normalize(targets), atol=1e-3)
+    assert np.allclose(np.linalg.norm(tips, axis=-1), UPPER_LENGTH + LOWER_LENGTH, atol=1e-3)
+
+def test_solve_two_bone_ik_rest_pose_without_pole():
+    target = LOWER_REST[:3, 3] + LOWER_REST[:3, 1] * LOWER_LENGTH
+    upper_pose, lower_pose = solve(target[None])
+    assert np.allclose(upper_pose[0], UPPER_REST, atol=1e-6)
+    assert np.allclose(lower_pose[0], LOWER_REST, atol=1e-6)
@@ -1,4 +1,6 @@
 import bpy
+import numpy as np
+from .core import rest_relative_inverse, local_rotations, get_bone_name_from_data_path, quaternions_to_matrices, euler_to_matrices, rotation_vector_to_quaternion, compose_basis_matrices, forward_kinematics
 
 # Predefined lists of bones
 limb_ik_bones = ["Bip01 Forearm.L", "Bip01 Forearm.R", "Bip01 Calf.L", "Bip01 Calf.R"]
@@ -16,17 +18,135 @@ ik_target_to_autopose_map = {
     "Bip01 Leg IK Target.R": lower_body_autopose_bones,
 }
 
-bone_groups = {}
+# Custom property of armature objects holding the constraint mute states saved by MuteConstraintsOperator
+saved_constraints_property = "saved_constraints"
+
+# Custom property of armature objects holding their bone selection groups
+bone_groups_property = "bizarre_bone_groups"
+# Custom property holding the bone count the selection groups were saved for
+bone_groups_count_property = "bizarre_bone_groups_bone_count"
+
+# Bone role flags stored in the per-armature role tables, see get_bone_roles
+ROLE_IK_TARGET = 1
+ROLE_CHAIN_MEMBER = 2
+ROLE_AUTOPOSE = 4
+ROLE_TRANSFORMABLE = 8
+ROLE_GHOST = 16
+
+bone_role_tables = {}
 
 # Module-level variable to store IK maps
 ik_maps = {}
 
+# Ghost bone pairs per armature
+ghost_maps = {}
+
+# Bone name layouts shared between rigs using the same skeleton and limb constraints, see get_skeleton_layout
+skeleton_layouts = {}
+skeleton_keys = {}
+
+# Rest-pose data per armature, see get_rest_pose_cache
+rest_pose_caches = {}
+
 def is_bizarre_armature(armature):
     """Check if the given armature contains the 'Bip01 Bizarre Bone' bone."""
     if armature and armature.type == 'ARMATURE':
-        return "Bip01 Bizarre Bone" in armature.data.bones
+        return get_bone_roles(armature)["bizarre"]
     return False
 
+def get_bone_roles(armature):
+    """Return the role table of an armature: whether it's a Bizarre rig and the ROLE_* flags of its bones.
+
+    The table is computed once per armature and rebuilt when its bone count changes,
+    or after invalidate_bone_roles. It records the rig's content key, see refresh_rig_caches."""
+    table = bone_role_tables.get(armature)
+    bone_count = len(armature.data.bones)
+    if table and table["bone_count"] == bone_count:
+        return table
+
+    roles = {}
+    bizarre = "Bip01 Bizarre Bone" in armature.data.bones
+    if bizarre:
+        layout = get_skeleton_layout(armature)
+
+        def add_role(name, role):
+            roles[name] = roles.get(name, 0) | role
+
+        for chain in layout["ik_chains"].values():
+            if chain["target_bone"]:
+                add_role(chain["target_bone"], ROLE_IK_TARGET)
+            for name in chain["chain_bones"]:
+                add_role(name, ROLE_CHAIN_MEMBER)
+            if chain["leaf_bone"]:
+                add_role(chain["leaf_bone"], ROLE_CHAIN_MEMBER)
+        for name in all_autopose_bones:
+            add_role(name, ROLE_AUTOPOSE)
+        for name in transformable_autopose_bones:
+            add_role(name, ROLE_TRANSFORMABLE)
+        for ghost_name, _ in layout["ghosts"]:
+            add_role(ghost_name, ROLE_GHOST)
+
+    table = {"bone_count": bone_count, "bizarre": bizarre, "roles": roles, "content_key": get_rig_content_key(armature)}
+    bone_role_tables[armature] = table
+    return table
+
+def has_bone_role(pose_bone, role):
+    """Check a ROLE_* flag of a pose bone in its armature's role table."""
+    return bool(get_bone_roles(pose_bone.id_data)["roles"].get(pose_bone.name, 0) & role)
+
+def invalidate_bone_roles(armature=None):
+    """Drop the role table of an armature, or of all armatures."""
+    if armature is None:
+        bone_role_tables.clear()
+    else:
+        bone_role_tables.pop(armature, None)
+
+def get_rig_content_key(armature):
+    """Hash the armature data the rig caches are built from: bone names, rest matrices and limb constraints."""
+    bones = armature.data.bones
+    rest = np.empty(len(bones) * 16, dtype=np.float32)
+    bones.foreach_get("matrix_local", rest)
+    return hash((tuple(bone.name for bone in bones), rest.tobytes(), get_limb_constraint_signature(armature)))
+
+def invalidate_rig_caches(armature):
+    """Drop every cache of an armature, after its bones or constraints were edited."""
+    invalidate_bone_roles(armature)
+    ik_maps.pop(armature, None)
+    ghost_maps.pop(armature, None)
+    rest_pose_caches.pop(armature, None)
+    skeleton_keys.pop(armature.data, None)
+
+def refresh_rig_caches(armature):
+    """Drop the caches of an armature if its content changed since they were built. Returns True if they were dropped."""
+    table = bone_role_tables.get(armature)
+    if table is None or table["content_key"] == get_rig_content_key(armature):
+        return False
+    invalidate_rig_caches(armature)
+    return True
+
+def clear_rig_caches():
+    """Drop every cache keyed by armature objects or data, they don't survive loading another file."""
+    bone_role_tables.clear()
+    ik_maps.clear()
+    ghost_maps.clear()
+    skeleton_layouts.clear()
+    skeleton_keys.clear()
+    rest_pose_caches.clear()
+
+def prewarm_rig_caches(armature):
+    """Build the caches the manipulation handler and the panels use for an armature, yielding after every step."""
+    if not is_bizarre_armature(armature):
+        return
+    yield
+    get_skeleton_layout(armature)
+    yield
+    if armature not in ik_maps:
+        build_ik_map(armature)
+    yield
+    get_ghost_bones(armature)
+    yield
+    get_rest_pose_cache(armature)
+    yield
 
 def find_ik_chain_data(armature, bone):
     """Find IK chain data for a given bone in the armature."""
@@ -47,91 +167,324 @@ def insert_keyframes_for_bones(armature, bones, data_path="rotation_quaternion")
             bone = armature.pose.bones[bone_name]
             bone.keyframe_insert(data_path)
 
-def build_ik_map(armature):
-    """Build a map of IK chains for the given armature."""
-    ik_map = {}
+def get_skeleton_key(armature):
+    """Return a key identifying the armature's skeleton, equal for rigs built from the same bones."""
+    data = armature.data
+    key = skeleton_keys.get(data)
+    if key is None or key[0] != len(data.bones):
+        key = (len(data.bones), hash(tuple(bone.name for bone in data.bones)))
+        skeleton_keys[data] = key
+    return key
+
+def get_rest_geometry_key(armature):
+    """Return a key identifying the armature's bones and their rest matrices."""
+    bones = armature.data.bones
+    rest = np.empty(len(bones) * 16, dtype=np.float32)
+    bones.foreach_get("matrix_local", rest)
+    return (get_skeleton_key(armature), hash(rest.round(5).tobytes()))
+
+def insert_keyframes_bulk(armature, bones, frames):
+    """Key rotation_quaternion of a list of bones on many frames at once.
+
+    Values are evaluated from the bones' fcurves, so no frame change or depsgraph update is needed,
+    and written with write_rotation_keys."""
+    bone_names = [name for name in bones if name in armature.pose.bones]
+    if not bone_names or not len(frames):
+        return
+
+    if not armature.animation_data:
+        armature.animation_data_create()
+    if not armature.animation_data.action:
+        armature.animation_data.action = bpy.data.actions.new(f"{armature.name}Action")
+    action = armature.animation_data.action
+
+    rotations = sample_rotation_channels(armature, action, bone_names, frames)
+    for i, bone_name in enumerate(bone_names):
+        write_rotation_keys(action, bone_name, frames, rotations[:, i])
+
+def sample_rotation_channels(armature, action, bone_names, frames):
+    """Evaluate rotation_quaternion fcurves of the named bones, as an (F, B, 4) array.
+
+    Channels without an fcurve keep the bone's current value. On the scene's current frame the bones' live
+    rotations are used, like keyframe_insert does, so an unkeyed pose the user just made isn't replaced by the curve."""
+    rotations = np.empty((len(frames), len(bone_names), 4), dtype=np.float64)
+    is_current = np.asarray(frames) == bpy.context.scene.frame_current
+    for i, bone_name in enumerate(bone_names):
+        pose_bone = armature.pose.bones[bone_name]
+        data_path = f'pose.bones["{bone_name}"].rotation_quaternion'
+        for channel in range(4):
+            fcurve = action.fcurves.find(data_path, index=channel)
+            if fcurve:
+                rotations[:, i, channel] = [fcurve.evaluate(frame) for frame in frames]
+                rotations[is_current, i, channel] = pose_bone.rotation_quaternion[channel]
+            else:
+                rotations[:, i, channel] = pose_bone.rotation_quaternion[channel]
+    return rotations
+
+def build_skeleton_layout(armature):
+    """Collect the names of IK chain and ghost bones of the armature."""
+    ik_chains = {}
     for bone in armature.pose.bones:
         if bone.name not in limb_ik_bones:
             continue  # Skip bones not in the predefined IK list
         for constraint in bone.constraints:
             if constraint.type == 'IK':
-                chain_length = constraint.chain_count
-                ik_target = constraint.target
                 ik_target_bone = constraint.subtarget
-                bones = []
                 chain_bones = []
                 current_bone = bone
 
                 # Traverse the IK chain
-                for _ in range(chain_length):
-                    bones.append(current_bone)
-                    chain_bones.append(current_bone)
+                for _ in range(constraint.chain_count):
+                    chain_bones.append(current_bone.name)
                     current_bone = current_bone.parent
                     if not current_bone:
                         break
 
-                # Add the IK target bone to the chain
-                if ik_target and ik_target_bone:
-                    target_bone = ik_target.pose.bones.get(ik_target_bone)
-                    if target_bone:
-                        bones.append(target_bone)
-
                 # Find leaf bones (children with constraints targeting the IK target)
                 leaf_bone = None
                 for child_bone in bone.children:
                     for child_constraint in child_bone.constraints:
                         if child_constraint.subtarget == ik_target_bone:
-                            bones.append(child_bone)
-                            chain_bones.append(child_bone)
-                            leaf_bone = child_bone
+                            leaf_bone = child_bone.name
                             break
 
-                # Store the IK chain data
-                ik_map[bone.name] = {
-                    "constraint_bone": bone,
+                ik_chains[bone.name] = {
+                    "constraint": constraint.name,
                     "chain_bones": chain_bones,
-                    "target_bone": target_bone,
-                    "bones": bones,
+                    "target_bone": ik_target_bone,
                     "leaf_bone": leaf_bone,
                 }
 
+    ghosts = [
+        (bone.name, bone.name.replace("[Ghost] ", ""))
+        for bone in armature.pose.bones
+        if bone.name.startswith("[Ghost] ")
+    ]
+
+    return {"ik_chains": ik_chains, "ghosts": ghosts}
+
+def get_limb_constraint_signature(armature):
+    """Hash the constraint data build_skeleton_layout reads: the constraints of the limb IK bones and of their children."""
+    parts = []
+    pose_bones = armature.pose.bones
+    for name in limb_ik_bones:
+        bone = pose_bones.get(name)
+        if bone is None:
+            continue
+        parts.append(name)
+        for constraint in bone.constraints:
+            parts.append((constraint.name, constraint.type, getattr(constraint, "subtarget", ""), getattr(constraint, "chain_count", 0)))
+        for child_bone in bone.children:
+            parts.append((child_bone.name, tuple(getattr(constraint, "subtarget", "") for constraint in child_bone.constraints)))
+    return hash(tuple(parts))
+
+def get_skeleton_layout(armature):
+    """Return the bone layout of the armature, shared between all rigs with the same skeleton and limb constraints."""
+    key = (get_skeleton_key(armature), get_limb_constraint_signature(armature))
+    layout = skeleton_layouts.get(key)
+    if layout is None:
+        layout = build_skeleton_layout(armature)
+        skeleton_layouts[key] = layout
+    return layout
+
+def build_ik_map(armature):
+    """Build a map of IK chains for the given armature."""
+    layout = get_skeleton_layout(armature)
+    pose_bones = armature.pose.bones
+    ik_map = {}
+    for bone_name, chain in layout["ik_chains"].items():
+        bone = pose_bones[bone_name]
+        constraint = bone.constraints[chain["constraint"]]
+        ik_target = constraint.target
+
+        bones = [pose_bones[name] for name in chain["chain_bones"]]
+        chain_bones = list(bones)
+
+        # Add the IK target bone to the chain
+        target_bone = None
+        if ik_target and chain["target_bone"]:
+            target_bone = ik_target.pose.bones.get(chain["target_bone"])
+            if target_bone:
+                bones.append(target_bone)
+
+        leaf_bone = None
+        if chain["leaf_bone"]:
+            leaf_bone = pose_bones[chain["leaf_bone"]]
+            bones.append(leaf_bone)
+            chain_bones.append(leaf_bone)
+
+        # Store the IK chain data
+        ik_map[bone_name] = {
+            "constraint_bone": bone,
+            "constraint": constraint,
+            "chain_bones": chain_bones,
+            "target_bone": target_bone,
+            "bones": bones,
+            "leaf_bone": leaf_bone,
+        }
+
     # Update the module-level ik_maps variable
     ik_maps[armature] = ik_map
 
+def get_ghost_bones(armature):
+    """Return (ghost pose bone, followed pose bone) pairs of the armature."""
+    ghosts = ghost_maps.get(armature)
+    if ghosts is None:
+        pose_bones = armature.pose.bones
+        ghosts = [
+            (pose_bones[ghost_name], pose_bones.get(target_name))
+            for ghost_name, target_name in get_skeleton_layout(armature)["ghosts"]
+        ]
+        ghost_maps[armature] = ghosts
+    return ghosts
+
 def is_ik_chain_target_bone(pose_bone):
     """Check if the given pose bone is an IK chain target."""
-    armature = pose_bone.id_data
-    ik_map = ik_maps.get(armature)
-    if ik_map:
-        for ik_data in ik_map.values():
-            if pose_bone == ik_data["target_bone"]:
-                return True
-    return False
+    return has_bone_role(pose_bone, ROLE_IK_TARGET)
 
 def is_auto_posing_bone(pose_bone):
     """Check if the given pose bone is in the autoposing bone list."""
-    if pose_bone.name in all_autopose_bones:
-        return True
-    return False
+    return has_bone_role(pose_bone, ROLE_AUTOPOSE)
 
 def is_transformable_auto_posing_bone(pose_bone):
-    return is_auto_posing_bone(pose_bone) and pose_bone.name in transformable_autopose_bones
+    return has_bone_role(pose_bone, ROLE_AUTOPOSE) and has_bone_role(pose_bone, ROLE_TRANSFORMABLE)
+
+def get_bones_with_role(armature, role):
+    """Return the pose bones of an armature that have a ROLE_* flag."""
+    pose_bones = armature.pose.bones
+    return [
+        pose_bones[name] for name, flags in get_bone_roles(armature)["roles"].items()
+        if flags & role and name in pose_bones
+    ]
+
+def has_valid_bone_groups(armature):
+    """Check if the armature's bone groups were saved for its current set of bones."""
+    return bone_groups_property in armature and armature.get(bone_groups_count_property) == len(armature.data.bones)
 
 def assign_bone_group(group_number):
-    """Assign selected bones to a group."""
-    selected_bones = [bone.name for bone in bpy.context.selected_pose_bones]
-    bone_groups[group_number] = selected_bones
-    print(f"Assigned bones to group {group_number}: {selected_bones}")
+    """Assign selected bones of the active armature to a group, stored in the armature as an index array.
+
+    Returns the number of bones assigned."""
+    armature = bpy.context.object
+    bones = armature.data.bones
+    selected = np.zeros(len(bones), dtype=bool)
+    bones.foreach_get("select", selected)
+    indices = np.flatnonzero(selected).tolist()
+
+    if not has_valid_bone_groups(armature):
+        # Groups saved for a different set of bones can't be trusted anymore
+        armature[bone_groups_property] = {}
+        armature[bone_groups_count_property] = len(bones)
+    armature[bone_groups_property][str(group_number)] = indices
+    return len(indices)
 
 def select_bone_group(group_number):
-    """Select bones from a previously assigned group."""
-    if group_number in bone_groups:
-        bpy.ops.pose.select_all(action='DESELECT')
-        for bone_name in bone_groups[group_number]:
-            bpy.context.object.data.bones[bone_name].select = True
-        print(f"Selected bones from group {group_number}: {bone_groups[group_number]}")
-    else:
-        print(f"No bones assigned to group {group_number}")
+    """Select bones from a previously assigned group with a single foreach_set.
+
+    Returns the number of bones selected, or None if nothing is assigned to the group."""
+    armature = bpy.context.object
+    bones = armature.data.bones
+    if not has_valid_bone_groups(armature) or str(group_number) not in armature[bone_groups_property]:
+        return None
+    groups = armature[bone_groups_property]
+
+    selected = np.zeros(len(bones), dtype=bool)
+    selected[np.array(groups[str(group_number)], dtype=np.int64)] = True
+    bones.foreach_set("select", selected)
+    armature.data.update_tag()
+    return int(selected.sum())
+
+def fetch_constraints_from_reference(reference_armature, target_armature, bone_name):
+    """Fetch constraints from the reference armature and apply them to the target armature's bone."""
+    ref_bone = reference_armature.pose.bones.get(bone_name)
+    target_bone = target_armature.pose.bones.get(bone_name)    
+
+    if not ref_bone or not target_bone:
+        return
+
+    # Remove existing constraints from the target bone
+    while target_bone.constraints:
+        target_bone.constraints.remove(target_bone.constraints[0])
+
+    # Copy constraints from the reference bone
+    for ref_constraint in ref_bone.constraints:
+        new_constraint = target_bone.constraints.new(type=ref_constraint.type)
+        for attr in dir(ref_constraint):
+            if not attr.startswith("_") and hasattr(new_constraint, attr):
+                try:
+                    setattr(new_constraint, attr, getattr(ref_constraint, attr))
+                except AttributeError:
+                    pass
+
+        # Update target to point to the target armature
+        if hasattr(new_constraint, "target"):
+            new_constraint.target = target_armature
+
+        # A lazy fix for a case when reference armature uses empty objects for autoposing targets instead of bones.
+        # I've updated main armature to use bones, but I don't want to update the reference armature.
+        if hasattr(new_constraint, "subtarget") and ref_constraint.target and not isinstance(ref_constraint.target.data, bpy.types.Armature):
+            new_constraint.subtarget = f"Bip01 {ref_constraint.target.name}"
+
+def apply_quaternion_from_reference(reference_armature, target_armature, bone_name):
+    """Apply quaternion rotation from the reference armature to the target armature's bone."""
+    ref_bone = reference_armature.pose.bones.get(bone_name)
+    target_bone = target_armature.pose.bones.get(bone_name)
+
+    if ref_bone and target_bone:
+        target_bone.rotation_quaternion = ref_bone.rotation_quaternion
+
+def get_constraint_collections(obj):
+    """Yield (owner bone name, constraints) for the object itself ("") and each of its pose bones."""
+    yield "", obj.constraints
+    if obj.pose:
+        for bone in obj.pose.bones:
+            yield bone.name, bone.constraints
+
+def snapshot_constraint_states(obj):
+    """Pack the mute flags of all constraints of an object, keyed by owner bone and constraint name."""
+    owners = []
+    names = []
+    states = []
+    for owner, constraints in get_constraint_collections(obj):
+        count = len(constraints)
+        if not count:
+            continue
+        mute = np.empty(count, dtype=bool)
+        constraints.foreach_get("mute", mute)
+        owners.extend([owner] * count)
+        names.extend(constraint.name for constraint in constraints)
+        states.append(mute)
+    mute = np.concatenate(states) if states else np.empty(0, dtype=bool)
+    return {"owners": owners, "names": names, "mute": mute.astype(np.int32).tolist()}
+
+def set_all_constraints_mute(obj, state):
+    """Set the mute flag of every constraint of an object, one foreach_set per owner."""
+    for _, constraints in get_constraint_collections(obj):
+        if len(constraints):
+            constraints.foreach_set("mute", np.full(len(constraints), state, dtype=bool))
+
+def restore_constraint_states(obj, snapshot):
+    """Restore mute flags from a snapshot. Constraints missing from the snapshot are left alone."""
+    if "owners" not in snapshot:
+        # Saved by an older version as plain lists per owner, in constraint order
+        snapshot = {"owners": [], "names": [], "mute": []}
+        legacy = obj[saved_constraints_property]
+        for owner, constraints in get_constraint_collections(obj):
+            states = legacy["object_constraints"] if owner == "" else legacy["bone_constraints"].get(owner, [])
+            for constraint, mute in zip(constraints, states):
+                snapshot["owners"].append(owner)
+                snapshot["names"].append(constraint.name)
+                snapshot["mute"].append(mute)
+    saved = {(owner, name): bool(mute) for owner, name, mute in zip(snapshot["owners"], snapshot["names"], snapshot["mute"])}
+    for owner, constraints in get_constraint_collections(obj):
+        count = len(constraints)
+        if not count:
+            continue
+        mute = np.empty(count, dtype=bool)
+        constraints.foreach_get("mute", mute)
+        for i, constraint in enumerate(constraints):
+            mute[i] = saved.get((owner, constraint.name), mute[i])
+        constraints.foreach_set("mute", mute)
 
 def toggle_auto_posing(self, context):
     """Toggle the use of constraints for auto-posing bones."""
@@ -163,64 +516,217 @@ def switch_kinematics_mode(self, context):
 
 def toggle_ik(ik_data, state):
     """Disable IK constraints for a given IK chain."""
-    ik_constraint_bone = ik_data['constraint_bone']
     leaf_bone = ik_data['leaf_bone']
-    ik_constraint_bone.constraints['IK'].mute = not state
+    ik_data['constraint'].mute = not state
     if leaf_bone:
         for constraint in leaf_bone.constraints:
             if constraint.subtarget == ik_data['target_bone'].name:
                 constraint.mute = not state
 
 def apply_visual_transform(pose_bones):
+    """Bake the visual (constrained) rotation of the given pose bones into their rotation_quaternion.
+
+    Bones are grouped per armature and solved in one batch, see apply_visual_rotations."""
     global ignoreDepsgraphUpdate
     ignoreDepsgraphUpdate = True
 
-    """  # Save current selection and visibility state
-    selected_bones = [bone.name for bone in bpy.context.selected_pose_bones]
-    hidden_bones = [bone for bone in pose_bones if bone.bone.hide]
-
-    # Unhide hidden bones
-    for bone in hidden_bones:
-        bone.bone.hide = False
-
-    # Deselect all bones
-    bpy.ops.pose.select_all(action='DESELECT')
-
-    # Select the bones passed to the function
-    for pose_bone in pose_bones:
-        pose_pone.bone.select = True
-
-    # Apply visual transform
-    bpy.ops.pose.visual_transform_apply()
-
-    # Restore previous selection
-    bpy.ops.pose.select_all(action='DESELECT')
-    for bone_name in selected_bones:
-        bpy.context.object.data.bones[bone_name].select = True
-
-    # Re-hide previously hidden bones
-    for bone in hidden_bones:
-        bone.bone.hide = True """
-
+    bones_per_armature = {}
     for bone in pose_bones:
-        rot = get_bone_constrained_rotation(bone)
-        bone.rotation_quaternion = rot
+        bones_per_armature.setdefault(bone.id_data, []).append(bone.name)
+
+    for armature, bone_names in bones_per_armature.items():
+        apply_visual_rotations(armature, bone_names)
 
     ignoreDepsgraphUpdate = False
 
 
-def get_bone_constrained_rotation(poseBone):
-    # poseBone.matrix is in object space - we need to convert it to local space 
-    if poseBone.parent is not None:
-        parentRefPoseMtx = poseBone.parent.bone.matrix_local
-        boneRefPoseMtx = poseBone.bone.matrix_local
-        parentPoseMtx = poseBone.parent.matrix
-        bonePoseMtx = poseBone.matrix
-        boneLocMtx = ( parentRefPoseMtx.inverted() @ boneRefPoseMtx ).inverted() @ ( parentPoseMtx.inverted() @ bonePoseMtx )
+def get_rest_pose_cache(armature):
+    """Return cached rest-pose data of the armature, in pose.bones order.
+
+    The cache holds a name to index map, parent indices (-1 for root bones) and the inverted
+    rest-relative matrix of every bone, i.e. (parentRefPoseMtx^-1 @ boneRefPoseMtx)^-1.
+    Rest matrices never change while posing, so they are only rebuilt when the bone count changes."""
+    pose_bones = armature.pose.bones
+    cache = rest_pose_caches.get(armature)
+    if cache and len(cache["names"]) == len(pose_bones):
+        return cache
+
+    names = [bone.name for bone in pose_bones]
+    index = {name: i for i, name in enumerate(names)}
+    parents = np.array([index[bone.parent.name] if bone.parent else -1 for bone in pose_bones], dtype=np.int64)
+
+    rest = np.array([bone.bone.matrix_local for bone in pose_bones], dtype=np.float64).reshape(-1, 4, 4)
+    rest_relative_inv = rest_relative_inverse(rest, parents)
+
+    cache = {
+        "names": names,
+        "index": index,
+        "parents": parents,
+        "rest_relative_inv": rest_relative_inv,
+    }
+    rest_pose_caches[armature] = cache
+    return cache
+
+def read_pose_matrices(armature):
+    """Read the object-space pose matrices of all bones in one call, as an (N, 4, 4) array."""
+    pose_bones = armature.pose.bones
+    buffer = np.empty(len(pose_bones) * 16, dtype=np.float32)
+    pose_bones.foreach_get("matrix", buffer)
+    # foreach_get returns matrices column by column
+    return buffer.reshape(-1, 4, 4).transpose(0, 2, 1).astype(np.float64)
+
+def solve_visual_rotations(armature, bone_names):
+    """Compute the local rotations that reproduce the current visual pose of the given bones.
+
+    Each bone's object-space pose matrix is taken relative to its parent's and to its rest pose.
+    Returns (indices, quaternions) where indices point into armature.pose.bones."""
+    cache = get_rest_pose_cache(armature)
+    indices = np.array([cache["index"][name] for name in bone_names], dtype=np.int64)
+
+    quats = local_rotations(read_pose_matrices(armature), cache["rest_relative_inv"], cache["parents"], indices)
+    return indices, quats
+
+def apply_visual_rotations(armature, bone_names):
+    """Solve and write back the visual rotations of the named bones with a single foreach_set."""
+    if not bone_names:
+        return
+    indices, quats = solve_visual_rotations(armature, bone_names)
+
+    pose_bones = armature.pose.bones
+    current = np.empty(len(pose_bones) * 4, dtype=np.float32)
+    pose_bones.foreach_get("rotation_quaternion", current)
+    current = current.reshape(-1, 4)
+
+    # Stay in the hemisphere of the current rotation, so keyed arcs don't flip
+    flip = np.sum(current[indices] * quats, axis=-1) < 0.0
+    quats[flip] *= -1.0
+
+    current[indices] = quats
+    pose_bones.foreach_set("rotation_quaternion", current.ravel())
+    armature.update_tag()
+
+def get_keyed_frames(action, bone_names):
+    """Return the sorted unique frames on which any of the given bones has a key."""
+    bone_names = set(bone_names)
+    frames = []
+    for fcurve in action.fcurves:
+        if get_bone_name_from_data_path(fcurve.data_path) in bone_names:
+            points = fcurve.keyframe_points
+            co = np.empty(len(points) * 2, dtype=np.float32)
+            points.foreach_get("co", co)
+            frames.append(co[0::2])
+    if not frames:
+        return np.empty(0, dtype=np.float32)
+    return np.unique(np.concatenate(frames))
+
+def write_fcurve_keys(action, data_path, index, frames, values, group=""):
+    """Write keys into an fcurve in bulk, creating the fcurve if needed.
+
+    Keys already present on the given frames are overwritten, the rest are appended with
+    keyframe_points.add and all coordinates are written with a single foreach_set."""
+    fcurve = action.fcurves.find(data_path, index=index)
+    if fcurve is None:
+        fcurve = action.fcurves.new(data_path, index=index, action_group=group)
+
+    points = fcurve.keyframe_points
+    existing = np.empty(len(points) * 2, dtype=np.float32)
+    points.foreach_get("co", existing)
+    existing = existing.reshape(-1, 2)
+
+    frames = np.asarray(frames, dtype=np.float32)
+    values = np.asarray(values, dtype=np.float32)
+
+    # Keyframe points are kept sorted by frame, match the new keys against existing ones
+    position = np.clip(np.searchsorted(existing[:, 0], frames), 0, max(len(existing) - 1, 0))
+    matched = np.zeros(len(frames), dtype=bool)
+    if len(existing):
+        matched = np.abs(existing[position, 0] - frames) < 1e-4
+        existing[position[matched], 1] = values[matched]
+
+    added = np.stack([frames[~matched], values[~matched]], axis=-1)
+    if len(added):
+        points.add(len(added))
+    points.foreach_set("co", np.concatenate([existing, added]).ravel())
+    fcurve.update()
+    return fcurve
+
+def write_rotation_keys(action, bone_name, frames, quats):
+    """Write (F, 4) rotation_quaternion keys of a bone in bulk."""
+    data_path = f'pose.bones["{bone_name}"].rotation_quaternion'
+    for channel in range(4):
+        write_fcurve_keys(action, data_path, channel, frames, quats[:, channel], group=bone_name)
+
+def sample_pose_matrices(armature, frames):
+    """Evaluate each frame once and return the (F, N, 4, 4) pose matrices of all bones."""
+    scene = bpy.context.scene
+    current_frame = scene.frame_current
+    matrices = np.empty((len(frames), len(armature.pose.bones), 4, 4), dtype=np.float64)
+    try:
+        for i, frame in enumerate(frames):
+            scene.frame_set(int(frame), subframe=float(frame) % 1.0)
+            matrices[i] = read_pose_matrices(armature)
+    finally:
+        scene.frame_set(current_frame)
+    return matrices
+
+def evaluate_basis_matrices(armature, action, bone_name, frames):
+    """Evaluate the location, rotation and scale fcurves of a bone as (F, 4, 4) local matrices.
+
+    Channels without an fcurve keep the bone's current value."""
+    pose_bone = armature.pose.bones[bone_name]
+
+    def evaluate_channel(property_name, size):
+        values = np.empty((len(frames), size), dtype=np.float64)
+        current = getattr(pose_bone, property_name)
+        data_path = f'pose.bones["{bone_name}"].{property_name}'
+        for i in range(size):
+            fcurve = action.fcurves.find(data_path, index=i) if action else None
+            values[:, i] = [fcurve.evaluate(frame) for frame in frames] if fcurve else current[i]
+        return values
+
+    mode = pose_bone.rotation_mode
+    if mode == 'QUATERNION':
+        rotation = quaternions_to_matrices(evaluate_channel("rotation_quaternion", 4))
+    elif mode == 'AXIS_ANGLE':
+        axis_angle = evaluate_channel("rotation_axis_angle", 4)
+        axis = axis_angle[:, 1:] / np.maximum(np.linalg.norm(axis_angle[:, 1:], axis=-1, keepdims=True), 1e-12)
+        rotation = quaternions_to_matrices(rotation_vector_to_quaternion(axis * axis_angle[:, :1]))
     else:
-        boneRefPoseMtx = poseBone.bone.matrix_local
-        bonePoseMtx = poseBone.matrix
-        boneLocMtx = boneRefPoseMtx.inverted() @ bonePoseMtx
-
-    loc, rot, scale = boneLocMtx.decompose()    
-    return rot
+        rotation = euler_to_matrices(evaluate_channel("rotation_euler", 3), mode)
+    return compose_basis_matrices(evaluate_channel("location", 3), rotation, evaluate_channel("scale", 3))
+
+def sample_fk_pose_matrices(armature, bone_names, frames):
+    """Compute the (F, N, 4, 4) pose matrices of the named bones and their parents from the action's fcurves.
+
+    Nothing is evaluated by the depsgraph: the local transforms are read with fcurve.evaluate and chained with the
+    rest pose. Constraints are ignored, so the bones and their parents have to be plain FK bones.
+    Only the named bones and their parents are filled, in pose.bones order."""
+    cache = get_rest_pose_cache(armature)
+    index = cache["index"]
+    parents = cache["parents"]
+    action = armature.animation_data.action if armature.animation_data else None
+
+    indices = [index[name] for name in bone_names]
+    needed = set()
+    for i in indices:
+        while i >= 0 and i not in needed:
+            needed.add(i)
+            i = parents[i]
+
+    basis = np.broadcast_to(np.identity(4), (len(frames), len(cache["names"]), 4, 4)).copy()
+    for i in needed:
+        basis[:, i] = evaluate_basis_matrices(armature, action, cache["names"][i], frames)
+    return forward_kinematics(basis, cache["rest_relative_inv"], parents, indices)
+
+def bake_chain_rotations(armature, bone_names, frames):
+    """Evaluate each frame once and return the (F, B, 4) visual rotations of the named bones."""
+    scene = bpy.context.scene
+    current_frame = scene.frame_current
+    rotations = np.empty((len(frames), len(bone_names), 4), dtype=np.float64)
+    try:
+        for i, frame in enumerate(frames):
+            scene.frame_set(int(frame), subframe=float(frame) % 1.0)
+            rotations[i] = solve_visual_rotations(armature, bone_names)[1]
+    finally:
+        scene.frame_set(current_frame)
+    return rotations